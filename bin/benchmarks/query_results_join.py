@@ -0,0 +1,81 @@
+#!/bin/env python
+"""
+Measures how long the Query Results data source takes to load two cached
+results into SQLite and to join them, with and without indexes on the join
+columns and with and without typed columns. The previous loader (one INSERT
+per row) is timed for comparison.
+
+Usage: python bin/benchmarks/query_results_join.py [rows]
+"""
+from __future__ import print_function
+import functools
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from redash.query_runner.query_results import create_join_indexes, create_table, flatten  # noqa: E402
+
+JOIN_QUERY = ("SELECT a.category, count(*), sum(b.amount) FROM cached_query_1 a "
+              "JOIN cached_query_2 b ON a.id = b.parent_id GROUP BY a.category")
+
+
+def generate_results(rows_count):
+    parents = {
+        'columns': [{'name': 'id', 'type': 'integer'}, {'name': 'category', 'type': 'string'}],
+        'rows': [{'id': i, 'category': 'category {}'.format(i % 50)} for i in range(rows_count)]
+    }
+    children = {
+        'columns': [{'name': 'id', 'type': 'integer'}, {'name': 'parent_id', 'type': 'integer'},
+                    {'name': 'amount', 'type': 'float'}],
+        'rows': [{'id': i, 'parent_id': random.randint(0, rows_count - 1), 'amount': random.random() * 100}
+                 for i in range(rows_count)]
+    }
+    return parents, children
+
+
+def create_table_per_row(connection, table_name, query_results):
+    """The previous loader, for comparison."""
+    columns = [column['name'] for column in query_results['columns']]
+    connection.execute(u"CREATE TABLE {} ({})".format(table_name, ", ".join(columns)))
+    insert_template = u"insert into {} ({}) values ({})".format(table_name, ", ".join(columns),
+                                                                 ','.join(['?'] * len(columns)))
+    for row in query_results['rows']:
+        connection.execute(insert_template, [flatten(row.get(column)) for column in columns])
+
+
+def timed(fn, *args):
+    started_at = time.time()
+    fn(*args)
+    return time.time() - started_at
+
+
+def run(name, load, parents, children, indexes=False):
+    connection = sqlite3.connect(':memory:')
+    load_time = timed(load, connection, 'cached_query_1', parents)
+    load_time += timed(load, connection, 'cached_query_2', children)
+    index_time = timed(create_join_indexes, connection, JOIN_QUERY) if indexes else 0
+    join_time = timed(lambda: connection.execute(JOIN_QUERY).fetchall())
+    connection.close()
+
+    print("{:<28}{:>10.3f}{:>10.3f}{:>10.3f}".format(name, load_time, index_time, join_time))
+
+
+def main():
+    rows_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    parents, children = generate_results(rows_count)
+
+    print("Joining two results of {} rows".format(rows_count))
+    print("{:<28}{:>10}{:>10}{:>10}".format('', 'load (s)', 'index (s)', 'join (s)'))
+    create_typed_table = functools.partial(create_table, typed_columns=True)
+    run("per-row inserts, untyped", create_table_per_row, parents, children)
+    run("executemany, untyped", create_table, parents, children)
+    run("executemany, typed", create_typed_table, parents, children)
+    run("executemany, typed, indexes", create_typed_table, parents, children, True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/bin/env python
+"""
+Compares the storage size and encode/decode time of the query result storage
+codecs (see redash/models/result_codecs.py) on a synthetic result.
+
+Usage: python bin/benchmarks/result_codecs.py [rows] [columns]
+"""
+from __future__ import print_function
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from redash.models import result_codecs  # noqa: E402
+from redash.utils import json_dumps, json_loads  # noqa: E402
+
+
+def generate_result(rows_count, columns_count):
+    kinds = ['integer', 'float', 'string', 'datetime']
+    columns = [{'name': 'column_{}'.format(i), 'friendly_name': 'column_{}'.format(i), 'type': kinds[i % len(kinds)]}
+               for i in range(columns_count)]
+    start = datetime.datetime(2019, 1, 1)
+
+    def value(kind, i):
+        if kind == 'integer':
+            return random.randint(0, 100000)
+        elif kind == 'float':
+            return random.random() * 1000
+        elif kind == 'string':
+            return random.choice(['alpha', 'beta', 'gamma', 'delta']) + str(i % 100)
+        return (start + datetime.timedelta(minutes=i)).isoformat()
+
+    rows = [dict((c['name'], value(c['type'], i)) for c in columns) for i in range(rows_count)]
+    return {'columns': columns, 'rows': rows}
+
+
+def timed(fn, *args):
+    started_at = time.time()
+    result = fn(*args)
+    return result, time.time() - started_at
+
+
+def main():
+    rows_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    columns_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    data = generate_result(rows_count, columns_count)
+
+    print("{} rows x {} columns".format(rows_count, columns_count))
+    print("{:<16}{:>14}{:>12}{:>12}".format('codec', 'size (bytes)', 'encode (s)', 'decode (s)'))
+
+    payload, encode_time = timed(json_dumps, data)
+    _, decode_time = timed(json_loads, payload)
+    print("{:<16}{:>14}{:>12.3f}{:>12.3f}".format(result_codecs.CODEC_JSON, len(payload), encode_time, decode_time))
+
+    for name, codec in sorted(result_codecs.codecs.items()):
+        payload, encode_time = timed(codec.encode, data)
+        _, decode_time = timed(codec.decode, payload)
+        print("{:<16}{:>14}{:>12.3f}{:>12.3f}".format(name, len(payload), encode_time, decode_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/bin/env python
+"""
+Compares the time it takes to find the outdated (due) scheduled queries by
+scanning every scheduled query (the previous implementation) and by using the
+indexed queries.next_run_at column (Query.outdated_queries).
+
+It creates an organization with synthetic scheduled queries in the database
+configured with REDASH_DATABASE_URL, inside a transaction that is rolled back
+at the end. Use a scratch database anyway.
+
+Usage: python bin/benchmarks/scheduler.py [queries] [due ratio]
+"""
+from __future__ import print_function
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from sqlalchemy.orm import joinedload  # noqa: E402
+
+from redash import create_app, models  # noqa: E402
+from redash.utils import gen_query_hash, utcnow  # noqa: E402
+from redash.utils.configuration import ConfigurationContainer  # noqa: E402
+
+INTERVALS = [60, 300, 600, 3600, 86400]
+
+
+def create_queries(count, due_ratio):
+    now = utcnow()
+    org = models.Organization(name="Scheduler benchmark", slug="scheduler-benchmark", settings={})
+    user = models.User(org=org, name="Benchmark", email="scheduler-benchmark@example.com", group_ids=[])
+    data_source = models.DataSource(org=org, name="Benchmark", type="pg",
+                                    options=ConfigurationContainer.from_json('{"dbname": "benchmark"}'))
+    models.db.session.add_all([org, user, data_source])
+    models.db.session.flush()
+
+    query_results = models.QueryResult.__table__
+    queries = models.Query.__table__
+    result_rows = []
+    query_rows = []
+
+    for i in range(count):
+        interval = random.choice(INTERVALS)
+        due = random.random() < due_ratio
+        age = interval + 60 if due else random.randint(0, interval - 30)
+        retrieved_at = now - datetime.timedelta(seconds=age)
+        query_text = "SELECT {}".format(i)
+        query_hash = gen_query_hash(query_text)
+
+        result_rows.append({'org_id': org.id, 'data_source_id': data_source.id, 'query_hash': query_hash,
+                            'query': query_text, 'data': '{"columns": [], "rows": []}', 'runtime': 1,
+                            'retrieved_at': retrieved_at})
+        query_rows.append({'org_id': org.id, 'data_source_id': data_source.id, 'user_id': user.id, 'version': 1,
+                           'name': "Query {}".format(i), 'query': query_text, 'query_hash': query_hash,
+                           'api_key': "{:040d}".format(i), 'is_archived': False, 'is_draft': False,
+                           'options': {}, 'schedule_failures': 0,
+                           'schedule': {'interval': interval, 'time': None, 'day_of_week': None, 'until': None},
+                           'next_run_at': retrieved_at + datetime.timedelta(seconds=interval),
+                           'created_at': now, 'updated_at': now})
+
+    models.db.session.execute(query_results.insert(), result_rows)
+    result_ids = dict(models.db.session.query(models.QueryResult.query_hash, models.QueryResult.id)
+                      .filter(models.QueryResult.org_id == org.id))
+    for row in query_rows:
+        row['latest_query_data_id'] = result_ids[row['query_hash']]
+    models.db.session.execute(queries.insert(), query_rows)
+
+    return org.id
+
+
+def full_scan(org_id):
+    """The previous implementation: check the schedule of every scheduled query."""
+    now = utcnow()
+    queries = (
+        models.Query.query
+        .options(joinedload(models.Query.latest_query_data).load_only('retrieved_at'))
+        .filter(models.Query.schedule.isnot(None), models.Query.org_id == org_id)
+        .order_by(models.Query.id)
+    )
+
+    outdated = []
+    for query in queries:
+        retrieved_at = query.latest_query_data.retrieved_at if query.latest_query_data else now
+        if models.should_schedule_next(retrieved_at, now, query.schedule['interval'], query.schedule['time'],
+                                       query.schedule['day_of_week'], query.schedule_failures):
+            outdated.append(query)
+
+    return outdated
+
+
+def timed(fn, *args):
+    models.db.session.expunge_all()
+    started_at = time.time()
+    result = fn(*args)
+    return result, time.time() - started_at
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    due_ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+
+    app = create_app()
+    with app.app_context():
+        try:
+            org_id = create_queries(count, due_ratio)
+
+            outdated, scan_time = timed(full_scan, org_id)
+            print("full scan:       {:>8} due queries in {:.3f}s".format(len(outdated), scan_time))
+
+            outdated, indexed_time = timed(models.Query.outdated_queries)
+            outdated = [q for q in outdated if q.org_id == org_id]
+            print("next_run_at:     {:>8} due queries in {:.3f}s".format(len(outdated), indexed_time))
+        finally:
+            models.db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
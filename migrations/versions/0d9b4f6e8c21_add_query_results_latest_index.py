@@ -0,0 +1,25 @@
+"""Add (data_source_id, query_hash, retrieved_at DESC) index to query_results.
+
+Revision ID: 0d9b4f6e8c21
+Revises: 287aa4b214a2
+Create Date: 2026-10-18 14:22:37.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0d9b4f6e8c21'
+down_revision = '287aa4b214a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('query_results_data_source_id_query_hash_retrieved_at', 'query_results',
+                    ['data_source_id', 'query_hash', sa.text('retrieved_at DESC')], unique=False)
+
+
+def downgrade():
+    op.drop_index('query_results_data_source_id_query_hash_retrieved_at', table_name='query_results')
@@ -0,0 +1,23 @@
+"""Add (query_hash, data_source_id) index to queries.
+
+Revision ID: 287aa4b214a2
+Revises: 36c74cd14470
+Create Date: 2026-10-18 13:41:05.160427
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '287aa4b214a2'
+down_revision = '36c74cd14470'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('queries_query_hash_data_source_id', 'queries', ['query_hash', 'data_source_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('queries_query_hash_data_source_id', table_name='queries')
@@ -0,0 +1,25 @@
+"""Add data_size to query_results.
+
+Revision ID: 3390d8ce5b4f
+Revises: d3f5a9b2c1e7
+Create Date: 2026-10-18 19:41:07.552183
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3390d8ce5b4f'
+down_revision = 'd3f5a9b2c1e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing results have no size: the size of their inline payload is used instead.
+    op.add_column('query_results', sa.Column('data_size', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('query_results', 'data_size')
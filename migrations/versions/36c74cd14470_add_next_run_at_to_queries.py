@@ -0,0 +1,28 @@
+"""Add next_run_at to queries.
+
+Revision ID: 36c74cd14470
+Revises: 4cfec525ec33
+Create Date: 2026-10-18 11:02:17.529463
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '36c74cd14470'
+down_revision = '4cfec525ec33'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('queries', sa.Column('next_run_at', sa.DateTime(True), nullable=True))
+    op.create_index(op.f('ix_queries_next_run_at'), 'queries', ['next_run_at'], unique=False)
+    # Have the scheduler check every scheduled query once; it then stores their actual next run time.
+    op.execute("UPDATE queries SET next_run_at = now() WHERE schedule IS NOT NULL")
+
+
+def downgrade():
+    op.drop_index(op.f('ix_queries_next_run_at'), table_name='queries')
+    op.drop_column('queries', 'next_run_at')
@@ -0,0 +1,52 @@
+"""Add storage codec columns to query results.
+
+Revision ID: 4cfec525ec33
+Revises: e5c7a4e2df4d
+Create Date: 2026-10-18 10:12:41.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import table
+
+from redash.models import result_codecs
+from redash.utils import json_dumps
+
+
+# revision identifiers, used by Alembic.
+revision = '4cfec525ec33'
+down_revision = 'e5c7a4e2df4d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows keep their JSON payload in `data` (data_codec is NULL). Use
+    # `manage.py database reencode_query_results` to convert them.
+    op.add_column('query_results', sa.Column('data_codec', sa.String(length=32), nullable=True))
+    op.add_column('query_results', sa.Column('encoded_data', sa.LargeBinary(), nullable=True))
+    op.alter_column('query_results', 'data', existing_type=sa.Text(), nullable=True)
+
+
+def downgrade():
+    # Decode the results stored with the other codecs back into `data`, one at a time (payloads can be large).
+    query_results = table(
+        'query_results',
+        sa.Column('id', sa.Integer),
+        sa.Column('data', sa.Text),
+        sa.Column('data_codec', sa.String(length=32)),
+        sa.Column('encoded_data', sa.LargeBinary))
+
+    conn = op.get_bind()
+    ids = [row.id for row in conn.execute(sa.select([query_results.c.id]).where(query_results.c.data.is_(None)))]
+    for result_id in ids:
+        row = conn.execute(sa.select([query_results.c.data_codec, query_results.c.encoded_data])
+                           .where(query_results.c.id == result_id)).first()
+        data = result_codecs.get_codec(row.data_codec).decode(row.encoded_data)
+        conn.execute(query_results.update()
+                     .where(query_results.c.id == result_id)
+                     .values(data=json_dumps(data), data_codec=None, encoded_data=None))
+
+    op.alter_column('query_results', 'data', existing_type=sa.Text(), nullable=False)
+    op.drop_column('query_results', 'encoded_data')
+    op.drop_column('query_results', 'data_codec')
@@ -0,0 +1,27 @@
+"""Add data_hash and reuse_count to query_results.
+
+Revision ID: 9c7e1a4d5b38
+Revises: 0d9b4f6e8c21
+Create Date: 2026-10-18 15:03:12.840917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c7e1a4d5b38'
+down_revision = '0d9b4f6e8c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing results have no hash, so they're never reused: only results stored from now on are.
+    op.add_column('query_results', sa.Column('data_hash', sa.String(length=32), nullable=True))
+    op.add_column('query_results', sa.Column('reuse_count', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('query_results', 'reuse_count')
+    op.drop_column('query_results', 'data_hash')
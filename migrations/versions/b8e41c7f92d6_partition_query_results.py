@@ -0,0 +1,30 @@
+"""Partition query_results by retrieved_at (when REDASH_QUERY_RESULTS_PARTITIONING is set).
+
+Revision ID: b8e41c7f92d6
+Revises: 9c7e1a4d5b38
+Create Date: 2026-10-18 16:11:48.207351
+
+"""
+from alembic import op
+
+from redash import settings
+from redash.models import partitions
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e41c7f92d6'
+down_revision = '9c7e1a4d5b38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Partitioning is optional: installations can also partition the table later, with
+    # `manage.py database partition_query_results`.
+    if settings.QUERY_RESULTS_PARTITIONING and not partitions.is_partitioned(op.get_bind()):
+        partitions.partition_table(op.get_bind())
+
+
+def downgrade():
+    if partitions.is_partitioned(op.get_bind()):
+        partitions.unpartition_table(op.get_bind())
@@ -0,0 +1,57 @@
+"""Add payload_store and payload_key to query_results.
+
+Revision ID: d3f5a9b2c1e7
+Revises: b8e41c7f92d6
+Create Date: 2026-10-18 17:02:26.413095
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.sql import table
+
+from redash.models import result_codecs, result_stores
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f5a9b2c1e7'
+down_revision = 'b8e41c7f92d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('query_results', sa.Column('payload_store', sa.String(length=32), nullable=True))
+    op.add_column('query_results', sa.Column('payload_key', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    # Results with an external payload can't be read anymore without these columns: bring their payloads back into
+    # the table, one at a time (payloads can be large).
+    query_results = table(
+        'query_results',
+        sa.Column('id', sa.Integer),
+        sa.Column('data', sa.Text),
+        sa.Column('data_codec', sa.String(length=32)),
+        sa.Column('encoded_data', sa.LargeBinary),
+        sa.Column('payload_store', sa.String(length=32)),
+        sa.Column('payload_key', sa.String(length=255)))
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.select([query_results.c.id, query_results.c.data_codec, query_results.c.payload_store,
+                                   query_results.c.payload_key])
+                        .where(query_results.c.payload_key.isnot(None))).fetchall()
+    for row in rows:
+        payload = result_stores.get_store(row.payload_store).read(row)
+        if row.data_codec in (None, result_codecs.CODEC_JSON):
+            values = {'data': payload.decode('utf-8')}
+        else:
+            values = {'encoded_data': payload}
+        conn.execute(query_results.update().where(query_results.c.id == row.id).values(**values))
+
+    # The external copies are only deleted once the payloads are committed back into the table.
+    payloads = [(row.payload_store, row.payload_key) for row in rows]
+    event.listen(conn, 'commit', lambda connection: result_stores.delete_payloads(payloads))
+
+    op.drop_column('query_results', 'payload_key')
+    op.drop_column('query_results', 'payload_store')
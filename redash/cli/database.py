@@ -1,9 +1,13 @@
+from __future__ import print_function
 import time
+from sys import exit
 
+import click
 from flask.cli import AppGroup
 from flask_migrate import stamp
 import sqlalchemy
 from sqlalchemy.exc import DatabaseError
+from sqlalchemy.orm import undefer_group
 
 manager = AppGroup(help="Manage the database (create/drop tables).")
 
@@ -41,3 +45,79 @@ def drop_tables():
 
     _wait_for_db_connection(db)
     db.drop_all()
+
+
+@manager.command()
+@click.argument('codec')
+@click.option('--batch-size', default=100, help="Number of query results to convert per transaction (default: 100).")
+def reencode_query_results(codec, batch_size=100):
+    """Convert stored query results to the CODEC storage format (json, columnar_zlib or columnar_lz4)."""
+    from redash.models import db, QueryResult, result_codecs, result_stores
+
+    if codec != result_codecs.CODEC_JSON and codec not in result_codecs.codecs:
+        print("Error: unknown or unavailable codec: {}.".format(codec))
+        exit(1)
+
+    if codec == result_codecs.CODEC_JSON:
+        pending = QueryResult.data_codec.isnot(None) & (QueryResult.data_codec != codec)
+    else:
+        pending = QueryResult.data_codec.is_(None) | (QueryResult.data_codec != codec)
+
+    last_id = 0
+    converted = 0
+    while True:
+        query_results = (QueryResult.query
+                         .filter(pending, QueryResult.id > last_id)
+                         .options(undefer_group('payload'))
+                         .order_by(QueryResult.id)
+                         .limit(batch_size)
+                         .all())
+
+        if not query_results:
+            break
+
+        previous_payloads = []
+        for query_result in query_results:
+            previous_payloads.append((query_result.payload_store, query_result.payload_key))
+            query_result.set_data(query_result.decoded_data, codec)
+            query_result.offload_payload()
+            last_id = query_result.id
+
+        db.session.commit()
+        result_stores.delete_payloads(previous_payloads)
+        converted += len(query_results)
+        print("Converted {} query results (last id: {}).".format(converted, last_id))
+
+    print("Done. Converted {} query results to {}.".format(converted, codec))
+
+
+@manager.command()
+@click.option('--days', default=None, type=int,
+              help="Length of each partition, in days (default: REDASH_QUERY_RESULTS_PARTITION_DAYS).")
+def partition_query_results(days=None):
+    """Partition the query_results table by retrieved_at (requires PostgreSQL 11 or newer)."""
+    from redash.models import db, partitions
+
+    try:
+        partitions.partition_table(days=days)
+    except partitions.PartitioningError as e:
+        print("Error: {}".format(e))
+        exit(1)
+
+    db.session.commit()
+    print("Done. Partitions: {}.".format(", ".join(p.name for p in partitions.list_partitions())))
+
+
+@manager.command()
+def unpartition_query_results():
+    """Convert a partitioned query_results table back to a regular table."""
+    from redash.models import db, partitions
+
+    try:
+        partitions.unpartition_table()
+    except partitions.PartitioningError as e:
+        print("Error: {}".format(e))
+        exit(1)
+
+    db.session.commit()
+    print("Done.")
@@ -9,6 +9,7 @@ from redash.handlers.base import org_scoped_rule
 from redash.handlers.dashboards import (DashboardFavoriteListResource,
                                         DashboardListResource,
                                         DashboardResource,
+                                        DashboardResultsResource,
                                         DashboardShareResource,
                                         DashboardTagsResource,
                                         PublicDashboardResource)
@@ -81,6 +82,7 @@ api.add_org_resource(AlertListResource, '/api/alerts', endpoint='alerts')
 
 api.add_org_resource(DashboardListResource, '/api/dashboards', endpoint='dashboards')
 api.add_org_resource(DashboardResource, '/api/dashboards/<dashboard_slug>', endpoint='dashboard')
+api.add_org_resource(DashboardResultsResource, '/api/dashboards/<dashboard_slug>/results', endpoint='dashboard_results')
 api.add_org_resource(PublicDashboardResource, '/api/dashboards/public/<token>', endpoint='public_dashboard')
 api.add_org_resource(DashboardShareResource, '/api/dashboards/<dashboard_id>/share', endpoint='dashboard_share')
 
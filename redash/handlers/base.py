@@ -1,3 +1,4 @@
+import hashlib
 import time
 
 from inspect import isclass
@@ -77,6 +78,11 @@ def require_fields(req, fields):
             abort(400)
 
 
+def make_etag(*parts):
+    """Return a strong ETag for a response whose content is fully determined by `parts`."""
+    return hashlib.md5(json_dumps(parts)).hexdigest()
+
+
 def get_object_or_404(fn, *args, **kwargs):
     try:
         rv = fn(*args, **kwargs)
@@ -1,16 +1,18 @@
-from flask import request, url_for
+from flask import Response, make_response, request, stream_with_context, url_for
 from funcy import project, partial
+from werkzeug.http import quote_etag
 
 from flask_restful import abort
 from redash import models, serializers
-from redash.handlers.base import (BaseResource, get_object_or_404, paginate,
+from redash.handlers.base import (BaseResource, get_object_or_404, make_etag, paginate,
                                   filter_by_tags,
                                   order_results as _order_results)
 from redash.permissions import (can_modify, require_admin_or_owner,
                                 require_object_modify_permission,
                                 require_permission)
 from redash.security import csp_allows_embeding
-from redash.serializers import serialize_dashboard
+from redash.serializers import query_access_checker, serialize_dashboard
+from redash.utils import json_dumps
 from sqlalchemy.orm.exc import StaleDataError
 
 
@@ -29,6 +31,24 @@ order_results = partial(
 )
 
 
+def get_dashboard_etag(dashboard, api_key, user):
+    # The serialized dashboard depends on the dashboard (its version changes
+    # with every update), its owner, its widgets and their queries' latest
+    # results, and on the user viewing it (permissions, the groups with access
+    # to the widgets' data sources, which decide the restricted widgets, and
+    # favorite state). The owner's activity time isn't part of it: it changes
+    # all the time and nobody relies on it being fresh in a dashboard.
+    widgets_state = dashboard.widgets_state()
+    data_source_groups = models.DataSourceGroup.groups_by_data_source(
+        set(state.data_source_id for state in widgets_state if state.data_source_id is not None))
+    return make_etag(
+        dashboard.id, dashboard.version, dashboard.updated_at, dashboard.user.updated_at, widgets_state,
+        sorted((data_source_id, sorted(groups.items())) for data_source_id, groups in data_source_groups.items()),
+        api_key.api_key if api_key else None,
+        user.id, user.group_ids, user.permissions, models.Favorite.is_favorite(user.id, dashboard),
+    )
+
+
 class DashboardListResource(BaseResource):
     @require_permission('list_dashboards')
     def get(self):
@@ -147,14 +167,7 @@ class DashboardResource(BaseResource):
         :>json string widget.updated_at: ISO format timestamp for last widget modification
         """
         dashboard = get_object_or_404(models.Dashboard.get_by_slug_and_org, dashboard_slug, self.current_org)
-        response = serialize_dashboard(dashboard, with_widgets=True, user=self.current_user)
-
         api_key = models.ApiKey.get_by_object(dashboard)
-        if api_key:
-            response['public_url'] = url_for('redash.public_dashboard', token=api_key.api_key, org_slug=self.current_org.slug, _external=True)
-            response['api_key'] = api_key.api_key
-
-        response['can_edit'] = can_modify(dashboard, self.current_user)
 
         self.record_event({
             'action': 'view',
@@ -162,7 +175,21 @@ class DashboardResource(BaseResource):
             'object_type': 'dashboard',
         })
 
-        return response
+        etag = get_dashboard_etag(dashboard, api_key, self.current_user)
+        if etag in request.if_none_match:
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+
+        response = serialize_dashboard(dashboard, with_widgets=True, user=self.current_user)
+
+        if api_key:
+            response['public_url'] = url_for('redash.public_dashboard', token=api_key.api_key, org_slug=self.current_org.slug, _external=True)
+            response['api_key'] = api_key.api_key
+
+        response['can_edit'] = can_modify(dashboard, self.current_user)
+
+        return response, 200, {'ETag': quote_etag(etag)}
 
     @require_permission('edit_dashboard')
     def post(self, dashboard_slug):
@@ -235,6 +262,49 @@ class DashboardResource(BaseResource):
         return d
 
 
+class DashboardResultsResource(BaseResource):
+    @require_permission('view_query')
+    def get(self, dashboard_slug):
+        """
+        Retrieves the latest results of the queries of all the widgets of a dashboard.
+
+        :qparam string slug: Slug of the dashboard.
+
+        :>json object query_results: Query results (as returned by the query results API) by query ID. Queries
+                                     without a result or whose data source the user can't access are left out.
+
+        The results' metadata is loaded with a single query and permissions are checked once per data source (or
+        against the dashboard API key). The response is streamed, loading and decoding one result at a time.
+        """
+        dashboard = get_object_or_404(models.Dashboard.get_by_slug_and_org, dashboard_slug, self.current_org)
+        query_results = dashboard.latest_query_results()
+
+        can_view = query_access_checker([query for query, _ in query_results], self.current_user)
+        query_results = [(query.id, query_result) for query, query_result in query_results if can_view(query)]
+
+        return Response(stream_with_context(generate_query_results_json(query_results)),
+                        mimetype='application/json')
+
+
+def generate_query_results_json(query_results):
+    yield '{"query_results": {'
+
+    previous_query_id = None
+    for query_id, query_result in query_results:
+        # A query can be used by several widgets.
+        if query_id == previous_query_id:
+            continue
+
+        if previous_query_id is not None:
+            yield ', '
+        yield '"{}": {}'.format(query_id, json_dumps(query_result.to_dict()))
+        previous_query_id = query_id
+        # Only keep one payload in memory at a time.
+        models.db.session.expire(query_result, ['data', 'encoded_data'])
+
+    yield '}}'
+
+
 class PublicDashboardResource(BaseResource):
     decorators = BaseResource.decorators + [csp_allows_embeding]
 
@@ -1,18 +1,19 @@
 import logging
 import time
 
-from flask import make_response, request
+from flask import Response, make_response, request, stream_with_context
 from flask_login import current_user
 from flask_restful import abort
 from redash import models, settings
-from redash.handlers.base import BaseResource, get_object_or_404
+from redash.handlers.base import BaseResource, get_object_or_404, make_etag
 from redash.permissions import (has_access, not_view_only, require_access,
                                 require_permission, view_only)
 from redash.tasks import QueryTask
 from redash.tasks.queries import enqueue_query
 from redash.utils import (collect_parameters_from_request, gen_query_hash, json_dumps, utcnow, to_filename)
 from redash.models.parameterized_query import ParameterizedQuery, InvalidParameterError, dropdown_values
-from redash.serializers import serialize_query_result, serialize_query_result_to_csv, serialize_query_result_to_xlsx
+from redash.serializers import (serialize_query_result, stream_query_result_to_csv, stream_query_result_to_json,
+                                stream_query_result_to_xlsx)
 
 
 def error_response(message, http_status=400):
@@ -68,6 +69,39 @@ def get_download_filename(query_result, query, filetype):
     return u"{}_{}.{}".format(filename, retrieved_at, filetype)
 
 
+def get_query_result_etag(query_result, filetype, filename, org):
+    # Results' data never changes (a result is only refreshed when a query
+    # returns the same data again): an export only depends on the result, its
+    # format and file name (which follows the query's name) and how it's sliced
+    # (JSON) or the date format settings (CSV).
+    parts = [query_result.id, query_result.retrieved_at, query_result.runtime, filetype, filename]
+    if filetype == 'json':
+        parts.append(get_slice_params(request.args))
+    elif filetype == 'csv':
+        parts.extend([org.get_setting('date_format'), org.get_setting('time_format')])
+
+    return make_etag(*parts)
+
+
+def get_slice_params(args):
+    """Return the `offset`, `limit` and `columns` (comma separated names) of the result slice requested."""
+    try:
+        offset = int(args.get('offset', 0))
+        limit = args.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        abort(400, message='offset and limit must be integers.')
+
+    if offset < 0 or (limit is not None and limit < 0):
+        abort(400, message='offset and limit must not be negative.')
+
+    columns = args.get('columns')
+    if columns is not None:
+        columns = [name for name in columns.split(',') if name]
+
+    return offset, limit, columns
+
+
 class QueryResultListResource(BaseResource):
     @require_permission('execute_query')
     def post(self):
@@ -206,11 +240,15 @@ class QueryResultResource(BaseResource):
         :param number query_id: The ID of the query whose results should be fetched
         :param number query_result_id: the ID of the query result to fetch
         :param string filetype: Format to return. One of 'json', 'xlsx', or 'csv'. Defaults to 'json'.
+        :qparam number offset: (json only) Index of the first row to return
+        :qparam number limit: (json only) Maximum number of rows to return
+        :qparam string columns: (json only) Comma separated names of the columns to return
 
         :<json number id: Query result ID
         :<json string query: Query that produced this result
         :<json string query_hash: Hash code for query text
-        :<json object data: Query output
+        :<json object data: Query output (when a slice is requested, `data.metadata.total_row_count` is the number
+                            of rows of the whole result)
         :<json number data_source_id: ID of data source that produced this result
         :<json number runtime: Length of execution time in seconds
         :<json string retrieved_at: Query retrieval date/time, in ISO format
@@ -228,7 +266,8 @@ class QueryResultResource(BaseResource):
         query = None
 
         if query_result_id:
-            query_result = get_object_or_404(models.QueryResult.get_by_id_and_org, query_result_id, self.current_org)
+            query_result = get_object_or_404(models.QueryResult.get_by_id_and_org, query_result_id, self.current_org,
+                                             load_data=False)
 
         if query_id is not None:
             query = get_object_or_404(models.Query.get_by_id_and_org, query_id, self.current_org)
@@ -236,7 +275,8 @@ class QueryResultResource(BaseResource):
             if query_result is None and query is not None and query.latest_query_data_id is not None:
                 query_result = get_object_or_404(models.QueryResult.get_by_id_and_org,
                                                  query.latest_query_data_id,
-                                                 self.current_org)
+                                                 self.current_org,
+                                                 load_data=False)
 
             if query is not None and query_result is not None and self.current_user.is_api_user():
                 if query.query_hash != query_result.query_hash:
@@ -265,21 +305,27 @@ class QueryResultResource(BaseResource):
 
                 self.record_event(event)
 
-            if filetype == 'json':
+            filename = get_download_filename(query_result, query, filetype)
+
+            # Answered before the result payload is loaded (it is deferred above).
+            etag = get_query_result_etag(query_result, filetype, filename, self.current_org)
+            if etag in request.if_none_match:
+                response = make_response('', 304)
+            elif filetype == 'json':
                 response = self.make_json_response(query_result)
             elif filetype == 'xlsx':
                 response = self.make_excel_response(query_result)
             else:
                 response = self.make_csv_response(query_result)
 
+            response.set_etag(etag)
+
             if len(settings.ACCESS_CONTROL_ALLOW_ORIGIN) > 0:
                 self.add_cors_headers(response.headers)
 
             if should_cache:
                 response.headers.add_header('Cache-Control', 'private,max-age=%d' % ONE_YEAR)
 
-            filename = get_download_filename(query_result, query, filetype)
-
             response.headers.add_header(
                 "Content-Disposition",
                 'attachment; filename="{}"'.format(filename.encode("utf-8"))
@@ -291,19 +337,24 @@ class QueryResultResource(BaseResource):
             abort(404, message='No cached result found for this query.')
 
     def make_json_response(self, query_result):
-        data = json_dumps({'query_result': query_result.to_dict()})
+        offset, limit, columns = get_slice_params(request.args)
         headers = {'Content-Type': "application/json"}
+        if query_result.payload_store is not None and not (offset or limit is not None or columns is not None):
+            # Stream large results from their external store instead of loading them first.
+            return Response(stream_with_context(stream_query_result_to_json(query_result)), 200, headers)
+
+        data = json_dumps({'query_result': query_result.to_dict(offset, limit, columns)})
         return make_response(data, 200, headers)
 
     @staticmethod
     def make_csv_response(query_result):
         headers = {'Content-Type': "text/csv; charset=UTF-8"}
-        return make_response(serialize_query_result_to_csv(query_result), 200, headers)
+        return Response(stream_with_context(stream_query_result_to_csv(query_result)), 200, headers)
 
     @staticmethod
     def make_excel_response(query_result):
         headers = {'Content-Type': "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
-        return make_response(serialize_query_result_to_xlsx(query_result), 200, headers)
+        return Response(stream_with_context(stream_query_result_to_xlsx(query_result)), 200, headers)
 
 
 class JobResource(BaseResource):
@@ -24,6 +24,15 @@ def _table_name_from_select_element(elt):
     return t.name
 
 
+def record_loaded_bytes(table_name, size):
+    """Account for `size` bytes of (large) column values loaded from `table_name`."""
+    statsd_client.incr('db.{}.loaded_bytes'.format(table_name), size)
+
+    if has_request_context():
+        loaded_bytes = g.setdefault('loaded_bytes', {})
+        loaded_bytes[table_name] = loaded_bytes.get(table_name, 0) + size
+
+
 @listens_for(Engine, "before_execute")
 def before_execute(conn, elt, multiparams, params):
     conn.info.setdefault('query_start_time', []).append(time.time())
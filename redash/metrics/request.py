@@ -20,9 +20,10 @@ def calculate_metrics(response):
     request_duration = (time.time() - g.start_time) * 1000
     queries_duration = g.get('queries_duration', 0.0)
     queries_count = g.get('queries_count', 0.0)
+    query_results_bytes = g.get('loaded_bytes', {}).get('query_results', 0)
     endpoint = (request.endpoint or 'unknown').replace('.', '_')
 
-    metrics_logger.info("method=%s path=%s endpoint=%s status=%d content_type=%s content_length=%d duration=%.2f query_count=%d query_duration=%.2f",
+    metrics_logger.info("method=%s path=%s endpoint=%s status=%d content_type=%s content_length=%d duration=%.2f query_count=%d query_duration=%.2f query_results_bytes=%d",
                         request.method,
                         request.path,
                         endpoint,
@@ -31,7 +32,8 @@ def calculate_metrics(response):
                         response.content_length or -1,
                         request_duration,
                         queries_count,
-                        queries_duration)
+                        queries_duration,
+                        query_results_bytes)
 
     statsd_client.timing('requests.{}.{}'.format(endpoint, request.method.lower()), request_duration)
 
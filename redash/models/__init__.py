@@ -1,15 +1,18 @@
 import datetime
 import calendar
+import hashlib
 import logging
 import time
 import pytz
 
-from six import python_2_unicode_compatible, text_type
-from sqlalchemy import distinct, or_, and_, UniqueConstraint
+from six import python_2_unicode_compatible, string_types, text_type
+from sqlalchemy import bindparam, case, distinct, or_, and_, UniqueConstraint
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.event import listens_for
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import backref, contains_eager, joinedload, subqueryload, load_only
+from sqlalchemy.orm import (backref, contains_eager, deferred, joinedload, subqueryload, load_only,
+                            object_session, undefer_group)
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.orm.exc import NoResultFound  # noqa: F401
 from sqlalchemy import func
 from sqlalchemy_utils import generic_relationship
@@ -20,12 +23,13 @@ from sqlalchemy_utils.types.encrypted.encrypted_type import FernetEngine
 from redash import redis_connection, utils, settings
 from redash.destinations import (get_configuration_schema_for_destination_type,
                                  get_destination)
-from redash.metrics import database  # noqa: F401
+from redash.metrics import database as database_metrics
 from redash.query_runner import (get_configuration_schema_for_query_runner_type,
                                  get_query_runner, TYPE_BOOLEAN, TYPE_DATE, TYPE_DATETIME)
 from redash.utils import generate_token, json_dumps, json_loads, mustache_render
 from redash.utils.configuration import ConfigurationContainer
 from redash.models.parameterized_query import ParameterizedQuery
+from redash.models import partitions, permissions_cache, result_codecs, result_stores
 
 from .base import db, gfk_type, Column, GFKBase, SearchBaseQuery
 from .changes import ChangeTrackingMixin, Change  # noqa
@@ -137,9 +141,15 @@ class DataSource(BelongsToOrgMixin, db.Model):
 
     def delete(self):
         Query.query.filter(Query.data_source == self).update(dict(data_source_id=None, latest_query_data_id=None))
+        external_payloads = (
+            db.session.query(QueryResult.payload_store, QueryResult.payload_key)
+            .filter(QueryResult.data_source == self, QueryResult.payload_key.isnot(None))
+            .all()
+        )
         QueryResult.query.filter(QueryResult.data_source == self).delete()
         res = db.session.delete(self)
         db.session.commit()
+        result_stores.delete_payloads(external_payloads)
 
         redis_connection.delete(self._schema_key)
 
@@ -185,6 +195,7 @@ class DataSource(BelongsToOrgMixin, db.Model):
     def add_group(self, group, view_only=False):
         dsg = DataSourceGroup(group=group, data_source=self, view_only=view_only)
         db.session.add(dsg)
+        permissions_cache.invalidate(db.session)
         return dsg
 
     def remove_group(self, group):
@@ -193,6 +204,7 @@ class DataSource(BelongsToOrgMixin, db.Model):
             DataSourceGroup.data_source == self
         ).delete()
         db.session.commit()
+        permissions_cache.invalidate()
 
     def update_group_permission(self, group, view_only):
         dsg = DataSourceGroup.query.filter(
@@ -200,6 +212,7 @@ class DataSource(BelongsToOrgMixin, db.Model):
             DataSourceGroup.data_source == self).one()
         dsg.view_only = view_only
         db.session.add(dsg)
+        permissions_cache.invalidate(db.session)
         return dsg
 
     @property
@@ -213,10 +226,13 @@ class DataSource(BelongsToOrgMixin, db.Model):
     # XXX examine call sites to see if a regular SQLA collection would work better
     @property
     def groups(self):
-        groups = DataSourceGroup.query.filter(
-            DataSourceGroup.data_source == self
-        )
-        return dict(map(lambda g: (g.group_id, g.view_only), groups))
+        if self.id is None:
+            groups = DataSourceGroup.query.filter(
+                DataSourceGroup.data_source == self
+            )
+            return dict(map(lambda g: (g.group_id, g.view_only), groups))
+
+        return DataSourceGroup.groups_by_data_source([self.id])[self.id]
 
 
 @generic_repr('id', 'data_source_id', 'group_id', 'view_only')
@@ -231,6 +247,26 @@ class DataSourceGroup(db.Model):
 
     __tablename__ = "data_source_groups"
 
+    @classmethod
+    def groups_by_data_source(cls, data_source_ids):
+        """Return the `groups` of each of the given data sources (by id). The ones missing from the permissions cache
+        are loaded with a single query."""
+        def load(ids):
+            groups = dict((data_source_id, []) for data_source_id in ids)
+            rows = db.session.query(cls.data_source_id, cls.group_id, cls.view_only).filter(
+                cls.data_source_id.in_(ids))
+            for data_source_id, group_id, view_only in rows:
+                groups[data_source_id].append((group_id, view_only))
+            return groups
+
+        groups = permissions_cache.get_many('data_source_groups', data_source_ids, load)
+        return dict((data_source_id, dict(items)) for data_source_id, items in groups.iteritems())
+
+
+# Set in the info of sessions with new results whose payloads were written to an external store, as (store name, key)
+# pairs, until they're committed.
+_PENDING_PAYLOADS_KEY = 'pending_result_payloads'
+
 
 @python_2_unicode_compatible
 @generic_repr('id', 'org_id', 'data_source_id', 'query_hash', 'runtime', 'retrieved_at')
@@ -242,30 +278,130 @@ class QueryResult(db.Model, BelongsToOrgMixin):
     data_source = db.relationship(DataSource, backref=backref('query_results'))
     query_hash = Column(db.String(32), index=True)
     query_text = Column('query', db.Text)
-    data = Column(db.Text)
+    # Results stored with the (legacy) JSON codec keep their payload in `data`, other codecs use `encoded_data`.
+    # The payload is only loaded when accessed (or when the `payload` group is undeferred), as most code only needs
+    # the result's metadata.
+    data = deferred(Column(db.Text, nullable=True), group='payload')
+    data_codec = Column(db.String(32), nullable=True)
+    encoded_data = deferred(Column(db.LargeBinary, nullable=True), group='payload')
+    # Large payloads may be kept in an external store instead (see result_stores), under this key.
+    payload_store = Column(db.String(32), nullable=True)
+    payload_key = Column(db.String(255), nullable=True)
+    # MD5 of the stored payload, to recognize results with the same data.
+    data_hash = Column(db.String(32), nullable=True)
+    # Size of the stored payload in bytes, wherever it's stored.
+    data_size = Column(db.Integer, nullable=True)
+    # Number of times the query returned this same data again, and the result was reused instead of stored again.
+    reuse_count = Column(db.Integer, default=0, server_default='0')
     runtime = Column(postgresql.DOUBLE_PRECISION)
     retrieved_at = Column(db.DateTime(True))
 
     __tablename__ = 'query_results'
+    __table_args__ = (
+        # Serves get_latest: the newest result of a query on a data source (within the allowed age).
+        db.Index('query_results_data_source_id_query_hash_retrieved_at',
+                 data_source_id, query_hash, retrieved_at.desc()),
+    )
 
     def __str__(self):
         return u"%d | %s | %s" % (self.id, self.query_hash, self.retrieved_at)
 
-    def to_dict(self):
-        return {
+    @property
+    def decoded_data(self):
+        return self.decode_data()
+
+    @property
+    def payload(self):
+        """The payload, as encoded by the result's codec, from wherever it's stored."""
+        return result_stores.get_store(self.payload_store).read(self)
+
+    def iter_payload(self, chunk_size=result_stores.CHUNK_SIZE):
+        return result_stores.get_store(self.payload_store).iter_chunks(self, chunk_size)
+
+    def decode_data(self, lazy_rows=False):
+        """Return the result dictionary. With `lazy_rows`, `rows` may be an iterator (when the storage codec supports
+        building rows on demand), for callers that only need to go over the rows once."""
+        if self.data_codec in (None, result_codecs.CODEC_JSON):
+            return json_loads(self.payload)
+
+        return result_codecs.get_codec(self.data_codec).decode(self.payload, lazy_rows)
+
+    def decode_data_slice(self, offset=0, limit=None, columns=None):
+        """Return the given rows (and only the given columns, by name) of the result, along with its total number of
+        rows. Only the needed blocks of results stored with a columnar codec are decoded."""
+        if self.data_codec in (None, result_codecs.CODEC_JSON):
+            return result_codecs.slice_result(json_loads(self.payload), offset, limit, columns)
+
+        return result_codecs.get_codec(self.data_codec).decode_slice(self.payload, offset, limit, columns)
+
+    def set_data(self, data, codec=result_codecs.CODEC_JSON):
+        """Store the result payload using the given codec.
+
+        `data` is either the result dictionary, its JSON representation (as returned by the query runners) or an
+        already encoded `EncodedResult` (as produced by streaming query runners), whose own codec is used.
+        """
+        if isinstance(data, result_codecs.EncodedResult):
+            codec, payload = data.codec, data.payload
+        elif codec == result_codecs.CODEC_JSON:
+            payload = json_dumps(data) if isinstance(data, dict) else data
+        else:
+            if isinstance(data, string_types):
+                data = json_loads(data)
+            payload = result_codecs.get_codec(codec).encode(data)
+
+        self.data_codec = None if codec == result_codecs.CODEC_JSON else codec
+        result_stores.get_store(result_stores.STORE_INLINE).write(self, payload)
+
+        if isinstance(payload, text_type):
+            payload = payload.encode('utf-8')
+        self.data_hash = hashlib.md5(payload or '').hexdigest()
+        self.data_size = len(payload or '')
+
+    def offload_payload(self):
+        """Move the payload of a new result to the configured external store, if it's large enough."""
+        if self.payload_store is not None:
+            return
+
+        payload = self.payload
+        store = result_stores.store_for_size(len(payload or ''))
+        if store.name() != result_stores.STORE_INLINE:
+            store.write(self, payload)
+            # Deleted unless the result is committed, as nothing would ever delete it otherwise.
+            db.session.info.setdefault(_PENDING_PAYLOADS_KEY, []).append((self.payload_store, self.payload_key))
+
+    def to_dict(self, offset=0, limit=None, columns=None, with_data=True):
+        """With any of `offset`, `limit` or `columns`, only that slice of the data is returned and its
+        `metadata.total_row_count` holds the number of rows of the whole result."""
+        d = {
             'id': self.id,
             'query_hash': self.query_hash,
             'query': self.query_text,
-            'data': json_loads(self.data),
             'data_source_id': self.data_source_id,
             'runtime': self.runtime,
             'retrieved_at': self.retrieved_at
         }
 
+        if with_data:
+            if offset or limit is not None or columns is not None:
+                data, total_row_count = self.decode_data_slice(offset, limit, columns)
+                data.setdefault('metadata', {})['total_row_count'] = total_row_count
+            else:
+                data = self.decoded_data
+            d['data'] = data
+
+        return d
+
+    @classmethod
+    def get_by_id_and_org(cls, object_id, org, load_data=True):
+        query = cls.query.filter(cls.id == object_id, cls.org == org)
+        if load_data:
+            query = query.options(undefer_group('payload'))
+        return query.one()
+
     @classmethod
     def unused(cls, days=7):
         age_threshold = datetime.datetime.now() - datetime.timedelta(days=days)
-        return (
+        query = (
             cls.query.filter(
                 Query.id.is_(None),
                 cls.retrieved_at < age_threshold
@@ -273,50 +409,122 @@ class QueryResult(db.Model, BelongsToOrgMixin):
             .outerjoin(Query)
         ).options(load_only('id'))
 
+        # When the table is partitioned, the results in range partitions are dropped with their partition: only the
+        # default and archive partitions (holding the results retrieved before the oldest other partition starts)
+        # need to be looked at.
+        partitions_start = partitions.oldest_partition_start()
+        if partitions_start is not None:
+            query = query.filter(cls.retrieved_at < partitions_start)
+
+        return query
+
+    @classmethod
+    def delete_unused(cls, days=7, after_id=0, limit=100):
+        """Delete the first `limit` unused results (see `unused`) with an id greater than `after_id`, in id order.
+        Returns the (id, payload_store, payload_key) of the deleted results: their external payloads should be deleted
+        once the transaction is committed."""
+        batch = (
+            cls.unused(days)
+            .filter(cls.id > after_id)
+            .order_by(cls.id)
+            .limit(limit)
+            .with_entities(cls.id)
+            .subquery()
+        )
+        statement = cls.__table__.delete().where(cls.id.in_(batch)).returning(cls.id, cls.payload_store, cls.payload_key)
+        return db.session.execute(statement).fetchall()
+
     @classmethod
     def get_latest(cls, data_source, query, max_age=0):
+        """Return the most recent result of the query, if it was retrieved at most `max_age` seconds ago (or ever,
+        when `max_age` is -1). The payload is only loaded when it's accessed."""
         query_hash = utils.gen_query_hash(query)
 
-        if max_age == -1:
-            query = cls.query.filter(
-                cls.query_hash == query_hash,
-                cls.data_source == data_source
-            )
-        else:
-            query = cls.query.filter(
-                cls.query_hash == query_hash,
-                cls.data_source == data_source,
-                (
-                    db.func.timezone('utc', cls.retrieved_at) +
-                    datetime.timedelta(seconds=max_age) >=
-                    db.func.timezone('utc', db.func.now())
-                )
-            )
+        query = cls.query.filter(
+            cls.data_source_id == data_source.id,
+            cls.query_hash == query_hash,
+        )
+
+        if max_age != -1:
+            # Compare retrieved_at itself (and not an expression of it), so the lookup can use the index.
+            query = query.filter(cls.retrieved_at >= db.func.now() - datetime.timedelta(seconds=max_age))
 
         return query.order_by(cls.retrieved_at.desc()).first()
 
+    @staticmethod
+    def storage_codec(org):
+        return result_codecs.resolve_codec_name(org.get_setting('query_results_storage_codec'))
+
+    def find_duplicate(self):
+        """Return the latest stored result of the same query and data source, if it has the same payload as this
+        one."""
+        latest = (
+            QueryResult.query
+            .filter(QueryResult.data_source_id == self.data_source_id, QueryResult.query_hash == self.query_hash)
+            .order_by(QueryResult.retrieved_at.desc())
+            .first()
+        )
+
+        if (latest is not None and latest.data_hash is not None and latest.data_hash == self.data_hash and
+                latest.data_codec == self.data_codec):
+            return latest
+
+        return None
+
     @classmethod
-    def store_result(cls, org, data_source, query_hash, query, data, run_time, retrieved_at):
+    def store_result(cls, org, data_source, query_hash, query, data, run_time, retrieved_at, codec=None):
+        """Store the result of running `query` on `data_source`, using the given storage `codec` (the org's one by
+        default), and make it the latest result of the queries with the same hash on the same data source."""
+        # Not added to the session (through the data source relationship either) until we know it isn't a duplicate.
         query_result = cls(org_id=org,
                            query_hash=query_hash,
                            query_text=query,
                            runtime=run_time,
-                           data_source=data_source,
-                           retrieved_at=retrieved_at,
-                           data=data)
-        db.session.add(query_result)
-        logging.info("Inserted query (%s) data; id=%s", query_hash, query_result.id)
-        # TODO: Investigate how big an impact this select-before-update makes.
-        queries = Query.query.filter(
-            Query.query_hash == query_hash,
-            Query.data_source == data_source
+                           data_source_id=data_source.id,
+                           retrieved_at=retrieved_at)
+        if isinstance(data, result_codecs.EncodedResult):
+            query_result.set_data(data)
+        else:
+            if codec is None:
+                # The data source might be detached from the session (the executor closes it while the query runs),
+                # so the org is loaded by its id.
+                codec = cls.storage_codec(Organization.query.get(org))
+            query_result.set_data(data, codec)
+
+        # Queries returning the same data on every run (lookup tables, quiet metrics) only refresh their last result.
+        duplicate = query_result.find_duplicate()
+        if duplicate is not None:
+            duplicate.retrieved_at = retrieved_at
+            duplicate.runtime = run_time
+            duplicate.reuse_count = cls.reuse_count + 1
+            query_result = duplicate
+            db.session.flush()
+            logging.info("Query (%s) returned the same data as before; reused id=%s", query_hash, query_result.id)
+        else:
+            query_result.offload_payload()
+            db.session.add(query_result)
+            db.session.flush()
+            logging.info("Inserted query (%s) data; id=%s", query_hash, query_result.id)
+
+        # Use a single UPDATE instead of loading and flushing each query, which also leaves their version and
+        # updated_at alone. It resets next_run_at like setting Query.latest_query_data does.
+        queries = Query.__table__
+        # Empty schedules are stored as '{}', and don't schedule the query either.
+        scheduled = func.coalesce(db.cast(queries.c.schedule, db.Text), '{}') != '{}'
+        statement = (
+            queries.update()
+            .where(and_(queries.c.query_hash == query_hash, queries.c.data_source_id == data_source.id))
+            .values(latest_query_data_id=query_result.id,
+                    next_run_at=case([(scheduled, func.now())], else_=None))
+            .returning(queries.c.id)
         )
-        for q in queries:
-            q.latest_query_data = query_result
-            # don't auto-update the updated_at timestamp
-            q.skip_updated_at = True
-            db.session.add(q)
-        query_ids = [q.id for q in queries]
+        query_ids = [row[0] for row in db.session.execute(statement)]
+
+        # Queries already loaded in this session pick the new values up when next accessed.
+        updated = set(query_ids)
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, Query) and obj.id in updated:
+                db.session.expire(obj, ['latest_query_data', 'latest_query_data_id', 'next_run_at'])
         logging.info("Updated %s queries with result (%s).", len(query_ids), query_hash)
 
         return query_result, query_ids
@@ -325,13 +533,25 @@ class QueryResult(db.Model, BelongsToOrgMixin):
     def groups(self):
         return self.data_source.groups
 
-
-def should_schedule_next(previous_iteration, now, interval, time=None, day_of_week=None, failures=0):
+    @classmethod
+    def storage_saved(cls):
+        """Return the number of bytes not stored thanks to reused results."""
+        # Results stored before their size was recorded have their payload inline.
+        payload_size = func.coalesce(cls.data_size,
+                                     func.coalesce(func.pg_column_size(cls.data), 0) +
+                                     func.coalesce(func.pg_column_size(cls.encoded_data), 0))
+        saved = db.session.query(func.sum(cls.reuse_count * payload_size)).filter(cls.reuse_count > 0).scalar()
+        return int(saved or 0)
+
+
+def next_iteration(previous_iteration, interval, time=None, day_of_week=None, failures=0):
+    """Return when a query scheduled with the given parameters should run next, or None if the backoff for its
+    failures is too long to represent."""
     # if time exists then interval > 23 hours (82800s)
     # if day_of_week exists then interval > 6 days (518400s)
     if (time is None):
         ttl = int(interval)
-        next_iteration = previous_iteration + datetime.timedelta(seconds=ttl)
+        next_run_at = previous_iteration + datetime.timedelta(seconds=ttl)
     else:
         hour, minute = time.split(':')
         hour, minute = int(hour), int(minute)
@@ -351,14 +571,19 @@ def should_schedule_next(previous_iteration, now, interval, time=None, day_of_we
         if (day_of_week is not None):
             days_to_add = list(calendar.day_name).index(day_of_week) - normalized_previous_iteration.weekday()
 
-        next_iteration = (previous_iteration + datetime.timedelta(days=days_delay) +
-                          datetime.timedelta(days=days_to_add)).replace(hour=hour, minute=minute)
+        next_run_at = (previous_iteration + datetime.timedelta(days=days_delay) +
+                       datetime.timedelta(days=days_to_add)).replace(hour=hour, minute=minute)
     if failures:
         try:
-            next_iteration += datetime.timedelta(minutes=2**failures)
+            next_run_at += datetime.timedelta(minutes=2**failures)
         except OverflowError:
-            return False
-    return now > next_iteration
+            return None
+    return next_run_at
+
+
+def should_schedule_next(previous_iteration, now, interval, time=None, day_of_week=None, failures=0):
+    next_run_at = next_iteration(previous_iteration, interval, time, day_of_week, failures)
+    return next_run_at is not None and now > next_run_at
 
 
 @python_2_unicode_compatible
@@ -389,6 +614,10 @@ class Query(ChangeTrackingMixin, TimestampMixin, BelongsToOrgMixin, db.Model):
     is_draft = Column(db.Boolean, default=True, index=True)
     schedule = Column(MutableDict.as_mutable(PseudoJSON), nullable=True)
     schedule_failures = Column(db.Integer, default=0)
+    # The earliest time the query might be due according to its schedule (NULL when it won't run again). It's reset to
+    # the current time whenever the schedule, the failures count or the latest result change, and set to the exact
+    # time by outdated_queries, which only looks at queries with next_run_at in the past.
+    next_run_at = Column(db.DateTime(True), nullable=True, index=True)
     visualizations = db.relationship("Visualization", cascade="all, delete-orphan")
     options = Column(MutableDict.as_mutable(PseudoJSON), default={})
     search_vector = Column(TSVectorType('id', 'name', 'description', 'query',
@@ -401,6 +630,9 @@ class Query(ChangeTrackingMixin, TimestampMixin, BelongsToOrgMixin, db.Model):
 
     query_class = SearchBaseQuery
     __tablename__ = 'queries'
+    __table_args__ = (
+        db.Index('queries_query_hash_data_source_id', 'query_hash', 'data_source_id'),
+    )
     __mapper_args__ = {
         "version_id_col": version,
         'version_id_generator': False
@@ -541,41 +773,62 @@ class Query(ChangeTrackingMixin, TimestampMixin, BelongsToOrgMixin, db.Model):
 
     @classmethod
     def outdated_queries(cls):
+        now = utils.utcnow()
         queries = (
             Query.query
             .options(joinedload(Query.latest_query_data).load_only('retrieved_at'))
-            .filter(Query.schedule.isnot(None))
+            .filter(Query.schedule.isnot(None), Query.next_run_at <= now)
             .order_by(Query.id)
         )
 
-        now = utils.utcnow()
         outdated_queries = {}
+        rescheduled = []
         scheduled_queries_executions.refresh()
 
         for query in queries:
-            if query.schedule['interval'] is None:
-                continue
-
-            if query.schedule['until'] is not None:
-                schedule_until = pytz.utc.localize(datetime.datetime.strptime(query.schedule['until'], '%Y-%m-%d'))
-
-                if schedule_until <= now:
-                    continue
-
             if query.latest_query_data:
                 retrieved_at = query.latest_query_data.retrieved_at
             else:
-                retrieved_at = now
+                retrieved_at = None
 
             retrieved_at = scheduled_queries_executions.get(query.id) or retrieved_at
 
-            if should_schedule_next(retrieved_at, now, query.schedule['interval'], query.schedule['time'],
-                                    query.schedule['day_of_week'], query.schedule_failures):
+            next_run_at = None
+            if retrieved_at is not None and query.schedule['interval'] is not None:
+                next_run_at = next_iteration(retrieved_at, query.schedule['interval'], query.schedule['time'],
+                                             query.schedule['day_of_week'], query.schedule_failures)
+
+            if next_run_at is not None and query.schedule['until'] is not None:
+                schedule_until = pytz.utc.localize(datetime.datetime.strptime(query.schedule['until'], '%Y-%m-%d'))
+
+                if schedule_until <= now:
+                    next_run_at = None
+
+            if next_run_at is not None and now > next_run_at:
                 key = "{}:{}".format(query.query_hash, query.data_source_id)
                 outdated_queries[key] = query
+            else:
+                # Not due yet: store when it will be (NULL if never), so it isn't looked at again until then.
+                rescheduled.append((query, next_run_at))
+
+        if rescheduled:
+            cls._update_next_run_at(rescheduled)
 
         return outdated_queries.values()
 
+    @classmethod
+    def _update_next_run_at(cls, rescheduled):
+        # Use a plain UPDATE, so it doesn't count as a change of the queries (version, updated_at).
+        statement = (
+            cls.__table__.update()
+            .where(cls.__table__.c.id == bindparam('query_id'))
+            .values(next_run_at=bindparam('next_run'))
+        )
+        db.session.execute(statement, [{'query_id': q.id, 'next_run': next_run_at} for q, next_run_at in rescheduled])
+
+        for query, next_run_at in rescheduled:
+            set_committed_value(query, 'next_run_at', next_run_at)
+
     @classmethod
     def search(cls, term, group_ids, user_id=None, include_drafts=False,
                limit=None, include_archived=False, multi_byte_search=False):
@@ -701,8 +954,11 @@ class Query(ChangeTrackingMixin, TimestampMixin, BelongsToOrgMixin, db.Model):
                      AND active=true
                      AND visualizations.query_id = :id"""
 
-        api_keys = db.session.execute(query, {'id': self.id}).fetchall()
-        return [api_key[0] for api_key in api_keys]
+        def load():
+            api_keys = db.session.execute(query, {'id': self.id}).fetchall()
+            return [api_key[0] for api_key in api_keys]
+
+        return permissions_cache.get('dashboard_api_keys', self.id, load)
 
 
 @listens_for(Query.query_text, 'set')
@@ -716,6 +972,55 @@ def query_last_modified_by(target, val, oldval, initiator):
     target.last_modified_by_id = val
 
 
+def reset_next_run_at(query, schedule):
+    query.next_run_at = utils.utcnow() if schedule else None
+
+
+@listens_for(Query.schedule, 'set')
+def query_schedule_changed(target, val, oldval, initiator):
+    reset_next_run_at(target, val)
+
+
+@listens_for(Query.schedule, 'modified')
+def query_schedule_modified(target, initiator):
+    reset_next_run_at(target, target.schedule)
+
+
+@listens_for(Query.schedule_failures, 'set')
+@listens_for(Query.latest_query_data, 'set')
+def query_schedule_state_changed(target, val, oldval, initiator):
+    reset_next_run_at(target, target.schedule)
+
+
+@listens_for(QueryResult.retrieved_at, 'set')
+def query_result_retrieved_at_changed(target, val, oldval, initiator):
+    # Results don't normally change once stored, but keep the queries of this session that use them consistent.
+    session = object_session(target)
+    if session is None or target.id is None:
+        return
+
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Query) and obj.latest_query_data_id == target.id:
+            reset_next_run_at(obj, obj.schedule)
+
+
+def record_payload_loaded(query_result, attrs=None):
+    size = sum(len(query_result.__dict__.get(attr) or '')
+               for attr in ('data', 'encoded_data') if attrs is None or attr in attrs)
+    if size:
+        database_metrics.record_loaded_bytes(QueryResult.__tablename__, size)
+
+
+@listens_for(QueryResult, 'load')
+def query_result_loaded(target, context):
+    record_payload_loaded(target)
+
+
+@listens_for(QueryResult, 'refresh')
+def query_result_refreshed(target, context, attrs):
+    record_payload_loaded(target, attrs)
+
+
 @generic_repr('id', 'object_type', 'object_id', 'user_id', 'org_id')
 class Favorite(TimestampMixin, db.Model):
     id = Column(db.Integer, primary_key=True)
@@ -788,7 +1093,7 @@ class Alert(TimestampMixin, BelongsToOrgMixin, db.Model):
         return super(Alert, cls).get_by_id_and_org(object_id, org, Query)
 
     def evaluate(self):
-        data = json_loads(self.query_rel.latest_query_data.data)
+        data = self.query_rel.latest_query_data.decoded_data
 
         if data['rows'] and self.options['column'] in data['rows'][0]:
             value = data['rows'][0][self.options['column']]
@@ -813,7 +1118,7 @@ class Alert(TimestampMixin, BelongsToOrgMixin, db.Model):
     def render_template(self):
         if not self.template:
             return ''
-        data = json_loads(self.query_rel.latest_query_data.data)
+        data = self.query_rel.latest_query_data.decoded_data
         context = {'rows': data['rows'], 'cols': data['columns'], 'state': self.state}
         return mustache_render(self.template, context)
 
@@ -929,6 +1234,45 @@ class Dashboard(ChangeTrackingMixin, TimestampMixin, BelongsToOrgMixin, db.Model
     def get_by_slug_and_org(cls, slug, org):
         return cls.query.filter(cls.slug == slug, cls.org == org).one()
 
+    def load_widgets(self):
+        """Return the dashboard's widgets along with their visualizations, queries and the queries' authors, loaded
+        with a single query."""
+        query_rel = joinedload(Widget.visualization).joinedload(Visualization.query_rel)
+        return (
+            Widget.query
+            .options(query_rel.joinedload(Query.user), query_rel.joinedload(Query.last_modified_by))
+            .filter(Widget.dashboard_id == self.id)
+            .order_by(Widget.id)
+            .all()
+        )
+
+    def latest_query_results(self):
+        """Return (query, latest result) of each query of the dashboard's widgets, loaded with a single query. The
+        payloads of the results are left out, to be loaded one at a time when needed."""
+        return (
+            db.session.query(Query, QueryResult)
+            .join(QueryResult, Query.latest_query_data_id == QueryResult.id)
+            .join(Visualization, Visualization.query_id == Query.id)
+            .join(Widget, Widget.visualization_id == Visualization.id)
+            .filter(Widget.dashboard_id == self.id)
+            .order_by(Query.id)
+            .all()
+        )
+
+    def widgets_state(self):
+        """Return, for each widget, what its serialization depends on: the widget, visualization and query update
+        times, the query's data source (whose permissions decide whether the widget is restricted) and the id of the
+        latest result of the query. Loaded with a single query."""
+        return (
+            db.session.query(Widget.id, Widget.updated_at, Visualization.updated_at, Query.updated_at,
+                             Query.data_source_id, Query.latest_query_data_id)
+            .outerjoin(Visualization, Widget.visualization_id == Visualization.id)
+            .outerjoin(Query, Visualization.query_id == Query.id)
+            .filter(Widget.dashboard_id == self.id)
+            .order_by(Widget.id)
+            .all()
+        )
+
     @hybrid_property
     def lowercase_name(self):
         "Optional property useful for sorting purposes."
@@ -1209,6 +1553,38 @@ class QuerySnippet(TimestampMixin, db.Model, BelongsToOrgMixin):
         return d
 
 
+@listens_for(DataSourceGroup, 'after_insert')
+@listens_for(DataSourceGroup, 'after_update')
+@listens_for(DataSourceGroup, 'after_delete')
+@listens_for(ApiKey, 'after_insert')
+@listens_for(ApiKey, 'after_update')
+@listens_for(Widget, 'after_insert')
+@listens_for(Widget, 'after_delete')
+@listens_for(Group, 'after_update')
+@listens_for(Group, 'after_delete')
+def invalidate_permissions_cache(mapper, connection, target):
+    # The data source groups, dashboard API keys or group permissions changed.
+    permissions_cache.invalidate(object_session(target))
+
+
+@listens_for(db.session, 'after_commit')
+def invalidate_permissions_cache_after_commit(session):
+    permissions_cache.invalidate_after_commit(session)
+
+
+@listens_for(db.session, 'after_commit')
+def keep_committed_payloads(session):
+    if not session.transaction.nested:
+        session.info.pop(_PENDING_PAYLOADS_KEY, None)
+
+
+@listens_for(db.session, 'after_transaction_end')
+def delete_uncommitted_payloads(session, transaction):
+    # The results whose external payloads are still pending were rolled back (or never committed).
+    if transaction.parent is None:
+        result_stores.delete_payloads(session.info.pop(_PENDING_PAYLOADS_KEY, []))
+
+
 def init_db():
     default_org = Organization(name="Default", slug='default', settings={})
     admin_group = Group(name='admin', permissions=['admin', 'super_admin'], org=default_org, type=Group.BUILTIN_GROUP)
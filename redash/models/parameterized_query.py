@@ -2,7 +2,7 @@ import pystache
 from functools import partial
 from flask_restful import abort
 from numbers import Number
-from redash.utils import mustache_render, json_loads
+from redash.utils import mustache_render
 from redash.permissions import require_access, view_only
 from funcy import distinct
 from dateutil.parser import parse
@@ -24,7 +24,7 @@ def _load_result(query_id):
 
     if query.data_source:
         query_result = models.QueryResult.get_by_id_and_org(query.latest_query_data_id, current_org)
-        return json_loads(query_result.data)
+        return query_result.decoded_data
     else:
         abort(400, message="This query is detached from any data source. Please select a different query.")
 
@@ -0,0 +1,284 @@
+"""
+Optional range partitioning of the ``query_results`` table by ``retrieved_at``.
+
+Deleting old results row by row leaves a lot of work to vacuum on large
+installations. With a partitioned table, expired results are dropped a whole
+partition (of ``QUERY_RESULTS_PARTITION_DAYS`` days) at a time instead.
+
+The table is converted with the ``manage.py database partition_query_results``
+command (or by the migration adding partitioning support, when
+``REDASH_QUERY_RESULTS_PARTITIONING`` is set). Conversion keeps the existing
+table as the default partition, so no data is copied. Range partitions start
+after the latest result of the existing table, which is constrained to hold
+only earlier results: creating a partition then doesn't need to scan it. New
+results go to the range partitions, which `create_partitions` keeps created
+ahead of time.
+
+When a partition expires, the results in it that queries still point at are
+moved to the archive partition (keeping their ids, so queries don't need to be
+updated) before it's dropped. The archive partition covers the range of all the
+dropped partitions, and only holds the results that were still in use. Unused
+results in the default and archive partitions are still deleted row by row by
+the cleanup job.
+
+Partitioning requires PostgreSQL 11 or newer. Since a partitioned table can't
+be referenced by a foreign key (before PostgreSQL 12, and even then only by
+its whole primary key), the ``queries.latest_query_data_id`` constraint is
+dropped.
+"""
+import datetime
+import logging
+import re
+
+import pytz
+from dateutil import parser as date_parser
+from sqlalchemy import text
+
+from redash import settings
+
+from .base import db
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'query_results'
+DEFAULT_PARTITION = 'query_results_default'
+ARCHIVE_PARTITION = 'query_results_archive'
+# Number of partitions to create past the current one.
+PARTITIONS_AHEAD = 2
+MIN_SERVER_VERSION = 110000
+
+_bounds_re = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+class PartitioningError(Exception):
+    pass
+
+
+class Partition(object):
+    def __init__(self, name, start, end):
+        self.name = name
+        self.start = start
+        self.end = end
+        # (store, key) of the external payloads of the results dropped with the partition.
+        self.external_payloads = []
+
+    def __repr__(self):
+        return '<Partition {} [{}, {})>'.format(self.name, self.start, self.end)
+
+
+def _execute(bind, statement, **params):
+    return (bind or db.session).execute(text(statement), params)
+
+
+def is_partitioned(bind=None):
+    # Works with versions of PostgreSQL without partitioning as well.
+    return _execute(bind, "SELECT EXISTS (SELECT 1 FROM pg_class WHERE relname = :table AND relkind = 'p' "
+                          "AND pg_table_is_visible(oid))", table=TABLE).scalar()
+
+
+def list_partitions(bind=None):
+    """Return the range partitions of the table, oldest first."""
+    rows = _execute(bind, "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+                          "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:table)",
+                    table=TABLE)
+
+    partitions = []
+    for name, bound in rows:
+        match = _bounds_re.search(bound or '')
+        if match is None:
+            # The default partition.
+            continue
+        # Bounds are shown in the session's time zone.
+        start, end = [date_parser.parse(value).astimezone(pytz.utc) for value in match.groups()]
+        partitions.append(Partition(name, start, end))
+
+    return sorted(partitions, key=lambda p: p.start)
+
+
+def oldest_partition_start(bind=None):
+    """Return when the oldest range partition (other than the archive) starts: results retrieved before that are in
+    the default or archive partitions. Returns None when the table isn't partitioned."""
+    if not is_partitioned(bind):
+        return None
+
+    partitions = [p for p in list_partitions(bind) if p.name != ARCHIVE_PARTITION]
+    return partitions[0].start if partitions else None
+
+
+def _partition_start(moment, days):
+    # Partitions are aligned on multiples of `days` since the epoch, in UTC.
+    day = moment.astimezone(pytz.utc).date()
+    day = datetime.date.fromordinal(day.toordinal() - day.toordinal() % days)
+    return datetime.datetime(day.year, day.month, day.day, tzinfo=pytz.utc)
+
+
+def create_partitions(bind=None, days=None, now=None, start=None):
+    """Create the partitions for the current period and PARTITIONS_AHEAD more. Returns the created partitions.
+
+    When there are no partitions yet, the first one starts at `start` (a period boundary, the current period by
+    default)."""
+    days = days or settings.QUERY_RESULTS_PARTITION_DAYS
+    now = now or datetime.datetime.now(pytz.utc)
+
+    partitions = list_partitions(bind)
+    if partitions:
+        start = partitions[-1].end
+    else:
+        start = start or _partition_start(now, days)
+    until = _partition_start(now, days) + datetime.timedelta(days=days * (PARTITIONS_AHEAD + 1))
+
+    created = []
+    while start < until:
+        end = _partition_start(start, days) + datetime.timedelta(days=days)
+        name = '{}_p{}'.format(TABLE, start.strftime('%Y%m%d'))
+        _execute(bind, "CREATE TABLE {} PARTITION OF {} FOR VALUES FROM ('{}') TO ('{}')".format(
+            name, TABLE, start.isoformat(), end.isoformat()))
+        created.append(Partition(name, start, end))
+        start = end
+
+    if created:
+        logger.info("Created query results partitions: %s", ', '.join(p.name for p in created))
+
+    return created
+
+
+def drop_expired_partitions(max_age, bind=None, now=None):
+    """Drop the partitions holding only results older than `max_age` days, moving the results still used by queries
+    to the archive partition first. Returns the dropped partitions (whose `external_payloads` should be deleted once
+    the transaction is committed)."""
+    now = now or datetime.datetime.now(pytz.utc)
+    threshold = now - datetime.timedelta(days=max_age)
+
+    partitions = list_partitions(bind)
+    archive = partitions.pop(0) if partitions and partitions[0].name == ARCHIVE_PARTITION else None
+    expired = [p for p in partitions if p.end <= threshold]
+    if not expired:
+        return []
+
+    # The archive is detached while it's extended, and attached back with its new range. Adding the new rows before
+    # attaching it only has its (few) rows checked against the range, instead of every row of the partitions.
+    if archive is None:
+        _execute(bind, "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS)".format(ARCHIVE_PARTITION, TABLE))
+        start = expired[0].start
+    else:
+        _execute(bind, "ALTER TABLE {} DETACH PARTITION {}".format(TABLE, ARCHIVE_PARTITION))
+        start = archive.start
+
+    used = "(SELECT latest_query_data_id FROM queries WHERE latest_query_data_id IS NOT NULL)"
+    for partition in expired:
+        _execute(bind, "ALTER TABLE {} DETACH PARTITION {}".format(TABLE, partition.name))
+        moved = _execute(bind, "INSERT INTO {archive} SELECT * FROM {partition} WHERE id IN {used}"
+                               .format(archive=ARCHIVE_PARTITION, partition=partition.name, used=used)).rowcount
+        partition.external_payloads = _execute(
+            bind, "SELECT payload_store, payload_key FROM {partition} WHERE payload_key IS NOT NULL "
+                  "AND id NOT IN {used}".format(partition=partition.name, used=used)).fetchall()
+        _execute(bind, "DROP TABLE {}".format(partition.name))
+        logger.info("Dropped query results partition %s (kept %d results still in use).", partition.name, moved)
+
+    _execute(bind, "ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM ('{}') TO ('{}')".format(
+        TABLE, ARCHIVE_PARTITION, start.isoformat(), expired[-1].end.isoformat()))
+
+    return expired
+
+
+def _rename_constraints_and_indexes(bind, table, old_prefix, new_prefix):
+    """Rename the constraints and indexes of `table` from `old_prefix`... to `new_prefix`... (or prefix them with
+    `new_prefix`), so they don't clash with the ones of the table that takes its place."""
+    def new_name(name):
+        if name.startswith(old_prefix):
+            return new_prefix + name[len(old_prefix):]
+        return new_prefix + '_' + name
+
+    constraints = _execute(bind, "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:table)",
+                           table=table).fetchall()
+    for (name,) in constraints:
+        _execute(bind, "ALTER TABLE {} RENAME CONSTRAINT {} TO {}".format(table, name, new_name(name)))
+
+    # Indexes backing constraints were renamed with them.
+    indexes = _execute(bind, "SELECT indexname FROM pg_indexes WHERE tablename = :table", table=table).fetchall()
+    for (name,) in indexes:
+        if not name.startswith(new_prefix):
+            _execute(bind, "ALTER INDEX {} RENAME TO {}".format(name, new_name(name)))
+
+
+def partition_table(bind=None, days=None):
+    """Convert query_results to a table partitioned by retrieved_at, keeping the existing table as its default
+    partition."""
+    server_version = int(_execute(bind, "SHOW server_version_num").scalar())
+    if server_version < MIN_SERVER_VERSION:
+        raise PartitioningError("Partitioning query results requires PostgreSQL 11 or newer.")
+
+    if is_partitioned(bind):
+        raise PartitioningError("The query_results table is already partitioned.")
+
+    days = days or settings.QUERY_RESULTS_PARTITION_DAYS
+    # The existing results stay in the default partition, so range partitions start after the latest one.
+    start = _partition_start(datetime.datetime.now(pytz.utc), days)
+    latest = _execute(bind, "SELECT max(retrieved_at) FROM {}".format(TABLE)).scalar()
+    if latest is not None:
+        start = max(start, _partition_start(latest, days) + datetime.timedelta(days=days))
+
+    statements = [
+        "ALTER TABLE queries DROP CONSTRAINT IF EXISTS queries_latest_query_data_id_fkey",
+        "ALTER TABLE {table} RENAME TO {default}",
+    ]
+    for statement in statements:
+        _execute(bind, statement.format(table=TABLE, default=DEFAULT_PARTITION))
+    _rename_constraints_and_indexes(bind, DEFAULT_PARTITION, TABLE, DEFAULT_PARTITION)
+
+    # The partitioned table's primary key has to include retrieved_at, and is added to the partitions.
+    primary_key = _execute(bind, "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:table) "
+                                 "AND contype = 'p'", table=DEFAULT_PARTITION).scalar()
+    if primary_key is not None:
+        _execute(bind, "ALTER TABLE {} DROP CONSTRAINT {}".format(DEFAULT_PARTITION, primary_key))
+
+    statements = [
+        # Lets PostgreSQL know that the default partition has no rows for the range partitions, without scanning it
+        # every time one is created.
+        "ALTER TABLE {default} ADD CONSTRAINT {default}_retrieved_at_check CHECK (retrieved_at < '{start}')",
+        "CREATE TABLE {table} (LIKE {default} INCLUDING DEFAULTS) PARTITION BY RANGE (retrieved_at)",
+        "ALTER SEQUENCE query_results_id_seq OWNED BY {table}.id",
+        "ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT",
+        "ALTER TABLE {table} ADD CONSTRAINT query_results_pkey PRIMARY KEY (id, retrieved_at)",
+        "ALTER TABLE {table} ADD CONSTRAINT query_results_org_id_fkey "
+        "FOREIGN KEY (org_id) REFERENCES organizations (id)",
+        "ALTER TABLE {table} ADD CONSTRAINT query_results_data_source_id_fkey "
+        "FOREIGN KEY (data_source_id) REFERENCES data_sources (id)",
+        "CREATE INDEX ix_query_results_query_hash ON {table} (query_hash)",
+        "CREATE INDEX query_results_data_source_id_query_hash_retrieved_at "
+        "ON {table} (data_source_id, query_hash, retrieved_at DESC)",
+    ]
+    for statement in statements:
+        _execute(bind, statement.format(table=TABLE, default=DEFAULT_PARTITION, start=start.isoformat()))
+
+    create_partitions(bind, days, start=start)
+
+
+def unpartition_table(bind=None):
+    """Convert query_results back to a regular table (copying all of the results)."""
+    if not is_partitioned(bind):
+        raise PartitioningError("The query_results table isn't partitioned.")
+
+    # The partitioned table (and its constraints and indexes) is dropped before the new table's are created.
+    _execute(bind, "ALTER TABLE {table} RENAME TO {table}_partitioned".format(table=TABLE))
+
+    statements = [
+        "CREATE TABLE {table} (LIKE {table}_partitioned INCLUDING DEFAULTS)",
+        "INSERT INTO {table} SELECT * FROM {table}_partitioned",
+        "ALTER SEQUENCE query_results_id_seq OWNED BY {table}.id",
+        "DROP TABLE {table}_partitioned",
+        "ALTER TABLE {table} ADD CONSTRAINT query_results_pkey PRIMARY KEY (id)",
+        "ALTER TABLE {table} ADD CONSTRAINT query_results_org_id_fkey "
+        "FOREIGN KEY (org_id) REFERENCES organizations (id)",
+        "ALTER TABLE {table} ADD CONSTRAINT query_results_data_source_id_fkey "
+        "FOREIGN KEY (data_source_id) REFERENCES data_sources (id)",
+        "CREATE INDEX ix_query_results_query_hash ON {table} (query_hash)",
+        "CREATE INDEX query_results_data_source_id_query_hash_retrieved_at "
+        "ON {table} (data_source_id, query_hash, retrieved_at DESC)",
+        # Results dropped with their partition may still be referenced by queries that changed since.
+        "UPDATE queries SET latest_query_data_id = NULL WHERE latest_query_data_id NOT IN (SELECT id FROM {table})",
+        "ALTER TABLE queries ADD CONSTRAINT queries_latest_query_data_id_fkey "
+        "FOREIGN KEY (latest_query_data_id) REFERENCES {table} (id)",
+    ]
+    for statement in statements:
+        _execute(bind, statement.format(table=TABLE))
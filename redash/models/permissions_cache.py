@@ -0,0 +1,111 @@
+"""
+Cache of the data permission checks depend on (data source groups, group
+permissions and dashboard API keys).
+
+Values are kept for the duration of the current request and, when
+``PERMISSIONS_CACHE_TTL`` is set, in Redis for that many seconds. Any change
+to the underlying rows calls `invalidate`, which bumps a version number that
+is part of every Redis key, so all the cached values are dropped at once.
+
+Until the change is committed, other requests still read (and may cache) the
+old rows, so changes made in a session are invalidated again once it commits.
+"""
+from flask import _request_ctx_stack
+
+from redash import redis_connection, settings
+from redash.utils import json_dumps, json_loads
+
+VERSION_KEY = 'permissions_cache:version'
+# Set in the info of sessions with uncommitted changes to the cached data.
+_PENDING_KEY = 'permissions_cache_invalidated'
+
+
+def _request_cache():
+    ctx = _request_ctx_stack.top
+    if ctx is None:
+        return None
+
+    if not hasattr(ctx, 'permissions_cache'):
+        ctx.permissions_cache = {}
+
+    return ctx.permissions_cache
+
+
+def _redis_key(version, kind, key):
+    return 'permissions_cache:{}:{}:{}'.format(version, kind, key)
+
+
+def _version(cache):
+    if cache is not None and 'version' in cache:
+        return cache['version']
+
+    version = redis_connection.get(VERSION_KEY) or '0'
+    if cache is not None:
+        cache['version'] = version
+
+    return version
+
+
+def get_many(kind, keys, load):
+    """Return a dict with the cached values of `keys`. `load` is called with
+    the keys missing from the cache and returns a dict with their values,
+    which must be JSON serializable (and survive a round trip)."""
+    cache = _request_cache()
+    values = {}
+    missing = []
+    for key in keys:
+        if cache is not None and (kind, key) in cache:
+            values[key] = cache[(kind, key)]
+        else:
+            missing.append(key)
+
+    if missing and settings.PERMISSIONS_CACHE_TTL:
+        version = _version(cache)
+        redis_keys = [_redis_key(version, kind, key) for key in missing]
+        cached = redis_connection.mget(redis_keys)
+        still_missing = []
+        for key, value in zip(missing, cached):
+            if value is None:
+                still_missing.append(key)
+            else:
+                values[key] = json_loads(value)
+        loaded = load(still_missing) if still_missing else {}
+
+        pipe = redis_connection.pipeline()
+        for key, value in loaded.iteritems():
+            pipe.set(_redis_key(version, kind, key), json_dumps(value), ex=settings.PERMISSIONS_CACHE_TTL)
+        pipe.execute()
+    else:
+        loaded = load(missing) if missing else {}
+
+    values.update(loaded)
+    if cache is not None:
+        for key in missing:
+            cache[(kind, key)] = values[key]
+
+    return values
+
+
+def get(kind, key, load):
+    """Return the cached value of `key`, calling `load()` to get it when it's
+    not cached."""
+    return get_many(kind, [key], lambda keys: {key: load()})[key]
+
+
+def invalidate(session=None):
+    """Drop the cached values. Pass the session making the change when it isn't committed yet, so they're dropped
+    again once it is."""
+    cache = _request_cache()
+    if cache is not None:
+        cache.clear()
+
+    if settings.PERMISSIONS_CACHE_TTL:
+        redis_connection.incr(VERSION_KEY)
+
+    if session is not None:
+        session.info[_PENDING_KEY] = True
+
+
+def invalidate_after_commit(session):
+    if session.info.pop(_PENDING_KEY, False):
+        invalidate()
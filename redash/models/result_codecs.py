@@ -0,0 +1,369 @@
+"""
+Storage codecs for query result payloads.
+
+The original (``json``) format keeps the row-oriented JSON document in the
+``query_results.data`` text column. Every row repeats each column name, which
+makes large results expensive to store and to decode.
+
+The columnar codecs instead keep one array of values per column (so column
+names are stored once), compress the document and store it in the
+``query_results.encoded_data`` binary column. The name of the codec used is
+stored next to the payload, so results written with any codec can always be
+read back regardless of the currently configured one.
+
+Columnar payloads are split into blocks of rows compressed separately, behind
+a header holding everything but the values. A slice of the rows (and columns)
+of a result can then be read by decompressing only the blocks it spans.
+"""
+import cStringIO
+import logging
+import struct
+import zlib
+from itertools import islice, izip, repeat
+
+from redash.utils import JSONEncoder, json_loads
+
+try:
+    import lz4.frame
+    lz4_enabled = True
+except ImportError:
+    lz4_enabled = False
+
+logger = logging.getLogger(__name__)
+
+# Version of the columnar payload layout (header followed by blocks of
+# values). Bump it (and keep reading the old versions) when changing it.
+COLUMNAR_FORMAT_VERSION = 1
+# Columnar payloads start with this marker.
+COLUMNAR_FORMAT_MAGIC = 'RDCB'
+# Length of the compressed header, following the marker.
+_header_length = struct.Struct('>I')
+# Number of rows in each block of a columnar payload.
+BLOCK_ROWS = 2000
+
+CODEC_JSON = 'json'
+CODEC_COLUMNAR_ZLIB = 'columnar_zlib'
+CODEC_COLUMNAR_LZ4 = 'columnar_lz4'
+
+
+class UnknownCodecError(Exception):
+    pass
+
+
+class EncodedResult(object):
+    """A result payload that was already encoded with the given codec."""
+    def __init__(self, codec, payload):
+        self.codec = codec
+        self.payload = payload
+
+    def __len__(self):
+        return len(self.payload)
+
+
+class ColumnarDocument(object):
+    """Accumulates rows into the column-oriented representation of a result.
+
+    Keys found in rows but missing from ``columns`` are kept as well. Cells
+    missing from a row are decoded as ``None``.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        self.names = [column['name'] for column in columns or [] if isinstance(column, dict)]
+        self.positions = dict((name, i) for i, name in enumerate(self.names))
+        self.values = [[] for _ in self.names]
+        self.row_count = 0
+
+    def add_rows(self, rows):
+        for row in rows:
+            for name in row:
+                if name not in self.positions:
+                    self.positions[name] = len(self.names)
+                    self.names.append(name)
+                    self.values.append([None] * self.row_count)
+
+            for name, column_values in izip(self.names, self.values):
+                column_values.append(row.get(name))
+
+            self.row_count += 1
+
+    def to_dict(self, extra=None):
+        document = {
+            'columns': self.columns,
+            'keys': self.names,
+            'values': self.values,
+            'row_count': self.row_count,
+        }
+
+        if extra:
+            document['extra'] = extra
+
+        return document
+
+
+def to_columnar(data):
+    """Convert a ``{'columns': [...], 'rows': [...]}`` result into its
+    column-oriented representation."""
+    document = ColumnarDocument(data.get('columns', []))
+    document.add_rows(data.get('rows') or [])
+
+    return document.to_dict(dict((k, v) for k, v in data.iteritems() if k not in ('columns', 'rows')))
+
+
+def slice_result(data, offset=0, limit=None, columns=None):
+    """Return the given rows (and only the given columns, by name) of the
+    result, along with its total number of rows."""
+    rows = data['rows']
+    total_row_count = len(rows)
+
+    rows = rows[offset:None if limit is None else offset + limit]
+    if columns is not None:
+        names = set(columns)
+        rows = [dict((k, v) for k, v in row.iteritems() if k in names) for row in rows]
+        data['columns'] = [c for c in data['columns'] if isinstance(c, dict) and c.get('name') in names]
+
+    data['rows'] = rows
+
+    return data, total_row_count
+
+
+def _buffered(chunks, size=64 * 1024):
+    """Join the (many, small) chunks produced by JSONEncoder.iterencode into
+    blocks of about `size` bytes."""
+    buf = []
+    buffered = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield ''.join(buf)
+            buf = []
+            buffered = 0
+
+    if buf:
+        yield ''.join(buf)
+
+
+class BaseResultCodec(object):
+    @classmethod
+    def name(cls):
+        raise NotImplementedError()
+
+    @classmethod
+    def enabled(cls):
+        return True
+
+    def encode(self, data, json_encoder=JSONEncoder):
+        raise NotImplementedError()
+
+    def decode(self, payload, lazy_rows=False):
+        raise NotImplementedError()
+
+
+class ColumnarCodec(BaseResultCodec):
+    def compress(self, chunks):
+        """Compress an iterable of strings, yielding the compressed blocks."""
+        raise NotImplementedError()
+
+    def decompress(self, payload):
+        raise NotImplementedError()
+
+    def encode_document(self, document, json_encoder=JSONEncoder):
+        encoder = json_encoder(ignore_nan=True)
+
+        blocks = []
+        for start in xrange(0, document['row_count'], BLOCK_ROWS):
+            block = [column_values[start:start + BLOCK_ROWS] for column_values in document['values']]
+            # Encode and compress incrementally, so the uncompressed JSON of a
+            # block is never held in memory as a whole.
+            blocks.append(''.join(self.compress(_buffered(encoder.iterencode(block)))))
+
+        header = dict((k, v) for k, v in document.iteritems() if k != 'values')
+        header.update({
+            'v': COLUMNAR_FORMAT_VERSION,
+            'block_rows': BLOCK_ROWS,
+            'block_lengths': map(len, blocks),
+        })
+        header = ''.join(self.compress([encoder.encode(header)]))
+
+        return ''.join([COLUMNAR_FORMAT_MAGIC, _header_length.pack(len(header)), header] + blocks)
+
+    def encode(self, data, json_encoder=JSONEncoder):
+        return self.encode_document(to_columnar(data), json_encoder)
+
+    def decode(self, payload, lazy_rows=False):
+        return self.decode_slice(payload, lazy_rows=lazy_rows)[0]
+
+    def decode_slice(self, payload, offset=0, limit=None, columns=None, lazy_rows=False):
+        """Decode the given rows (and only the given columns, by name) of the
+        result. Returns the result and its total number of rows."""
+        if not payload.startswith(COLUMNAR_FORMAT_MAGIC):
+            raise UnknownCodecError("Not a columnar result payload.")
+
+        header_start = len(COLUMNAR_FORMAT_MAGIC) + _header_length.size
+        header_end = header_start + _header_length.unpack_from(payload, len(COLUMNAR_FORMAT_MAGIC))[0]
+        header = json_loads(self.decompress(payload[header_start:header_end]))
+        if header.get('v') != COLUMNAR_FORMAT_VERSION:
+            raise UnknownCodecError("Unsupported columnar result version: {}".format(header.get('v')))
+
+        keys = header['keys']
+        row_count = header['row_count']
+        result_columns = header['columns']
+        if columns is not None:
+            names = set(columns)
+            indexes = [i for i, key in enumerate(keys) if key in names]
+            result_columns = [c for c in result_columns if isinstance(c, dict) and c.get('name') in names]
+        else:
+            indexes = range(len(keys))
+
+        selected_keys = [keys[i] for i in indexes]
+        end = row_count if limit is None else min(row_count, offset + limit)
+
+        def read_blocks():
+            block_rows = header['block_rows']
+            block_start = header_end
+            for i, block_length in enumerate(header['block_lengths']):
+                first_row = i * block_rows
+                if first_row + block_rows > offset and first_row < end:
+                    block = json_loads(self.decompress(payload[block_start:block_start + block_length]))
+                    if indexes:
+                        rows = izip(*[block[j] for j in indexes])
+                    else:
+                        rows = repeat((), min(block_rows, row_count - first_row))
+                    for values in islice(rows, max(offset - first_row, 0), end - first_row):
+                        yield dict(izip(selected_keys, values))
+
+                block_start += block_length
+
+        rows = read_blocks()
+        data = dict(header.get('extra', {}))
+        data['columns'] = result_columns
+        data['rows'] = rows if lazy_rows else list(rows)
+
+        return data, row_count
+
+
+class ColumnarZlibCodec(ColumnarCodec):
+    # Level 6 is zlib's default and gives most of the size reduction of level 9
+    # at a fraction of the CPU cost.
+    level = 6
+
+    @classmethod
+    def name(cls):
+        return CODEC_COLUMNAR_ZLIB
+
+    def compress(self, chunks):
+        compressor = zlib.compressobj(self.level)
+        for chunk in chunks:
+            yield compressor.compress(chunk)
+        yield compressor.flush()
+
+    def decompress(self, payload):
+        return zlib.decompress(payload)
+
+
+class ColumnarLZ4Codec(ColumnarCodec):
+    @classmethod
+    def name(cls):
+        return CODEC_COLUMNAR_LZ4
+
+    @classmethod
+    def enabled(cls):
+        return lz4_enabled
+
+    def compress(self, chunks):
+        compressor = lz4.frame.LZ4FrameCompressor()
+        yield compressor.begin()
+        for chunk in chunks:
+            yield compressor.compress(chunk)
+        yield compressor.flush()
+
+    def decompress(self, payload):
+        return lz4.frame.decompress(payload)
+
+
+class JSONResultWriter(object):
+    """Incrementally builds a result in the row-oriented JSON format."""
+    def __init__(self, json_encoder=JSONEncoder):
+        self.encoder = json_encoder(ignore_nan=True)
+        self.buffer = cStringIO.StringIO()
+        self.buffer.write('{"rows": [')
+        self.columns = []
+        self.row_count = 0
+
+    def write_columns(self, columns):
+        self.columns = columns
+
+    def write_rows(self, rows):
+        for row in rows:
+            if self.row_count:
+                self.buffer.write(', ')
+            self.buffer.write(self.encoder.encode(row))
+            self.row_count += 1
+
+    def finish(self):
+        self.buffer.write('], "columns": ')
+        self.buffer.write(self.encoder.encode(self.columns))
+        self.buffer.write('}')
+        payload = self.buffer.getvalue()
+        self.buffer.close()
+
+        return EncodedResult(CODEC_JSON, payload)
+
+
+class ColumnarResultWriter(object):
+    """Incrementally builds a result with one of the columnar codecs."""
+    def __init__(self, codec, json_encoder=JSONEncoder):
+        self.codec = codec
+        self.json_encoder = json_encoder
+        self.document = None
+
+    def write_columns(self, columns):
+        self.document = ColumnarDocument(columns)
+
+    def write_rows(self, rows):
+        self.document.add_rows(rows)
+
+    def finish(self):
+        payload = self.codec.encode_document(self.document.to_dict(), self.json_encoder)
+        return EncodedResult(self.codec.name(), payload)
+
+
+def get_writer(codec_name, json_encoder=JSONEncoder):
+    """Return an object that encodes a result incrementally: call
+    `write_columns` once, `write_rows` for each batch of rows and then `finish`
+    to get the EncodedResult."""
+    if codec_name == CODEC_JSON:
+        return JSONResultWriter(json_encoder)
+
+    return ColumnarResultWriter(get_codec(codec_name), json_encoder)
+
+
+codecs = {}
+
+
+def register(codec_class):
+    if codec_class.enabled():
+        codecs[codec_class.name()] = codec_class()
+    else:
+        logger.debug("%s result codec is not supported (missing dependencies), not registering.", codec_class.name())
+
+
+def get_codec(name):
+    try:
+        return codecs[name]
+    except KeyError:
+        raise UnknownCodecError("Unknown query result codec: {}".format(name))
+
+
+def resolve_codec_name(name):
+    """Return the codec to use for new results given the configured name,
+    falling back to plain JSON when the codec isn't available."""
+    if name == CODEC_JSON or name in codecs:
+        return name
+
+    logger.warning("Query results storage codec %s is not available, storing results as JSON.", name)
+    return CODEC_JSON
+
+
+register(ColumnarZlibCodec)
+register(ColumnarLZ4Codec)
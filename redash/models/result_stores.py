@@ -0,0 +1,246 @@
+"""
+Stores for query result payloads.
+
+Payloads are stored inline, in the ``query_results`` table, by default. Large
+payloads make Postgres the bottleneck for backups, replication and serving
+results, so payloads larger than ``QUERY_RESULTS_PAYLOAD_STORE_THRESHOLD``
+bytes can be kept in an external store instead (``QUERY_RESULTS_PAYLOAD_STORE``:
+``filesystem`` or ``s3``, which works with any S3 compatible service).
+
+The name of the store and the key of the payload in it are stored with the
+result, so results can always be read back, regardless of the currently
+configured store. Payloads are stored as encoded by the result's codec.
+External payloads are written before their result is committed, and deleted
+again when it isn't (see `QueryResult.offload_payload`).
+"""
+import logging
+import os
+import tempfile
+import uuid
+
+from redash import settings
+from redash.models import result_codecs
+
+try:
+    import boto3
+    boto3_enabled = True
+except ImportError:
+    boto3_enabled = False
+
+logger = logging.getLogger(__name__)
+
+STORE_INLINE = 'inline'
+STORE_FILESYSTEM = 'filesystem'
+STORE_S3 = 's3'
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UnknownStoreError(Exception):
+    pass
+
+
+class BasePayloadStore(object):
+    @classmethod
+    def name(cls):
+        raise NotImplementedError()
+
+    @classmethod
+    def enabled(cls):
+        return True
+
+    def write(self, query_result, payload):
+        """Store the payload of the result."""
+        raise NotImplementedError()
+
+    def read(self, query_result):
+        """Return the payload of the result."""
+        raise NotImplementedError()
+
+    def iter_chunks(self, query_result, chunk_size=CHUNK_SIZE):
+        """Return an iterator over the payload of the result, in chunks of up to `chunk_size` bytes."""
+        yield self.read(query_result)
+
+    def delete(self, key):
+        """Delete a payload stored with the given key (after the result using it was deleted)."""
+        pass
+
+
+class InlinePayloadStore(BasePayloadStore):
+    """Keeps payloads in the query_results table: in the `data` column for the JSON codec and in `encoded_data` for
+    the others."""
+    @classmethod
+    def name(cls):
+        return STORE_INLINE
+
+    def write(self, query_result, payload):
+        query_result.payload_store, query_result.payload_key = None, None
+        if query_result.data_codec in (None, result_codecs.CODEC_JSON):
+            query_result.data, query_result.encoded_data = payload, None
+        else:
+            query_result.data, query_result.encoded_data = None, payload
+
+    def read(self, query_result):
+        if query_result.data_codec in (None, result_codecs.CODEC_JSON):
+            return query_result.data
+        return query_result.encoded_data
+
+
+class ExternalPayloadStore(BasePayloadStore):
+    def write(self, query_result, payload):
+        if isinstance(payload, unicode):
+            payload = payload.encode('utf-8')
+
+        key = self.new_key(query_result)
+        self.put(key, payload)
+        query_result.payload_store, query_result.payload_key = self.name(), key
+        query_result.data, query_result.encoded_data = None, None
+
+    def read(self, query_result):
+        return ''.join(self.iter_chunks(query_result))
+
+    def iter_chunks(self, query_result, chunk_size=CHUNK_SIZE):
+        return self.get_chunks(query_result.payload_key, chunk_size)
+
+    @staticmethod
+    def new_key(query_result):
+        # Every payload written gets a new key (reencoding a result writes a new payload), so a key is never reused.
+        name = uuid.uuid4().hex
+        return '{}/{}/{}'.format(query_result.org_id, name[:2], name)
+
+    def put(self, key, payload):
+        raise NotImplementedError()
+
+    def get_chunks(self, key, chunk_size):
+        raise NotImplementedError()
+
+
+class FilesystemPayloadStore(ExternalPayloadStore):
+    """Keeps payloads as files under QUERY_RESULTS_PAYLOAD_STORE_PATH."""
+    @classmethod
+    def name(cls):
+        return STORE_FILESYSTEM
+
+    def path(self, key):
+        return os.path.join(settings.QUERY_RESULTS_PAYLOAD_STORE_PATH, *key.split('/'))
+
+    def put(self, key, payload):
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Created by another process in the meantime.
+                if not os.path.isdir(directory):
+                    raise
+
+        # Write to a temporary file first, so a payload is never read partially written.
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        os.rename(temp_path, path)
+
+    def get_chunks(self, key, chunk_size):
+        with open(self.path(key), 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            logger.warning("Couldn't delete query result payload %s.", key, exc_info=True)
+
+
+class S3PayloadStore(ExternalPayloadStore):
+    """Keeps payloads in the QUERY_RESULTS_PAYLOAD_STORE_S3_BUCKET bucket of S3 (or of any service compatible with
+    its API, with QUERY_RESULTS_PAYLOAD_STORE_S3_ENDPOINT_URL)."""
+    def __init__(self):
+        self._client = None
+
+    @classmethod
+    def name(cls):
+        return STORE_S3
+
+    @classmethod
+    def enabled(cls):
+        return boto3_enabled
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client('s3', endpoint_url=settings.QUERY_RESULTS_PAYLOAD_STORE_S3_ENDPOINT_URL or None)
+        return self._client
+
+    def object_key(self, key):
+        return settings.QUERY_RESULTS_PAYLOAD_STORE_S3_PREFIX + key
+
+    def put(self, key, payload):
+        self.client.put_object(Bucket=settings.QUERY_RESULTS_PAYLOAD_STORE_S3_BUCKET, Key=self.object_key(key),
+                               Body=payload)
+
+    def get_chunks(self, key, chunk_size):
+        response = self.client.get_object(Bucket=settings.QUERY_RESULTS_PAYLOAD_STORE_S3_BUCKET,
+                                          Key=self.object_key(key))
+        body = response['Body']
+        try:
+            while True:
+                chunk = body.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    def delete(self, key):
+        try:
+            self.client.delete_object(Bucket=settings.QUERY_RESULTS_PAYLOAD_STORE_S3_BUCKET, Key=self.object_key(key))
+        except Exception:
+            logger.warning("Couldn't delete query result payload %s.", key, exc_info=True)
+
+
+stores = {}
+
+
+def register(store_class):
+    if store_class.enabled():
+        stores[store_class.name()] = store_class()
+    else:
+        logger.debug("%s result payload store is not supported (missing dependencies), not registering.",
+                     store_class.name())
+
+
+def get_store(name):
+    try:
+        return stores[name or STORE_INLINE]
+    except KeyError:
+        raise UnknownStoreError("Unknown query result payload store: {}".format(name))
+
+
+def store_for_size(size):
+    """Return the store to use for a new payload of the given size."""
+    name = settings.QUERY_RESULTS_PAYLOAD_STORE
+    if name == STORE_INLINE or size <= settings.QUERY_RESULTS_PAYLOAD_STORE_THRESHOLD:
+        return stores[STORE_INLINE]
+
+    if name not in stores:
+        logger.warning("Query results payload store %s is not available, storing results inline.", name)
+        return stores[STORE_INLINE]
+
+    return stores[name]
+
+
+def delete_payloads(payloads):
+    """Delete the external payloads of deleted results, given as (store name, key) pairs."""
+    for name, key in payloads:
+        if key is not None:
+            get_store(name).delete(key)
+
+
+register(InlinePayloadStore)
+register(FilesystemPayloadStore)
+register(S3PayloadStore)
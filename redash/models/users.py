@@ -18,6 +18,7 @@ from sqlalchemy_utils.models import generic_repr
 from redash import redis_connection
 from redash.utils import generate_token, utcnow, dt_from_timestamp
 
+from . import permissions_cache
 from .base import db, Column, GFKBase
 from .mixins import TimestampMixin, BelongsToOrgMixin
 from .types import json_cast_property, MutableDict, MutableList
@@ -170,9 +171,12 @@ class User(TimestampMixin, db.Model, BelongsToOrgMixin, UserMixin, PermissionsCh
 
     @property
     def permissions(self):
-        # TODO: this should be cached.
-        return list(itertools.chain(*[g.permissions for g in
-                                      Group.query.filter(Group.id.in_(self.group_ids))]))
+        def load():
+            return list(itertools.chain(*[g.permissions for g in
+                                          Group.query.filter(Group.id.in_(self.group_ids))]))
+
+        group_ids = ','.join(str(group_id) for group_id in sorted(self.group_ids or []))
+        return permissions_cache.get('group_permissions', group_ids, load)
 
     @classmethod
     def get_by_org(cls, org):
@@ -2,6 +2,7 @@ import itertools
 from sqlalchemy import union_all
 from redash import redis_connection, __version__, settings
 from redash.models import db, DataSource, Query, QueryResult, Dashboard, Widget
+from redash.tasks import concurrency, dispatcher
 from redash.utils import json_loads
 from redash.worker import celery
 
@@ -41,6 +42,18 @@ def get_queues_status():
     return queues
 
 
+def get_data_sources_concurrency():
+    data_sources = {}
+
+    for data_source in DataSource.query:
+        limit = settings.dynamic_settings.data_source_max_concurrency(data_source)
+        if limit:
+            data_sources[data_source.id] = concurrency.get_status(data_source.id, limit)
+            data_sources[data_source.id]['name'] = data_source.name
+
+    return data_sources
+
+
 def get_db_sizes():
     database_metrics = []
     queries = [
@@ -50,6 +63,7 @@ def get_db_sizes():
     for query_name, query in queries:
         result = db.session.execute(query).first()
         database_metrics.append([query_name, result[0]])
+    database_metrics.append(['Query Results Storage Saved', QueryResult.storage_saved()])
 
     return database_metrics
 
@@ -63,6 +77,8 @@ def get_status():
     status.update(get_object_counts())
     status['manager'] = redis_connection.hgetall('redash:status')
     status['manager']['queues'] = get_queues_status()
+    status['manager']['data_sources_concurrency'] = get_data_sources_concurrency()
+    status['manager']['dispatcher'] = dispatcher.get_status()
     status['database_metrics'] = {}
     status['database_metrics']['metrics'] = get_db_sizes()
 
@@ -96,6 +112,29 @@ def get_waiting_in_queue(queue_name):
     return jobs
 
 
+def get_waiting_jobs(jobs, state):
+    rows = []
+    for job in jobs:
+        args = json_loads(job['task_options']['argsrepr'])
+        if args.get('query_id') == 'adhoc':
+            args['query_id'] = None
+
+        job_row = {
+            'state': state,
+            'task_name': 'redash.tasks.execute_query',
+            'worker': None,
+            'worker_pid': None,
+            'start_time': None,
+            'task_id': job['id'],
+            'queue': job['task_options']['queue']
+        }
+
+        job_row.update(args)
+        rows.append(job_row)
+
+    return rows
+
+
 def parse_tasks(task_lists, state):
     rows = []
 
@@ -132,5 +171,9 @@ def celery_tasks():
 
     for queue_name in get_queues():
         tasks += get_waiting_in_queue(queue_name)
+        tasks += get_waiting_jobs(dispatcher.waiting_jobs(queue_name), 'waiting_for_dispatch')
+
+    for data_source_id, in db.session.query(DataSource.id):
+        tasks += get_waiting_jobs(concurrency.waiting_jobs(data_source_id), 'waiting_for_slot')
 
     return tasks
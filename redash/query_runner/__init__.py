@@ -1,10 +1,14 @@
+import datetime
+import decimal
 import logging
+import re
 
 from dateutil import parser
 import requests
 
 from redash import settings
-from redash.utils import json_loads
+from redash.query_runner import connection_pool
+from redash.utils import JSONEncoder, json_loads
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +27,8 @@ __all__ = [
     'register',
     'get_query_runner',
     'import_query_runners',
-    'guess_type'
+    'guess_type',
+    'infer_column_types'
 ]
 
 # Valid types of columns returned in results:
@@ -55,6 +60,10 @@ class NotSupported(Exception):
 class BaseQueryRunner(object):
     deprecated = False
     noop_query = None
+    # Encoder used to serialize the rows returned by this query runner.
+    json_encoder = JSONEncoder
+    # Number of rows in each batch yielded by run_query_stream.
+    rows_batch_size = 1000
 
     def __init__(self, configuration):
         self.syntax = 'sql'
@@ -91,6 +100,28 @@ class BaseQueryRunner(object):
     def run_query(self, query, user):
         raise NotImplementedError()
 
+    @classmethod
+    def supports_streaming(cls):
+        return False
+
+    def run_query_stream(self, query, user):
+        """Run the query, yielding the list of columns first and then batches (lists) of rows.
+
+        Errors are raised as exceptions. This fallback adapts `run_query`, so the whole result is still loaded into
+        memory; query runners that can fetch rows incrementally override it and `supports_streaming`.
+        """
+        data, error = self.run_query(query, user)
+
+        if error is not None:
+            raise Exception(error)
+
+        data = json_loads(data)
+        yield data['columns']
+
+        rows = data['rows']
+        for i in range(0, len(rows), self.rows_batch_size):
+            yield rows[i:i + self.rows_batch_size]
+
     def fetch_columns(self, columns):
         column_names = []
         duplicates_counter = 1
@@ -129,6 +160,10 @@ class BaseQueryRunner(object):
 
 
 class BaseSQLQueryRunner(BaseQueryRunner):
+    # Whether the connections of the query runner can be reused by the next queries (see
+    # redash.query_runner.connection_pool). Query runners setting it get their connections with _acquire_connection
+    # and hand them back with _release_connection instead of closing them.
+    pool_connections = False
 
     def get_schema(self, get_stats=False):
         schema_dict = {}
@@ -146,6 +181,36 @@ class BaseSQLQueryRunner(BaseQueryRunner):
                 res = self._run_query_internal('select count(*) as cnt from %s' % t)
                 tables_dict[t]['size'] = res[0]['cnt']
 
+    def _get_connection(self):
+        raise NotImplementedError()
+
+    def _acquire_connection(self):
+        if self.pool_connections:
+            return connection_pool.acquire(self)
+        return self._get_connection()
+
+    def _release_connection(self, connection, reusable=True):
+        """Return a connection from _acquire_connection once done with it. Connections that can't be reused (after
+        the query was cancelled, for example) are closed."""
+        if self.pool_connections:
+            connection_pool.release(self, connection, reusable)
+        else:
+            connection.close()
+
+    def _check_connection(self, connection):
+        """Return whether an idle pooled connection still works."""
+        cursor = connection.cursor()
+        try:
+            cursor.execute(self.noop_query)
+            cursor.fetchall()
+        finally:
+            cursor.close()
+        return True
+
+    def _reset_connection(self, connection):
+        """Discard the state the last query left in the connection, before it's returned to the pool."""
+        connection.rollback()
+
 
 class BaseHTTPQueryRunner(BaseQueryRunner):
     response_error = "Endpoint returned unexpected status code"
@@ -272,13 +337,29 @@ def import_query_runners(query_runner_imports):
         __import__(runner_import)
 
 
+# Number of rows infer_column_types looks at to guess the type of a column.
+TYPE_INFERENCE_SAMPLE_SIZE = 1000
+
+# Common date/time representations (ISO 8601 and the default str() of most
+# databases), recognized without going through dateutil.
+ISO_DATETIME_RE = re.compile(
+    r'^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}(:?\d{2})?)?)?$')
+DIGIT_RE = re.compile(r'\d')
+
+
 def guess_type(value):
     if isinstance(value, bool):
         return TYPE_BOOLEAN
-    elif isinstance(value, int):
+    elif isinstance(value, (int, long)):
         return TYPE_INTEGER
-    elif isinstance(value, float):
+    elif isinstance(value, (float, decimal.Decimal)):
         return TYPE_FLOAT
+    elif isinstance(value, datetime.datetime):
+        return TYPE_DATETIME
+    elif isinstance(value, datetime.date):
+        return TYPE_DATE
+    elif value is not None and not isinstance(value, basestring):
+        return TYPE_STRING
 
     return guess_type_from_string(value)
 
@@ -302,10 +383,63 @@ def guess_type_from_string(string_value):
     if unicode(string_value).lower() in ('true', 'false'):
         return TYPE_BOOLEAN
 
+    if ISO_DATETIME_RE.match(string_value):
+        return TYPE_DATETIME
+
+    # dateutil is slow to reject a string, so only try it on values that could
+    # actually hold a date.
+    if not DIGIT_RE.search(string_value):
+        return TYPE_STRING
+
     try:
         parser.parse(string_value)
         return TYPE_DATETIME
     except (ValueError, OverflowError):
         pass
 
-    return TYPE_STRING
\ No newline at end of file
+    return TYPE_STRING
+
+
+def _sample_rows(rows, sample_size):
+    if len(rows) <= sample_size:
+        return rows
+
+    # Spread the sample over the whole result instead of only taking its head,
+    # as results are often sorted by the columns we are trying to guess.
+    step = len(rows) / float(sample_size)
+    return [rows[int(i * step)] for i in range(sample_size)]
+
+
+def infer_column_type(values, guess=guess_type):
+    """Guess the type of a column from (a sample of) its values.
+
+    Empty values are ignored. Columns mixing integers and floats are floats,
+    any other mix of types is a string column.
+    """
+    column_type = None
+
+    for value in values:
+        if value is None or value == '':
+            continue
+
+        value_type = guess(value)
+        if column_type is None or column_type == value_type:
+            column_type = value_type
+        elif set((column_type, value_type)) == set((TYPE_INTEGER, TYPE_FLOAT)):
+            column_type = TYPE_FLOAT
+        else:
+            column_type = TYPE_STRING
+
+        if column_type == TYPE_STRING:
+            # Nothing else can change the type of this column.
+            break
+
+    return column_type or TYPE_STRING
+
+
+def infer_column_types(rows, column_names, guess=guess_type, sample_size=TYPE_INFERENCE_SAMPLE_SIZE):
+    """Return a dict with the type of each of `column_names`, guessed from a
+    sample of `rows` (a list of dicts) with the `guess` function."""
+    sample = _sample_rows(rows, sample_size)
+
+    return dict((name, infer_column_type((row.get(name) for row in sample), guess)) for name in column_names)
@@ -0,0 +1,202 @@
+"""
+Per process pools of query runner connections.
+
+Opening a connection can take longer than running the query itself, especially
+over TLS (Redshift, RDS...). Query runners that support it
+(`BaseSQLQueryRunner.pool_connections`) keep up to ``QUERY_RUNNER_POOL_SIZE``
+idle connections per configuration open in each worker process, and reuse
+them for the next queries of data sources with the same configuration.
+
+Connections are checked before being reused (`_check_connection`) and reset
+when returned to the pool (`_reset_connection`), so no transaction or session
+state carries over from one query to the next. Connections idle for longer
+than ``QUERY_RUNNER_POOL_IDLE_TIMEOUT`` seconds are closed.
+
+Query runners whose clients are thread safe pools of connections themselves
+(like MongoDB's) share a single client per configuration instead
+(`shared_client`), which is closed once unused for as long.
+
+Hits, misses, failed checks and evictions are counted in statsd
+(``query_runner.pool.<runner type>.<event>``).
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from redash import settings
+from redash.utils import json_dumps
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# Pool key -> list of (connection, time it was returned to the pool), most recently used last.
+_pools = {}
+# Pool key -> SharedClient.
+_clients = {}
+_pid = None
+
+
+class SharedClient(object):
+    def __init__(self, client):
+        self.client = client
+        self.last_used = time.time()
+        # Number of queries using the client right now.
+        self.users = 0
+
+
+def _pool_key(runner):
+    configuration = runner.configuration
+    if hasattr(configuration, 'to_json'):
+        configuration = configuration.to_json()
+    else:
+        configuration = json_dumps(configuration, sort_keys=True)
+
+    return runner.type(), hashlib.md5(configuration.encode('utf-8')).hexdigest()
+
+
+def _record(runner, event, count=1):
+    # Query runners are imported before the statsd client is created.
+    from redash import statsd_client
+    statsd_client.incr('query_runner.pool.{}.{}'.format(runner.type(), event), count)
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Exception:
+        logger.debug("Failed closing a pooled connection.", exc_info=True)
+
+
+def _check_pid():
+    global _pid
+
+    if _pid != os.getpid():
+        # Connections opened before a fork belong to the parent process: forget them (without closing them, which
+        # would close them for the parent as well).
+        _pools.clear()
+        _clients.clear()
+        _pid = os.getpid()
+
+
+def _evict_idle(now):
+    evicted = []
+    for key, idle in _pools.items():
+        while idle and now - idle[0][1] > settings.QUERY_RUNNER_POOL_IDLE_TIMEOUT:
+            evicted.append(idle.pop(0)[0])
+        if not idle:
+            del _pools[key]
+    return evicted
+
+
+def _evict_idle_clients(now):
+    evicted = []
+    for key, shared in _clients.items():
+        if not shared.users and now - shared.last_used > settings.QUERY_RUNNER_POOL_IDLE_TIMEOUT:
+            evicted.append(_clients.pop(key).client)
+    return evicted
+
+
+def acquire(runner):
+    """Return a connection for the runner: an idle one from its pool when there's one that still works, otherwise a
+    new one."""
+    if not settings.QUERY_RUNNER_POOL_SIZE:
+        return runner._get_connection()
+
+    key = _pool_key(runner)
+    while True:
+        with _lock:
+            _check_pid()
+            evicted = _evict_idle(time.time())
+            idle = _pools.get(key)
+            connection = idle.pop()[0] if idle else None
+
+        for stale in evicted:
+            _close(stale)
+        if evicted:
+            _record(runner, 'evicted', len(evicted))
+
+        if connection is None:
+            _record(runner, 'miss')
+            return runner._get_connection()
+
+        try:
+            healthy = runner._check_connection(connection)
+        except Exception:
+            healthy = False
+
+        if healthy:
+            _record(runner, 'hit')
+            return connection
+
+        _record(runner, 'unhealthy')
+        _close(connection)
+
+
+def release(runner, connection, reusable=True):
+    """Return the connection to the runner's pool, or close it when it can't be reused (or the pool is full)."""
+    if not settings.QUERY_RUNNER_POOL_SIZE or not reusable:
+        _close(connection)
+        return
+
+    try:
+        runner._reset_connection(connection)
+    except Exception:
+        logger.info("Failed resetting a %s connection, closing it.", runner.type(), exc_info=True)
+        _close(connection)
+        return
+
+    key = _pool_key(runner)
+    with _lock:
+        _check_pid()
+        idle = _pools.setdefault(key, [])
+        if len(idle) < settings.QUERY_RUNNER_POOL_SIZE:
+            idle.append((connection, time.time()))
+            connection = None
+
+    if connection is not None:
+        _close(connection)
+
+
+@contextmanager
+def shared_client(runner, create):
+    """Use the client shared by the queries of the runner's configuration, created with `create()` when there's
+    none. Clients left unused for QUERY_RUNNER_POOL_IDLE_TIMEOUT seconds (after the configuration changed, for
+    example) are closed."""
+    key = _pool_key(runner)
+    with _lock:
+        _check_pid()
+        evicted = _evict_idle_clients(time.time())
+        shared = _clients.get(key)
+        hit = shared is not None
+        if not hit:
+            shared = _clients[key] = SharedClient(create())
+        shared.users += 1
+
+    for client in evicted:
+        _close(client)
+    if evicted:
+        _record(runner, 'evicted', len(evicted))
+    _record(runner, 'hit' if hit else 'miss')
+
+    try:
+        yield shared.client
+    finally:
+        with _lock:
+            shared.users -= 1
+            shared.last_used = time.time()
+
+
+def close_all():
+    """Close all the idle connections and shared clients of this process."""
+    with _lock:
+        _check_pid()
+        connections = [connection for idle in _pools.values() for connection, _ in idle]
+        connections += [shared.client for shared in _clients.values()]
+        _pools.clear()
+        _clients.clear()
+
+    for connection in connections:
+        _close(connection)
@@ -96,8 +96,10 @@ def parse_worksheet(worksheet):
     columns, column_names = _get_columns_and_column_names(worksheet[HEADER_INDEX])
 
     if len(worksheet) > 1:
-        for j, value in enumerate(worksheet[HEADER_INDEX + 1]):
-            columns[j]['type'] = guess_type(value)
+        raw_rows = [dict(zip(column_names, row)) for row in worksheet[HEADER_INDEX + 1:]]
+        types = infer_column_types(raw_rows, column_names)
+        for column in columns:
+            column['type'] = types[column['name']]
 
     column_types = [c['type'] for c in columns]
     rows = [dict(zip(column_names, _value_eval_list(row, column_types))) for row in worksheet[HEADER_INDEX + 1:]]
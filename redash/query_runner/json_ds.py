@@ -6,7 +6,7 @@ import datetime
 from urlparse import urlparse
 from funcy import compact, project
 from redash.utils import json_dumps
-from redash.query_runner import (BaseHTTPQueryRunner, register,
+from redash.query_runner import (BaseHTTPQueryRunner, register, infer_column_types,
                                  TYPE_BOOLEAN, TYPE_DATETIME, TYPE_FLOAT,
                                  TYPE_INTEGER, TYPE_STRING)
 
@@ -58,7 +58,7 @@ def _get_type(value):
     return TYPES_MAP.get(type(value), TYPE_STRING)
 
 
-def add_column(columns, column_name, column_type):
+def add_column(columns, column_name, column_type=None):
     if _get_column_by_name(columns, column_name) is None:
         columns.append({
             "name": column_name,
@@ -67,6 +67,12 @@ def add_column(columns, column_name, column_type):
         })
 
 
+def set_column_types(columns, rows):
+    types = infer_column_types(rows, [c['name'] for c in columns], guess=_get_type)
+    for column in columns:
+        column['type'] = types[column['name']]
+
+
 def _apply_path_search(response, path):
     if path is None:
         return response
@@ -119,18 +125,18 @@ def parse_json(data, path, fields):
                         continue
 
                     value = row[key][inner_key]
-                    add_column(columns, column_name, _get_type(value))
+                    add_column(columns, column_name)
                     parsed_row[column_name] = value
             else:
                 if fields and key not in fields:
                     continue
 
-                value = row[key]
-                add_column(columns, key, _get_type(value))
+                add_column(columns, key)
                 parsed_row[key] = row[key]
 
         rows.append(parsed_row)
 
+    set_column_types(columns, rows)
     columns = _sort_columns_with_fields(columns, fields)
 
     return {'rows': rows, 'columns': columns}
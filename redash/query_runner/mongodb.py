@@ -1,10 +1,13 @@
 import datetime
 import logging
 import re
+from contextlib import contextmanager
 
 from dateutil.parser import parse
 
+from redash import settings
 from redash.query_runner import *
+from redash.query_runner import connection_pool
 from redash.utils import JSONEncoder, json_dumps, json_loads, parse_human_time
 
 logger = logging.getLogger(__name__)
@@ -83,38 +86,60 @@ def _get_column_by_name(columns, column_name):
     return None
 
 
-def parse_results(results):
+def _get_type(value):
+    return TYPES_MAP.get(type(value), TYPE_STRING)
+
+
+def _add_column(columns, columns_by_name, column_name):
+    if column_name not in columns_by_name:
+        column = {
+            "name": column_name,
+            "friendly_name": column_name,
+            "type": None
+        }
+        columns.append(column)
+        columns_by_name[column_name] = column
+
+
+def read_results(results, max_rows=None):
+    """Flatten the documents of `results` (a cursor, or any iterable of documents) into rows, reading no more than
+    `max_rows` of them when given. Returns the rows, the columns and whether there were documents left unread."""
     rows = []
     columns = []
+    columns_by_name = {}
 
     for row in results:
+        if max_rows is not None and len(rows) >= max_rows:
+            return rows, _set_column_types(rows, columns), True
+
         parsed_row = {}
 
-        for key in row:
-            if isinstance(row[key], dict):
-                for inner_key in row[key]:
+        for key, value in row.iteritems():
+            if isinstance(value, dict):
+                for inner_key, inner_value in value.iteritems():
                     column_name = u'{}.{}'.format(key, inner_key)
-                    if _get_column_by_name(columns, column_name) is None:
-                        columns.append({
-                            "name": column_name,
-                            "friendly_name": column_name,
-                            "type": TYPES_MAP.get(type(row[key][inner_key]), TYPE_STRING)
-                        })
-
-                    parsed_row[column_name] = row[key][inner_key]
+                    _add_column(columns, columns_by_name, column_name)
+                    parsed_row[column_name] = inner_value
 
             else:
-                if _get_column_by_name(columns, key) is None:
-                    columns.append({
-                        "name": key,
-                        "friendly_name": key,
-                        "type": TYPES_MAP.get(type(row[key]), TYPE_STRING)
-                    })
-
-                parsed_row[key] = row[key]
+                _add_column(columns, columns_by_name, key)
+                parsed_row[key] = value
 
         rows.append(parsed_row)
 
+    return rows, _set_column_types(rows, columns), False
+
+
+def _set_column_types(rows, columns):
+    types = infer_column_types(rows, [c['name'] for c in columns], guess=_get_type)
+    for column in columns:
+        column['type'] = types[column['name']]
+
+    return columns
+
+
+def parse_results(results):
+    rows, columns, _ = read_results(results)
     return rows, columns
 
 
@@ -157,19 +182,24 @@ class MongoDB(BaseQueryRunner):
 
         self.is_replica_set = True if "replicaSetName" in self.configuration and self.configuration["replicaSetName"] else False
 
-    def _get_db(self):
+    def _get_client(self):
         if self.is_replica_set:
-            db_connection = pymongo.MongoClient(self.configuration["connectionString"],
-                                                replicaSet=self.configuration["replicaSetName"])
-        else:
-            db_connection = pymongo.MongoClient(self.configuration["connectionString"])
+            return pymongo.MongoClient(self.configuration["connectionString"],
+                                       replicaSet=self.configuration["replicaSetName"])
+
+        return pymongo.MongoClient(self.configuration["connectionString"])
 
-        return db_connection[self.db_name]
+    @contextmanager
+    def _get_db(self):
+        # MongoClient keeps its own pool of connections and is thread safe, so all the queries of a worker process
+        # with the same configuration share one.
+        with connection_pool.shared_client(self, self._get_client) as client:
+            yield client[self.db_name]
 
     def test_connection(self):
-        db = self._get_db()
-        if not db.command("connectionStatus")["ok"]:
-            raise Exception("MongoDB connection error")
+        with self._get_db() as db:
+            if not db.command("connectionStatus")["ok"]:
+                raise Exception("MongoDB connection error")
 
     def _merge_property_names(self, columns, document):
         for property in document:
@@ -210,20 +240,22 @@ class MongoDB(BaseQueryRunner):
 
     def get_schema(self, get_stats=False):
         schema = {}
-        db = self._get_db()
-        for collection_name in db.collection_names():
-            if collection_name.startswith('system.'):
-                continue
-            columns = self._get_collection_fields(db, collection_name)
-            schema[collection_name] = {
-                "name": collection_name, "columns": sorted(columns)}
+        with self._get_db() as db:
+            for collection_name in db.collection_names():
+                if collection_name.startswith('system.'):
+                    continue
+                columns = self._get_collection_fields(db, collection_name)
+                schema[collection_name] = {
+                    "name": collection_name, "columns": sorted(columns)}
 
         return schema.values()
 
 
     def run_query(self, query, user):
-        db = self._get_db()
+        with self._get_db() as db:
+            return self._run_query(db, query)
 
+    def _run_query(self, db, query):
         logger.debug("mongodb connection string: %s", self.configuration['connectionString'])
         logger.debug("mongodb got query: %s", query)
 
@@ -268,6 +300,7 @@ class MongoDB(BaseQueryRunner):
 
         columns = []
         rows = []
+        truncated = False
 
         cursor = None
         if q or (not q and not aggregate):
@@ -276,6 +309,8 @@ class MongoDB(BaseQueryRunner):
             else:
                 cursor = db[collection].find(q, f)
 
+            cursor = cursor.batch_size(self.rows_batch_size)
+
             if "skip" in query_data:
                 cursor = cursor.skip(query_data["skip"])
 
@@ -287,7 +322,7 @@ class MongoDB(BaseQueryRunner):
 
         elif aggregate:
             allow_disk_use = query_data.get('allowDiskUse', False)
-            r = db[collection].aggregate(aggregate, allowDiskUse=allow_disk_use)
+            r = db[collection].aggregate(aggregate, allowDiskUse=allow_disk_use, batchSize=self.rows_batch_size)
 
             # Backwards compatibility with older pymongo versions.
             #
@@ -308,16 +343,17 @@ class MongoDB(BaseQueryRunner):
 
             rows.append({ "count" : cursor })
         else:
-            rows, columns = parse_results(cursor)
+            max_rows = settings.MONGODB_MAX_ROWS or None
+            rows, columns, truncated = read_results(cursor, max_rows)
+            if truncated:
+                # Don't leave the rest of the results waiting on the server until the cursor times out.
+                if hasattr(cursor, 'close'):
+                    cursor.close()
+                logger.info("MongoDB query results truncated to %d rows.", max_rows)
 
         if f:
-            ordered_columns = []
-            for k in sorted(f, key=f.get):
-                column = _get_column_by_name(columns, k)
-                if column:
-                    ordered_columns.append(column)
-
-            columns = ordered_columns
+            columns_by_name = dict((column['name'], column) for column in columns)
+            columns = [columns_by_name[k] for k in sorted(f, key=f.get) if k in columns_by_name]
 
         if query_data.get('sortColumns'):
             reverse = query_data['sortColumns'] == 'desc'
@@ -327,6 +363,8 @@ class MongoDB(BaseQueryRunner):
             "columns": columns,
             "rows": rows
         }
+        if truncated:
+            data['metadata'] = {'truncated': True, 'max_rows': max_rows}
         error = None
         json_data = json_dumps(data, cls=MongoDBJSONEncoder)
 
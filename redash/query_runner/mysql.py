@@ -1,6 +1,7 @@
 import logging
 import os
 import threading
+import Queue
 
 from redash.query_runner import *
 from redash.settings import parse_boolean
@@ -34,6 +35,7 @@ class Result(object):
 
 class Mysql(BaseSQLQueryRunner):
     noop_query = "SELECT 1"
+    pool_connections = True
 
     @classmethod
     def configuration_schema(cls):
@@ -131,28 +133,46 @@ class Mysql(BaseSQLQueryRunner):
 
         return schema.values()
 
-    def run_query(self, query, user):
+    def _get_connection(self):
         import MySQLdb
 
+        connection = MySQLdb.connect(host=self.configuration.get('host', ''),
+                                     user=self.configuration.get('user', ''),
+                                     passwd=self.configuration.get('passwd', ''),
+                                     db=self.configuration['db'],
+                                     port=self.configuration.get('port', 3306),
+                                     charset='utf8', use_unicode=True,
+                                     ssl=self._get_ssl_parameters(),
+                                     connect_timeout=60)
+
+        return connection
+
+    def _check_connection(self, connection):
+        connection.ping()
+        return True
+
+    def _reset_connection(self, connection):
+        connection.rollback()
+        # The query might have switched to another database.
+        connection.select_db(self.configuration['db'])
+
+    def run_query(self, query, user):
         ev = threading.Event()
         thread_id = ""
         r = Result()
+        # The query thread hands the connection back when it's done with it.
+        r.reusable = True
         t = None
         try:
-            connection = MySQLdb.connect(host=self.configuration.get('host', ''),
-                                         user=self.configuration.get('user', ''),
-                                         passwd=self.configuration.get('passwd', ''),
-                                         db=self.configuration['db'],
-                                         port=self.configuration.get('port', 3306),
-                                         charset='utf8', use_unicode=True,
-                                         ssl=self._get_ssl_parameters(),
-                                         connect_timeout=60)
+            connection = self._acquire_connection()
             thread_id = connection.thread_id()
             t = threading.Thread(target=self._run_query, args=(query, user, connection, r, ev))
             t.start()
             while not ev.wait(1):
                 pass
         except (KeyboardInterrupt, InterruptException):
+            # The connection is killed along with the query.
+            r.reusable = False
             error = self._cancel(thread_id)
             t.join()
             r.json_data = None
@@ -197,9 +217,108 @@ class Mysql(BaseSQLQueryRunner):
             r.json_data = None
             r.error = e.args[1]
         finally:
+            self._release_connection(connection, r.reusable)
             ev.set()
-            if connection:
-                connection.close()
+
+    @classmethod
+    def supports_streaming(cls):
+        return True
+
+    def run_query_stream(self, query, user):
+        # Like run_query, the query runs in a separate thread so this one stays responsive to signals (cancellation
+        # and time limits). The batches are handed over through a bounded queue, so only a couple of them are held
+        # in memory at any time.
+        connection = self._acquire_connection()
+        thread_id = connection.thread_id()
+        batches = Queue.Queue(maxsize=2)
+        stop = threading.Event()
+        # Whether the query thread is done (or being killed) and only needs to be joined.
+        finished = False
+        # Whether all of the results were read, so the connection can be reused.
+        completed = False
+
+        t = threading.Thread(target=self._stream_query, args=(query, connection, batches, stop))
+        t.start()
+
+        try:
+            while True:
+                try:
+                    kind, value = batches.get(True, 1)
+                except Queue.Empty:
+                    continue
+
+                if kind in ('done', 'error'):
+                    finished = True
+                    if kind == 'error':
+                        raise Exception(value)
+                    completed = True
+                    break
+
+                yield value
+        except (KeyboardInterrupt, InterruptException):
+            finished = True
+            error = self._cancel(thread_id)
+            raise Exception(error or "Query cancelled by user.")
+        finally:
+            stop.set()
+            if not finished and t.is_alive():
+                # The consumer stopped early (an error or a time limit): kill the query instead of waiting for it.
+                self._cancel(thread_id)
+            t.join()
+            self._release_connection(connection, completed)
+
+    def _stream_query(self, query, connection, batches, stop):
+        import MySQLdb
+        from MySQLdb.cursors import SSCursor
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, True, 1)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
+
+        cursor = None
+        try:
+            # An unbuffered cursor, so rows are read from the server as they are consumed.
+            cursor = connection.cursor(SSCursor)
+            logger.debug("MySQL streaming query: %s", query)
+            cursor.execute(query)
+
+            while cursor.description is None:
+                if not cursor.nextset():
+                    put(('error', "No data was returned."))
+                    return
+
+            columns = self.fetch_columns([(i[0], types_map.get(i[1], None)) for i in cursor.description])
+            column_names = [c['name'] for c in columns]
+            if not put(('columns', columns)):
+                return
+
+            while True:
+                rows = cursor.fetchmany(self.rows_batch_size)
+                if not rows:
+                    break
+                if not put(('rows', [dict(zip(column_names, row)) for row in rows])):
+                    return
+
+            # run_query returns the last result set, which can't be known before reading the previous ones.
+            while cursor.nextset():
+                if cursor.description is not None:
+                    put(('error', "Streaming results of queries returning more than one result set isn't supported."))
+                    return
+
+            put(('done', None))
+        except MySQLdb.Error as e:
+            put(('error', e.args[1]))
+        finally:
+            if cursor:
+                try:
+                    cursor.close()
+                except MySQLdb.Error:
+                    pass
 
     def _get_ssl_parameters(self):
         ssl_params = {}
@@ -222,14 +341,7 @@ class Mysql(BaseSQLQueryRunner):
         error = None
 
         try:
-            connection = MySQLdb.connect(host=self.configuration.get('host', ''),
-                                         user=self.configuration.get('user', ''),
-                                         passwd=self.configuration.get('passwd', ''),
-                                         db=self.configuration['db'],
-                                         port=self.configuration.get('port', 3306),
-                                         charset='utf8', use_unicode=True,
-                                         ssl=self._get_ssl_parameters(),
-                                         connect_timeout=60)
+            connection = self._get_connection()
             cursor = connection.cursor()
             query = "KILL %d" % (thread_id)
             logging.debug(query)
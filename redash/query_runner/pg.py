@@ -67,6 +67,11 @@ def _wait(conn, timeout=None):
 
 class PostgreSQL(BaseSQLQueryRunner):
     noop_query = "SELECT 1"
+    json_encoder = PostgreSQLJSONEncoder
+    pool_connections = True
+    # Drops the session state (settings, temporary tables, prepared statements...) the last query left in a pooled
+    # connection.
+    reset_query = "DISCARD ALL"
 
     @classmethod
     def configuration_schema(cls):
@@ -178,9 +183,30 @@ class PostgreSQL(BaseSQLQueryRunner):
 
         return connection
 
+    def _check_connection(self, connection):
+        if connection.closed:
+            return False
+
+        cursor = connection.cursor()
+        cursor.execute(self.noop_query)
+        _wait(connection, timeout=10)
+        cursor.fetchall()
+        return True
+
+    def _reset_connection(self, connection):
+        # Asynchronous connections are in autocommit mode, but the query might have opened a transaction explicitly.
+        cursor = connection.cursor()
+        if connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            cursor.execute("ROLLBACK")
+            _wait(connection)
+        cursor.execute(self.reset_query)
+        _wait(connection)
+
     def run_query(self, query, user):
-        connection = self._get_connection()
+        connection = self._acquire_connection()
         _wait(connection, timeout=10)
+        # Connections are only reused when the query didn't leave them in an unknown state.
+        reusable = True
 
         cursor = connection.cursor()
 
@@ -201,6 +227,7 @@ class PostgreSQL(BaseSQLQueryRunner):
         except (select.error, OSError) as e:
             error = "Query interrupted. Please retry."
             json_data = None
+            reusable = False
         except psycopg2.DatabaseError as e:
             error = e.message
             json_data = None
@@ -208,13 +235,58 @@ class PostgreSQL(BaseSQLQueryRunner):
             connection.cancel()
             error = "Query cancelled by user."
             json_data = None
+            reusable = False
         finally:
-            connection.close()
+            self._release_connection(connection, reusable)
 
         return json_data, error
 
+    @classmethod
+    def supports_streaming(cls):
+        return True
+
+    def run_query_stream(self, query, user):
+        # Asynchronous connections can't use server side cursors, so libpq still receives the whole result set, but
+        # rows are converted to Python objects one batch at a time instead of all at once.
+        connection = self._acquire_connection()
+        _wait(connection, timeout=10)
+        reusable = True
+
+        cursor = connection.cursor()
+
+        try:
+            cursor.execute(query)
+            _wait(connection)
+
+            if cursor.description is None:
+                raise Exception('Query completed but it returned no data.')
+
+            columns = self.fetch_columns([(i[0], types_map.get(i[1], None)) for i in cursor.description])
+            column_names = [c['name'] for c in columns]
+            yield columns
+
+            while True:
+                rows = cursor.fetchmany(self.rows_batch_size)
+                if not rows:
+                    break
+                yield [dict(zip(column_names, row)) for row in rows]
+        except (select.error, OSError):
+            reusable = False
+            raise Exception("Query interrupted. Please retry.")
+        except psycopg2.DatabaseError as e:
+            raise Exception(e.message)
+        except (KeyboardInterrupt, InterruptException):
+            connection.cancel()
+            reusable = False
+            raise Exception("Query cancelled by user.")
+        finally:
+            self._release_connection(connection, reusable)
+
 
 class Redshift(PostgreSQL):
+    # Redshift doesn't support DISCARD.
+    reset_query = "RESET ALL"
+
     @classmethod
     def type(cls):
         return "redshift"
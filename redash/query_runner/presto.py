@@ -97,8 +97,8 @@ class Presto(BaseQueryRunner):
 
         return schema.values()
 
-    def run_query(self, query, user):
-        connection = presto.connect(
+    def _get_connection(self):
+        return presto.connect(
             host=self.configuration.get('host', ''),
             port=self.configuration.get('port', 8080),
             protocol=self.configuration.get('protocol', 'http'),
@@ -107,6 +107,19 @@ class Presto(BaseQueryRunner):
             catalog=self.configuration.get('catalog', 'hive'),
             schema=self.configuration.get('schema', 'default'))
 
+    def _database_error_message(self, db):
+        default_message = 'Unspecified DatabaseError: {0}'.format(
+            db.message)
+        if isinstance(db.message, dict):
+            message = db.message.get(
+                'failureInfo', {'message', None}).get('message')
+        else:
+            message = None
+        return default_message if message is None else message
+
+    def run_query(self, query, user):
+        connection = self._get_connection()
+
         cursor = connection.cursor()
 
         try:
@@ -121,14 +134,7 @@ class Presto(BaseQueryRunner):
             error = None
         except DatabaseError as db:
             json_data = None
-            default_message = 'Unspecified DatabaseError: {0}'.format(
-                db.message)
-            if isinstance(db.message, dict):
-                message = db.message.get(
-                    'failureInfo', {'message', None}).get('message')
-            else:
-                message = None
-            error = default_message if message is None else message
+            error = self._database_error_message(db)
         except (KeyboardInterrupt, InterruptException) as e:
             cursor.cancel()
             error = "Query cancelled by user."
@@ -141,5 +147,37 @@ class Presto(BaseQueryRunner):
 
         return json_data, error
 
+    @classmethod
+    def supports_streaming(cls):
+        return True
+
+    def run_query_stream(self, query, user):
+        # The Presto client fetches the results page by page from the coordinator as they are consumed.
+        connection = self._get_connection()
+
+        cursor = connection.cursor()
+
+        try:
+            cursor.execute(query)
+            if cursor.description is None:
+                raise Exception('Query completed but it returned no data.')
+
+            column_tuples = [(i[0], PRESTO_TYPES_MAPPING.get(i[1], None))
+                             for i in cursor.description]
+            columns = self.fetch_columns(column_tuples)
+            column_names = [c['name'] for c in columns]
+            yield columns
+
+            while True:
+                rows = cursor.fetchmany(self.rows_batch_size)
+                if not rows:
+                    break
+                yield [dict(zip(column_names, r)) for r in rows]
+        except DatabaseError as db:
+            raise Exception(self._database_error_message(db))
+        except (KeyboardInterrupt, InterruptException):
+            cursor.cancel()
+            raise Exception("Query cancelled by user.")
+
 
 register(Presto)
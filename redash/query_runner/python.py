@@ -206,10 +206,11 @@ class Python(BaseQueryRunner):
         if query.latest_query_data is None:
             raise Exception("Query does not have results yet.")
 
-        if query.latest_query_data.data is None:
+        query_result = query.latest_query_data
+        if query_result.payload_key is None and query_result.data is None and query_result.encoded_data is None:
             raise Exception("Query does not have results yet.")
 
-        return json_loads(query.latest_query_data.data)
+        return query.latest_query_data.decoded_data
 
     def get_current_user(self):
         return self._current_user.to_dict()
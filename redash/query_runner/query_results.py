@@ -1,10 +1,20 @@
+import ctypes
+import errno
 import logging
+import os
+import Queue
 import re
 import sqlite3
+import tempfile
+import thread
+import threading
 
-from redash import models
+from flask import current_app
+
+from redash import models, settings
 from redash.permissions import has_access, not_view_only
-from redash.query_runner import BaseQueryRunner, TYPE_STRING, guess_type, register
+from redash.query_runner import (BaseQueryRunner, InterruptException, TYPE_BOOLEAN, TYPE_DATE, TYPE_DATETIME,
+                                  TYPE_FLOAT, TYPE_INTEGER, TYPE_STRING, infer_column_types, register)
 from redash.utils import json_dumps, json_loads
 
 logger = logging.getLogger(__name__)
@@ -41,31 +51,278 @@ def _load_query(user, query_id):
     return query
 
 
+def _run_query(query_runner, query_text, user, query_id):
+    results, error = query_runner.run_query(query_text, user)
+    if error:
+        raise Exception("Failed loading results for query id {}.".format(query_id))
+
+    return json_loads(results)
+
+
 def get_query_results(user, query_id, bring_from_cache):
     query = _load_query(user, query_id)
     if bring_from_cache:
         if query.latest_query_data_id is not None:
-            results = query.latest_query_data.data
+            return query.latest_query_data.decoded_data
         else:
             raise Exception("No cached result available for query {}.".format(query.id))
-    else:
-        results, error = query.data_source.query_runner.run_query(query.query_text, user)
-        if error:
-            raise Exception("Failed loading results for query id {}.".format(query.id))
 
-    return json_loads(results)
+    return _run_query(query.data_source.query_runner, query.query_text, user, query.id)
+
+
+def _interrupt_thread(thread_id):
+    # Raise InterruptException in the given thread, which is how query runners get cancelled. It's only delivered once
+    # the thread runs Python code again (e.g. when a runner wakes up to check on its query).
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_long(thread_id), ctypes.py_object(InterruptException))
+
+
+def _clear_interrupt(thread_id):
+    # Drop an InterruptException raised in the given thread that wasn't delivered yet.
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_long(thread_id), None)
+
 
+class ConcurrentQueries(object):
+    """Runs queries in a bounded pool of threads.
 
-def create_tables_from_query_ids(user, connection, query_ids, cached_query_ids=[]):
-    for query_id in set(cached_query_ids):
-        results = get_query_results(user, query_id, True)
-        table_name = 'cached_query_{query_id}'.format(query_id=query_id)
-        create_table(connection, table_name, results)
+    The results are collected in the calling thread, so it stays responsive to signals (like Celery's soft time
+    limit). Call `cancel` when giving up on them: the queries still running get interrupted and the ones that didn't
+    start yet are dropped.
+    """
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.pending = Queue.Queue()
+        self.results = Queue.Queue()
+        # The threads running a query, by the query's key. Only they get interrupted by `cancel`.
+        self.running = {}
+        self.lock = threading.Lock()
+        self.count = 0
 
+    def submit(self, key, fn, *args):
+        self.pending.put((key, fn, args))
+        self.count += 1
+
+    def _run(self, key, fn, args):
+        with self.lock:
+            self.running[key] = thread.get_ident()
+        try:
+            return key, fn(*args), None
+        except Exception as e:
+            return key, None, e
+        finally:
+            with self.lock:
+                self.running.pop(key, None)
+                # `cancel` leaves the thread alone from now on, but it might have interrupted it as `fn` returned.
+                _clear_interrupt(thread.get_ident())
+
+    def _work(self, app):
+        # Each thread gets its own application context (and database session), as the query runners might use it.
+        with app.app_context():
+            while True:
+                try:
+                    key, fn, args = self.pending.get_nowait()
+                except Queue.Empty:
+                    return
+
+                try:
+                    result = self._run(key, fn, args)
+                except InterruptException as e:
+                    # Interrupted as `fn` returned, and delivered only while leaving `_run`.
+                    with self.lock:
+                        self.running.pop(key, None)
+                    result = key, None, e
+                self.results.put(result)
+
+    def start(self):
+        app = current_app._get_current_object()
+        for _ in range(min(self.max_workers, self.count)):
+            worker = threading.Thread(target=self._work, args=(app,))
+            worker.daemon = True
+            worker.start()
+
+    def wait(self):
+        """Return the results by key once all the queries finished, raising the error of the first one to fail."""
+        collected = {}
+        while len(collected) < self.count:
+            try:
+                key, result, error = self.results.get(True, 1)
+            except Queue.Empty:
+                continue
+
+            if error is not None:
+                raise error
+
+            collected[key] = result
+
+        return collected
+
+    def cancel(self):
+        while True:
+            try:
+                self.pending.get_nowait()
+            except Queue.Empty:
+                break
+
+        with self.lock:
+            for thread_id in self.running.values():
+                _interrupt_thread(thread_id)
+
+
+def create_tables_from_query_ids(user, connection, query_ids, cached_query_ids=[], typed_columns=False):
+    # Permissions are checked (and data sources loaded) in this thread, before running the queries in other threads.
+    queries = ConcurrentQueries(settings.QUERY_RESULTS_MAX_CONCURRENT_QUERIES)
     for query_id in set(query_ids):
-        results = get_query_results(user, query_id, False)
+        query = _load_query(user, query_id)
+        queries.submit(query.id, _run_query, query.data_source.query_runner, query.query_text, user, query.id)
+
+    queries.start()
+
+    try:
+        # Load the cached results while the other queries run.
+        cache = MaterializationCache.from_settings(typed_columns)
+        for query_id in set(cached_query_ids):
+            table_name = 'cached_query_{query_id}'.format(query_id=query_id)
+            if cache is not None:
+                query = _load_query(user, query_id)
+                if query.latest_query_data_id is not None and cache.attach(connection, table_name,
+                                                                           query.latest_query_data):
+                    continue
+
+            results = get_query_results(user, query_id, True)
+            create_table(connection, table_name, results, typed_columns)
+
+        query_results = queries.wait()
+    finally:
+        # A no-op when all of them finished; otherwise a query failed or this thread was interrupted (for example by
+        # the soft time limit of the task), so the other queries are pointless.
+        queries.cancel()
+
+    for query_id, results in query_results.items():
         table_name = 'query_{query_id}'.format(query_id=query_id)
-        create_table(connection, table_name, results)
+        create_table(connection, table_name, results, typed_columns)
+
+
+class MaterializationCache(object):
+    """Keeps cached query results loaded in SQLite database files, one per query result, so queries using the same
+    results don't have to load them again. They get attached to the query's database instead.
+
+    The least recently used files are removed once the total size goes over `max_bytes`.
+    """
+    # SQLite's default limit of attached databases.
+    max_attached = 10
+
+    def __init__(self, directory, max_bytes, typed_columns=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.typed_columns = typed_columns
+        self.attached = {}
+
+    @classmethod
+    def from_settings(cls, typed_columns=False):
+        if not settings.QUERY_RESULTS_CACHE_DIR:
+            return None
+
+        return cls(settings.QUERY_RESULTS_CACHE_DIR, settings.QUERY_RESULTS_CACHE_MAX_BYTES, typed_columns)
+
+    def _schema(self, query_result_id):
+        # Tables with and without column types are kept apart.
+        return 'query_result_{}{}'.format(query_result_id, '_typed' if self.typed_columns else '')
+
+    def path(self, query_result_id):
+        return os.path.join(self.directory, '{}.sqlite'.format(self._schema(query_result_id)))
+
+    def attach(self, connection, table_name, query_result):
+        """Make `table_name` a view of the materialized query result. Returns False when the result can't be
+        attached (too many attached databases), in which case it should be loaded into the database directly."""
+        schema = self._schema(query_result.id)
+
+        if schema not in self.attached:
+            if len(self.attached) >= self.max_attached:
+                return False
+
+            path = self.path(query_result.id)
+            if not os.path.exists(path):
+                self._materialize(path, query_result)
+
+            connection.execute("ATTACH DATABASE ? AS {}".format(schema), (path,))
+            tables = connection.execute("SELECT name FROM {}.sqlite_master WHERE type = 'table'".format(schema))
+            if ('results',) not in tables.fetchall():
+                # The file was removed after checking for it (and ATTACH created an empty one): start over.
+                connection.execute("DETACH DATABASE {}".format(schema))
+                os.remove(path)
+                self._materialize(path, query_result)
+                connection.execute("ATTACH DATABASE ? AS {}".format(schema), (path,))
+
+            self.attached[schema] = path
+            os.utime(path, None)
+            self._evict()
+
+        connection.execute("CREATE TEMP VIEW {} AS SELECT * FROM {}.results".format(table_name, schema))
+        return True
+
+    def _materialize(self, path, query_result):
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        # Build it in a temporary file and rename it when done, as other workers might be using the same directory.
+        fd, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            connection = sqlite3.connect(temporary_path)
+            try:
+                connection.execute("PRAGMA journal_mode = OFF")
+                create_table(connection, 'results', query_result.decoded_data, self.typed_columns)
+            finally:
+                connection.close()
+            os.rename(temporary_path, path)
+        except Exception:
+            os.remove(temporary_path)
+            raise
+
+    def _evict(self):
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.sqlite') or path in self.attached.values():
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in files)
+        total_bytes += sum(os.path.getsize(path) for path in self.attached.values())
+
+        for _, size, path in sorted(files):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_bytes -= size
+
+
+# SQLite column affinity for each column type, declared with the data source's typed columns option. Dates are stored as
+# ISO 8601 strings.
+COLUMN_AFFINITIES = {
+    TYPE_INTEGER: 'INTEGER',
+    TYPE_BOOLEAN: 'INTEGER',
+    TYPE_FLOAT: 'REAL',
+    TYPE_STRING: 'TEXT',
+    TYPE_DATETIME: 'TEXT',
+    TYPE_DATE: 'TEXT',
+}
+
+# Matches a loaded query result table in a FROM/JOIN clause and its alias (unless it's followed by a keyword).
+TABLE_REFERENCE_RE = re.compile(
+    r'(?:join|from)\s+((?:cached_)?query_\d+)'
+    r'(?:\s+(?:as\s+)?'
+    r'(?!(?:on|using|join|inner|left|right|full|outer|cross|natural|where|group|order|limit|union|having)\b)(\w+))?',
+    re.IGNORECASE)
 
 
 def fix_column_name(name):
@@ -79,15 +336,23 @@ def flatten(value):
         return value
 
 
-def create_table(connection, table_name, query_results):
+def create_table(connection, table_name, query_results, typed_columns=False):
+    """Load the results into a new table. With `typed_columns`, the columns get the affinity of their type, so
+    SQLite converts and compares their values as numbers or text (e.g. '1' = 1 holds for an integer column), instead of
+    keeping them as they were returned."""
     try:
         columns = [column['name']
                    for column in query_results['columns']]
         safe_columns = [fix_column_name(column) for column in columns]
+        if typed_columns:
+            column_definitions = [u"{} {}".format(safe_column, COLUMN_AFFINITIES.get(column.get('type'), '')).strip()
+                                  for safe_column, column in zip(safe_columns, query_results['columns'])]
+        else:
+            column_definitions = safe_columns
 
         column_list = ", ".join(safe_columns)
-        create_table = u"CREATE TABLE {table_name} ({column_list})".format(
-            table_name=table_name, column_list=column_list)
+        create_table = u"CREATE TABLE {table_name} ({column_definitions})".format(
+            table_name=table_name, column_definitions=", ".join(column_definitions))
         logger.debug("CREATE TABLE query: %s", create_table)
         connection.execute(create_table)
     except sqlite3.OperationalError as exc:
@@ -98,9 +363,39 @@ def create_table(connection, table_name, query_results):
         column_list=column_list,
         place_holders=','.join(['?'] * len(columns)))
 
-    for row in query_results['rows']:
-        values = [flatten(row.get(column)) for column in columns]
-        connection.execute(insert_template, values)
+    # A single executemany call (and transaction) for all the rows.
+    with connection:
+        connection.executemany(insert_template,
+                               ([flatten(row.get(column)) for column in columns] for row in query_results['rows']))
+
+
+def extract_join_columns(query):
+    """Return the (table name, column name) pairs compared for equality in the query, where the table is one of the
+    query results loaded for it (referenced directly or through an alias)."""
+    tables = {}
+    for table_name, alias in TABLE_REFERENCE_RE.findall(query):
+        tables[table_name.lower()] = table_name
+        if alias:
+            tables[alias.lower()] = table_name
+
+    join_columns = []
+    for match in re.findall(r'(\w+)\.(\w+|"[^"]+")\s*=\s*(\w+)\.(\w+|"[^"]+")', query):
+        for table, column in (match[0:2], match[2:4]):
+            table_name = tables.get(table.lower())
+            if table_name is not None and (table_name, column) not in join_columns:
+                join_columns.append((table_name, column))
+
+    return join_columns
+
+
+def create_join_indexes(connection, query):
+    for table_name, column in extract_join_columns(query):
+        index_name = u'"{}_{}_idx"'.format(table_name, re.sub(r'\W', '_', column.strip('"'), flags=re.UNICODE))
+        try:
+            connection.execute(u"CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(index_name, table_name, column))
+        except sqlite3.OperationalError as exc:
+            # Most likely not a column of this table; the query will report it if it matters.
+            logger.debug(u"Skipping index on %s.%s: %s", table_name, column, exc.message)
 
 
 class Results(BaseQueryRunner):
@@ -111,6 +406,15 @@ class Results(BaseQueryRunner):
         return {
             "type": "object",
             "properties": {
+                "create_join_indexes": {
+                    "type": "boolean",
+                    "title": "Create indexes on the columns used in join conditions"
+                },
+                "typed_columns": {
+                    "type": "boolean",
+                    "title": "Declare the types of the columns of query results (numeric values are compared as "
+                             "numbers, which changes the results of some queries)"
+                }
             }
         }
 
@@ -127,7 +431,12 @@ class Results(BaseQueryRunner):
 
         query_ids = extract_query_ids(query)
         cached_query_ids = extract_cached_query_ids(query)
-        create_tables_from_query_ids(user, connection, query_ids, cached_query_ids)
+        create_tables_from_query_ids(user, connection, query_ids, cached_query_ids,
+                                     self.configuration.get('typed_columns', False))
+        if self.configuration.get('create_join_indexes', False):
+            create_join_indexes(connection, query)
+        # Materialized results are shared with other queries: make sure they can't be modified.
+        connection.execute("PRAGMA query_only = ON")
 
         cursor = connection.cursor()
 
@@ -138,19 +447,12 @@ class Results(BaseQueryRunner):
                 columns = self.fetch_columns(
                     [(i[0], None) for i in cursor.description])
 
-                rows = []
                 column_names = [c['name'] for c in columns]
+                rows = [dict(zip(column_names, row)) for row in cursor]
 
-                for i, row in enumerate(cursor):
-                    for j, col in enumerate(row):
-                        guess = guess_type(col)
-
-                        if columns[j]['type'] is None:
-                            columns[j]['type'] = guess
-                        elif columns[j]['type'] != guess:
-                            columns[j]['type'] = TYPE_STRING
-
-                    rows.append(dict(zip(column_names, row)))
+                column_types = infer_column_types(rows, column_names)
+                for column in columns:
+                    column['type'] = column_types[column['name']]
 
                 data = {'columns': columns, 'rows': rows}
                 error = None
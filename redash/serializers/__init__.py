@@ -12,7 +12,8 @@ from redash.permissions import has_access, view_only
 from redash.utils import json_loads
 from redash.models.parameterized_query import ParameterizedQuery
 
-from .query_result import serialize_query_result, serialize_query_result_to_csv, serialize_query_result_to_xlsx
+from .query_result import (serialize_query_result, serialize_query_result_to_csv, serialize_query_result_to_xlsx,
+                           stream_query_result_to_csv, stream_query_result_to_json, stream_query_result_to_xlsx)
 
 
 def public_widget(widget):
@@ -186,16 +187,36 @@ def serialize_alert(alert, full=True):
     return d
 
 
+def query_access_checker(queries, user):
+    """Return a function telling whether `user` has view only access to one of `queries`, which loads the
+    permissions of all their data sources at once."""
+    if user is None:
+        return lambda query: False
+
+    if user.is_api_user():
+        # API keys give access to specific objects, not data sources.
+        return lambda query: has_access(query, user, view_only)
+
+    groups = models.DataSourceGroup.groups_by_data_source(set(query.data_source_id for query in queries))
+    allowed = set(data_source_id for data_source_id, data_source_groups in groups.iteritems()
+                  if has_access(data_source_groups, user, view_only))
+
+    return lambda query: query.data_source_id in allowed
+
+
 def serialize_dashboard(obj, with_widgets=False, user=None, with_favorite_state=True):
     layout = json_loads(obj.layout)
 
     widgets = []
 
     if with_widgets:
-        for w in obj.widgets:
+        widget_list = obj.load_widgets()
+        can_view = query_access_checker([w.visualization.query_rel for w in widget_list if w.visualization], user)
+
+        for w in widget_list:
             if w.visualization_id is None:
                 widgets.append(serialize_widget(w))
-            elif user and has_access(w.visualization.query_rel, user, view_only):
+            elif can_view(w.visualization.query_rel):
                 widgets.append(serialize_widget(w))
             else:
                 widget = project(serialize_widget(w),
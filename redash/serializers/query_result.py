@@ -1,12 +1,20 @@
 import cStringIO
 import csv
+import tempfile
+
 import xlsxwriter
 from funcy import rpartial, project
 from dateutil.parser import isoparse as parse_date
-from redash.utils import json_loads, UnicodeWriter
+from redash.models import result_codecs
+from redash.utils import UnicodeWriter, json_dumps
 from redash.query_runner import (TYPE_BOOLEAN, TYPE_DATE, TYPE_DATETIME)
 from redash.authentication.org_resolving import current_org
 
+# Size of the chunks streamed by the CSV and XLSX exports.
+EXPORT_CHUNK_SIZE = 64 * 1024
+# XLSX exports larger than this are spooled to disk.
+XLSX_MAX_MEMORY_SIZE = 10 * 1024 * 1024
+
 
 def _convert_format(fmt):
     return fmt.replace('DD', '%d').replace('MM', '%m').replace('YYYY', '%Y').replace('YY', '%y').replace('HH', '%H').replace('mm', '%M').replace('ss', '%s')
@@ -65,46 +73,107 @@ def serialize_query_result(query_result, is_api_user):
         return query_result.to_dict()
 
 
+def stream_query_result_to_json(query_result):
+    """Return an iterator over the chunks of the JSON representation of the result (`{"query_result": {...}}`).
+
+    Results stored with the JSON codec are streamed as stored (from the external payload store, for large results),
+    without being decoded and encoded again.
+    """
+    if query_result.data_codec not in (None, result_codecs.CODEC_JSON):
+        return iter([json_dumps({'query_result': query_result.to_dict()})])
+
+    metadata = json_dumps(query_result.to_dict(with_data=False))
+    return _generate_json(metadata, query_result.iter_payload(EXPORT_CHUNK_SIZE))
+
+
+def _generate_json(metadata, payload_chunks):
+    yield '{{"query_result": {}, "data": '.format(metadata[:-1])
+    for chunk in payload_chunks:
+        yield chunk
+    yield '}}'
+
+
 def serialize_query_result_to_csv(query_result):
-    s = cStringIO.StringIO()
+    return ''.join(stream_query_result_to_csv(query_result))
 
-    query_data = json_loads(query_result.data)
+
+def stream_query_result_to_csv(query_result):
+    """Return an iterator over the chunks of the CSV export of the result.
+
+    The result is decoded (and the org settings read) right away, so errors
+    surface before a response starts streaming.
+    """
+    query_data = query_result.decode_data(lazy_rows=True)
 
     fieldnames, special_columns = _get_column_lists(query_data['columns'])
 
+    return _generate_csv(query_data['rows'], fieldnames, special_columns)
+
+
+def _generate_csv(rows, fieldnames, special_columns):
+    s = cStringIO.StringIO()
+
     writer = csv.DictWriter(s, extrasaction="ignore", fieldnames=fieldnames)
     writer.writer = UnicodeWriter(s)
     writer.writeheader()
 
-    for row in query_data['rows']:
+    for row in rows:
         for col_name, converter in special_columns.iteritems():
             if col_name in row:
                 row[col_name] = converter(row[col_name])
 
         writer.writerow(row)
 
-    return s.getvalue()
+        if s.tell() >= EXPORT_CHUNK_SIZE:
+            yield s.getvalue()
+            s.seek(0)
+            s.truncate()
+
+    yield s.getvalue()
 
 
 def serialize_query_result_to_xlsx(query_result):
-    s = cStringIO.StringIO()
+    return ''.join(stream_query_result_to_xlsx(query_result))
 
-    query_data = json_loads(query_result.data)
-    book = xlsxwriter.Workbook(s, {'constant_memory': True})
-    sheet = book.add_worksheet("result")
 
-    column_names = []
-    for (c, col) in enumerate(query_data['columns']):
-        sheet.write(0, c, col['name'])
-        column_names.append(col['name'])
+def stream_query_result_to_xlsx(query_result):
+    """Return an iterator over the chunks of the XLSX export of the result.
 
-    for (r, row) in enumerate(query_data['rows']):
-        for (c, name) in enumerate(column_names):
-            v = row.get(name)
-            if isinstance(v, list) or isinstance(v, dict):
-                v = str(v).encode('utf-8')
-            sheet.write(r + 1, c, v)
+    The workbook is written in constant memory mode to a temporary file (kept
+    in memory while small), which is then streamed.
+    """
+    query_data = query_result.decode_data(lazy_rows=True)
 
-    book.close()
+    f = tempfile.SpooledTemporaryFile(max_size=XLSX_MAX_MEMORY_SIZE)
+    try:
+        book = xlsxwriter.Workbook(f, {'constant_memory': True})
+        sheet = book.add_worksheet("result")
+
+        column_names = []
+        for (c, col) in enumerate(query_data['columns']):
+            sheet.write(0, c, col['name'])
+            column_names.append(col['name'])
+
+        for (r, row) in enumerate(query_data['rows']):
+            for (c, name) in enumerate(column_names):
+                v = row.get(name)
+                if isinstance(v, list) or isinstance(v, dict):
+                    v = str(v).encode('utf-8')
+                sheet.write(r + 1, c, v)
+
+        book.close()
+    except Exception:
+        f.close()
+        raise
+
+    f.seek(0)
+
+    return _generate_file_chunks(f)
 
-    return s.getvalue()
+
+def _generate_file_chunks(f):
+    try:
+        for chunk in iter(lambda: f.read(EXPORT_CHUNK_SIZE), ''):
+            yield chunk
+    finally:
+        f.close()
@@ -48,8 +48,28 @@ CELERY_RESULT_SERIALIZER = os.environ.get("REDASH_CELERY_RESULT_SERIALIZER", "js
 
 # The following enables periodic job (every 5 minutes) of removing unused query results.
 QUERY_RESULTS_CLEANUP_ENABLED = parse_boolean(os.environ.get("REDASH_QUERY_RESULTS_CLEANUP_ENABLED", "true"))
+# Size of the first batch of results deleted by each run. Following batches grow or shrink to take about
+# QUERY_RESULTS_CLEANUP_BATCH_DURATION seconds each, until the run took QUERY_RESULTS_CLEANUP_TIME_BUDGET seconds.
 QUERY_RESULTS_CLEANUP_COUNT = int(os.environ.get("REDASH_QUERY_RESULTS_CLEANUP_COUNT", "100"))
+QUERY_RESULTS_CLEANUP_MAX_COUNT = int(os.environ.get("REDASH_QUERY_RESULTS_CLEANUP_MAX_COUNT", "10000"))
+QUERY_RESULTS_CLEANUP_BATCH_DURATION = float(os.environ.get("REDASH_QUERY_RESULTS_CLEANUP_BATCH_DURATION", "1"))
+QUERY_RESULTS_CLEANUP_TIME_BUDGET = int(os.environ.get("REDASH_QUERY_RESULTS_CLEANUP_TIME_BUDGET", "120"))
 QUERY_RESULTS_CLEANUP_MAX_AGE = int(os.environ.get("REDASH_QUERY_RESULTS_CLEANUP_MAX_AGE", "7"))
+# Partition the query_results table by retrieved_at when running the migrations (see redash/models/partitions.py;
+# existing installations can use `manage.py database partition_query_results` instead), and the length of each
+# partition, in days. Expired partitions are dropped as a whole by the cleanup job.
+QUERY_RESULTS_PARTITIONING = parse_boolean(os.environ.get("REDASH_QUERY_RESULTS_PARTITIONING", "false"))
+QUERY_RESULTS_PARTITION_DAYS = int(os.environ.get("REDASH_QUERY_RESULTS_PARTITION_DAYS", "7"))
+
+# Where to store the payloads of query results larger than QUERY_RESULTS_PAYLOAD_STORE_THRESHOLD bytes: inline (in
+# the database), filesystem (under QUERY_RESULTS_PAYLOAD_STORE_PATH) or s3 (see redash/models/result_stores.py).
+QUERY_RESULTS_PAYLOAD_STORE = os.environ.get("REDASH_QUERY_RESULTS_PAYLOAD_STORE", "inline")
+QUERY_RESULTS_PAYLOAD_STORE_THRESHOLD = int(os.environ.get("REDASH_QUERY_RESULTS_PAYLOAD_STORE_THRESHOLD",
+                                                           str(5 * 1024 * 1024)))
+QUERY_RESULTS_PAYLOAD_STORE_PATH = os.environ.get("REDASH_QUERY_RESULTS_PAYLOAD_STORE_PATH", "/var/lib/redash/results")
+QUERY_RESULTS_PAYLOAD_STORE_S3_BUCKET = os.environ.get("REDASH_QUERY_RESULTS_PAYLOAD_STORE_S3_BUCKET", "")
+QUERY_RESULTS_PAYLOAD_STORE_S3_PREFIX = os.environ.get("REDASH_QUERY_RESULTS_PAYLOAD_STORE_S3_PREFIX", "query_results/")
+QUERY_RESULTS_PAYLOAD_STORE_S3_ENDPOINT_URL = os.environ.get("REDASH_QUERY_RESULTS_PAYLOAD_STORE_S3_ENDPOINT_URL", "")
 
 SCHEMAS_REFRESH_SCHEDULE = int(os.environ.get("REDASH_SCHEMAS_REFRESH_SCHEDULE", 30))
 SCHEMAS_REFRESH_QUEUE = os.environ.get("REDASH_SCHEMAS_REFRESH_QUEUE", "celery")
@@ -193,6 +213,16 @@ LDAP_SEARCH_DN = os.environ.get('REDASH_LDAP_SEARCH_DN', os.environ.get('REDASH_
 STATIC_ASSETS_PATH = fix_assets_path(os.environ.get("REDASH_STATIC_ASSETS_PATH", "../client/dist/"))
 
 JOB_EXPIRY_TIME = int(os.environ.get("REDASH_JOB_EXPIRY_TIME", 3600 * 12))
+# How long the execution slot of a running job on a data source with a concurrency limit (see
+# dynamic_settings.data_source_max_concurrency) is kept without hearing from the job, before it's considered lost with
+# the job's worker. Running jobs refresh their slot every third of this time. Jobs still waiting in their Celery queue
+# keep their slot for up to JOB_EXPIRY_TIME.
+DATA_SOURCE_SLOT_TIMEOUT = int(os.environ.get("REDASH_DATA_SOURCE_SLOT_TIMEOUT", 3600))
+# Keep query jobs in Redis and send them to their Celery queue, in weighted fair order between orgs and users (see
+# dynamic_settings.org_query_weight and user_query_weight), only when it has no more than QUERY_DISPATCHER_BACKLOG jobs
+# waiting for a worker.
+QUERY_DISPATCHER_ENABLED = parse_boolean(os.environ.get("REDASH_QUERY_DISPATCHER_ENABLED", "false"))
+QUERY_DISPATCHER_BACKLOG = int(os.environ.get("REDASH_QUERY_DISPATCHER_BACKLOG", 2))
 
 LOG_LEVEL = os.environ.get("REDASH_LOG_LEVEL", "INFO")
 LOG_STDOUT = parse_boolean(os.environ.get('REDASH_LOG_STDOUT', 'false'))
@@ -299,6 +329,12 @@ disabled_query_runners = array_from_string(os.environ.get("REDASH_DISABLED_QUERY
 
 QUERY_RUNNERS = remove(set(disabled_query_runners), distinct(enabled_query_runners + additional_query_runners))
 
+# Number of idle connections query runners supporting it keep open per data source configuration, in each worker
+# process, to reuse for the next queries (0 disables pooling). Idle connections are closed after
+# QUERY_RUNNER_POOL_IDLE_TIMEOUT seconds.
+QUERY_RUNNER_POOL_SIZE = int(os.environ.get("REDASH_QUERY_RUNNER_POOL_SIZE", "0"))
+QUERY_RUNNER_POOL_IDLE_TIMEOUT = int(os.environ.get("REDASH_QUERY_RUNNER_POOL_IDLE_TIMEOUT", "300"))
+
 dynamic_settings = importlib.import_module(os.environ.get('REDASH_DYNAMIC_SETTINGS_MODULE', 'redash.settings.dynamic_settings'))
 
 # Destinations
@@ -338,6 +374,19 @@ FEATURE_SHOW_QUERY_RESULTS_COUNT = parse_boolean(os.environ.get("REDASH_FEATURE_
 FEATURE_ALLOW_CUSTOM_JS_VISUALIZATIONS = parse_boolean(os.environ.get("REDASH_FEATURE_ALLOW_CUSTOM_JS_VISUALIZATIONS", "false"))
 FEATURE_AUTO_PUBLISH_NAMED_QUERIES = parse_boolean(os.environ.get("REDASH_FEATURE_AUTO_PUBLISH_NAMED_QUERIES", "true"))
 FEATURE_EXTENDED_ALERT_OPTIONS = parse_boolean(os.environ.get("REDASH_FEATURE_EXTENDED_ALERT_OPTIONS", "false"))
+# Fetch and store results incrementally with the query runners that support it:
+FEATURE_STREAM_QUERY_RESULTS = parse_boolean(os.environ.get("REDASH_FEATURE_STREAM_QUERY_RESULTS", "false"))
+
+# Query Results data source: how many of the referenced (non cached) queries to run at the same time.
+QUERY_RESULTS_MAX_CONCURRENT_QUERIES = int(os.environ.get("REDASH_QUERY_RESULTS_MAX_CONCURRENT_QUERIES", "4"))
+# Directory where it keeps cached query results loaded into SQLite files, to reuse them across queries (disabled when
+# empty), and the maximum total size of these files.
+QUERY_RESULTS_CACHE_DIR = os.environ.get("REDASH_QUERY_RESULTS_CACHE_DIR", "")
+QUERY_RESULTS_CACHE_MAX_BYTES = int(os.environ.get("REDASH_QUERY_RESULTS_CACHE_MAX_BYTES", str(1024 ** 3)))
+
+# Permission checks cache the data source groups and dashboard API keys they use for the duration of a request. When
+# set, they are also cached in Redis for this many seconds (shared by all the requests).
+PERMISSIONS_CACHE_TTL = int(os.environ.get("REDASH_PERMISSIONS_CACHE_TTL", "0"))
 
 # BigQuery
 BIGQUERY_HTTP_TIMEOUT = int(os.environ.get("REDASH_BIGQUERY_HTTP_TIMEOUT", "600"))
@@ -355,6 +404,11 @@ KYLIN_OFFSET = int(os.environ.get('REDASH_KYLIN_OFFSET', 0))
 KYLIN_LIMIT = int(os.environ.get('REDASH_KYLIN_LIMIT', 50000))
 KYLIN_ACCEPT_PARTIAL = parse_boolean(os.environ.get("REDASH_KYLIN_ACCEPT_PARTIAL", "false"))
 
+# mongodb
+# Maximum number of rows read from the results of a MongoDB query (0 for no limit). Results with more rows are
+# truncated, which is reported in their metadata.
+MONGODB_MAX_ROWS = int(os.environ.get('REDASH_MONGODB_MAX_ROWS', 0))
+
 # sqlparse
 SQLPARSE_FORMAT_OPTIONS = {
     'reindent': parse_boolean(os.environ.get('SQLPARSE_FORMAT_REINDENT', 'true')),
@@ -10,6 +10,23 @@ def query_time_limit(is_scheduled, user_id, org_id):
     return scheduled_time_limit if is_scheduled else adhoc_time_limit
 
 
+# Replace this method with your own implementation in case you want to limit the number of queries running at once on
+# certain data sources. Queries over the limit wait for one of the running queries to finish. None means no limit.
+def data_source_max_concurrency(data_source):
+    return int_or_none(os.environ.get('REDASH_DATA_SOURCE_MAX_CONCURRENCY', None))
+
+
+# Replace these methods with your own implementation in case you want some orgs or users to get a bigger share of the
+# query workers, when jobs wait to be sent to them (with REDASH_QUERY_DISPATCHER_ENABLED). An org or user with twice
+# the weight of another gets twice as many of its queries executed while both have queries waiting.
+def org_query_weight(org_id):
+    return 1
+
+
+def user_query_weight(user_id, is_api_key, org_id):
+    return 1
+
+
 # Provide any custom tasks you'd like to run periodically
 def custom_tasks():
     return {
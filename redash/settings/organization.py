@@ -33,6 +33,9 @@ JWT_AUTH_HEADER_NAME = os.environ.get("REDASH_JWT_AUTH_HEADER_NAME", "")
 FEATURE_SHOW_PERMISSIONS_CONTROL = parse_boolean(os.environ.get("REDASH_FEATURE_SHOW_PERMISSIONS_CONTROL", "false"))
 SEND_EMAIL_ON_FAILED_SCHEDULED_QUERIES = parse_boolean(
     os.environ.get('REDASH_SEND_EMAIL_ON_FAILED_SCHEDULED_QUERIES', 'false'))
+# How new query results are stored: "json" (row-oriented JSON text), "columnar_zlib" or "columnar_lz4".
+# See redash/models/result_codecs.py.
+QUERY_RESULTS_STORAGE_CODEC = os.environ.get('REDASH_QUERY_RESULTS_STORAGE_CODEC', 'json')
 
 settings = {
     "auth_password_login_enabled": PASSWORD_LOGIN_ENABLED,
@@ -53,5 +56,6 @@ settings = {
     "auth_jwt_auth_cookie_name": JWT_AUTH_COOKIE_NAME,
     "auth_jwt_auth_header_name": JWT_AUTH_HEADER_NAME,
     "feature_show_permissions_control": FEATURE_SHOW_PERMISSIONS_CONTROL,
-    "send_email_on_failed_scheduled_queries": SEND_EMAIL_ON_FAILED_SCHEDULED_QUERIES
+    "send_email_on_failed_scheduled_queries": SEND_EMAIL_ON_FAILED_SCHEDULED_QUERIES,
+    "query_results_storage_codec": QUERY_RESULTS_STORAGE_CODEC
 }
@@ -0,0 +1,235 @@
+"""
+Limits on the number of queries executing at once on a data source.
+
+A data source can be given a maximum number of concurrently executing queries
+(see ``dynamic_settings.data_source_max_concurrency``). Execution slots are
+held in a Redis sorted set per data source, scored by when they expire. Jobs
+sent to Celery hold their slot for as long as they could wait there
+(``JOB_EXPIRY_TIME``). Once running, they keep pushing the expiry of their slot
+back (`keep_slot`), so only the slots of jobs lost with their worker expire and
+are reclaimed, after ``DATA_SOURCE_SLOT_TIMEOUT`` seconds. Jobs release their
+slot when they stop.
+
+Jobs submitted while all of the slots are taken aren't sent to Celery, where
+they'd take up a worker only to wait. They're kept in a Redis list per data
+source instead, and sent in order, as the running jobs release their slots.
+"""
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from redash import redis_connection, settings, statsd_client
+from redash.utils import json_dumps, json_loads
+
+logger = logging.getLogger(__name__)
+
+# KEYS: slots, waiting. ARGV: job id, limit, now, slot expiry.
+# Takes a slot unless there are none left or other jobs are already waiting for one, in which case the job waits too.
+_submit_script = redis_connection.register_script("""
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+if redis.call('LLEN', KEYS[2]) == 0 and redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], ARGV[4], ARGV[1])
+    return 1
+end
+redis.call('RPUSH', KEYS[2], ARGV[1])
+return 0
+""")
+
+# KEYS: slots, waiting. ARGV: limit, now, slot expiry.
+# Takes a slot for the next waiting job and returns its id (or nothing, when there are no free slots or waiting jobs).
+_next_script = redis_connection.register_script("""
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+    return false
+end
+local job_id = redis.call('LPOP', KEYS[2])
+if job_id then
+    redis.call('ZADD', KEYS[1], ARGV[3], job_id)
+end
+return job_id
+""")
+
+
+def _slots_key(data_source_id):
+    return 'data_source_slots:{}'.format(data_source_id)
+
+
+def _waiting_key(data_source_id):
+    return 'data_source_waiting:{}'.format(data_source_id)
+
+
+def _wait_time_key(data_source_id):
+    return 'data_source_wait_time:{}'.format(data_source_id)
+
+
+def _job_key(job_id):
+    return 'query_job_admission:{}'.format(job_id)
+
+
+def _load_job(job_id):
+    job = redis_connection.get(_job_key(job_id))
+    return json_loads(job) if job else None
+
+
+def _send(task, job_id, job):
+    task_options = job['task_options']
+    task.apply_async(args=task_options['args'], argsrepr=task_options['argsrepr'], queue=task_options['queue'],
+                     soft_time_limit=task_options['soft_time_limit'], task_id=job_id)
+
+
+def submit(task, data_source_id, limit, lock_id, task_options, job_id=None):
+    """Send a job running `task` (with the given `apply_async` options) as soon as one of the `limit` execution
+    slots of the data source is free. Returns the id of the job."""
+    job_id = job_id or uuid.uuid4().hex
+    now = time.time()
+    job = {
+        'data_source_id': data_source_id,
+        'limit': limit,
+        'lock_id': lock_id,
+        'enqueue_time': now,
+        'task_options': task_options,
+    }
+    redis_connection.set(_job_key(job_id), json_dumps(job), settings.JOB_EXPIRY_TIME)
+
+    admitted = _submit_script(keys=[_slots_key(data_source_id), _waiting_key(data_source_id)],
+                              args=[job_id, limit, now, now + settings.JOB_EXPIRY_TIME])
+    if admitted:
+        _send(task, job_id, job)
+    else:
+        logger.info("[%s] Data source %s is at its concurrency limit (%d), job is waiting for a slot.",
+                    job_id, data_source_id, limit)
+        statsd_client.incr('execute_query.concurrency_limited')
+        # The slots might have been released (or expired) without anyone to send the waiting jobs.
+        dispatch(task, data_source_id, limit)
+
+    return job_id
+
+
+def dispatch(task, data_source_id, limit):
+    """Send the waiting jobs of the data source, for as long as it has free execution slots."""
+    while True:
+        now = time.time()
+        job_id = _next_script(keys=[_slots_key(data_source_id), _waiting_key(data_source_id)],
+                              args=[limit, now, now + settings.JOB_EXPIRY_TIME])
+        if job_id is None:
+            break
+
+        job = _load_job(job_id)
+        if job is None:
+            # Expired while waiting.
+            redis_connection.zrem(_slots_key(data_source_id), job_id)
+            continue
+
+        wait_time = now - job['enqueue_time']
+        statsd_client.timing('execute_query.concurrency_wait', int(wait_time * 1000))
+        redis_connection.set(_wait_time_key(data_source_id), wait_time)
+        logger.info("[%s] Sending job after waiting %.2f seconds for a slot of data source %s.",
+                    job_id, wait_time, data_source_id)
+        _send(task, job_id, job)
+
+
+def release(task, job_id):
+    """Release the execution slot held by the job (if any) and send the jobs waiting for it."""
+    job = _load_job(job_id)
+    if job is None:
+        return
+
+    data_source_id = job['data_source_id']
+    redis_connection.delete(_job_key(job_id))
+    redis_connection.zrem(_slots_key(data_source_id), job_id)
+    dispatch(task, data_source_id, job['limit'])
+
+
+def refresh(job_id, data_source_id):
+    """Push back the expiry of the execution slot held by the job (if it still holds one)."""
+    redis_connection.zadd(_slots_key(data_source_id), {job_id: time.time() + settings.DATA_SOURCE_SLOT_TIMEOUT},
+                          xx=True)
+    redis_connection.expire(_job_key(job_id), settings.JOB_EXPIRY_TIME)
+
+
+def _keep_refreshing(job_id, data_source_id, stop):
+    while not stop.wait(settings.DATA_SOURCE_SLOT_TIMEOUT / 3.0):
+        try:
+            refresh(job_id, data_source_id)
+        except Exception:
+            logger.warning("[%s] Failed refreshing the execution slot.", job_id, exc_info=True)
+
+
+@contextmanager
+def keep_slot(job_id):
+    """Keep the execution slot held by the job (if any) from expiring for as long as the block runs, however long
+    the job's query takes."""
+    job = _load_job(job_id)
+    if job is None:
+        yield
+        return
+
+    # From now on the job releases its slot itself when it stops, even when it's cancelled.
+    job['started'] = True
+    redis_connection.set(_job_key(job_id), json_dumps(job), settings.JOB_EXPIRY_TIME)
+    refresh(job_id, job['data_source_id'])
+
+    stop = threading.Event()
+    thread = threading.Thread(target=_keep_refreshing, args=(job_id, job['data_source_id'], stop))
+    thread.daemon = True
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def cancel(task, job_id):
+    """Remove the job from the jobs waiting for a slot, or release its slot when it was sent but didn't start yet.
+    Returns whether it was still waiting."""
+    job = _load_job(job_id)
+    if job is None:
+        return False
+
+    if redis_connection.lrem(_waiting_key(job['data_source_id']), 0, job_id):
+        # It never ran, so nothing else would unlock its query.
+        redis_connection.delete(_job_key(job_id), job['lock_id'])
+        return True
+
+    if not job.get('started'):
+        # Celery won't run the revoked job, so nothing else would release its slot. Running jobs release it once
+        # they're stopped.
+        release(task, job_id)
+    return False
+
+
+def waiting_jobs(data_source_id):
+    """Return the jobs waiting for a slot of the data source, in order."""
+    job_ids = redis_connection.lrange(_waiting_key(data_source_id), 0, -1)
+    jobs = []
+    for job_id in job_ids:
+        job = _load_job(job_id)
+        if job is not None:
+            job['id'] = job_id
+            jobs.append(job)
+    return jobs
+
+
+def get_status(data_source_id, limit):
+    now = time.time()
+    slots_key = _slots_key(data_source_id)
+    pipe = redis_connection.pipeline()
+    pipe.zcount(slots_key, now, '+inf')
+    pipe.llen(_waiting_key(data_source_id))
+    pipe.lindex(_waiting_key(data_source_id), 0)
+    pipe.get(_wait_time_key(data_source_id))
+    running, waiting, first_waiting_id, last_wait_time = pipe.execute()
+
+    first_waiting = _load_job(first_waiting_id) if first_waiting_id else None
+
+    return {
+        'limit': limit,
+        'running': running,
+        'waiting': waiting,
+        # How long the first job in line has been waiting so far.
+        'wait_time': now - first_waiting['enqueue_time'] if first_waiting else 0,
+        'last_wait_time': float(last_wait_time) if last_wait_time else None,
+    }
@@ -0,0 +1,299 @@
+"""
+Fair sharing of the query workers between orgs and users.
+
+Without the dispatcher, query jobs are sent to their Celery queue as they're
+submitted, so a user submitting many jobs at once (an API client refreshing
+hundreds of queries, for example) makes everyone else on the same queue wait
+for all of them. With ``QUERY_DISPATCHER_ENABLED``, jobs are kept in Redis
+instead, and sent to their Celery queue only when it has no more than
+``QUERY_DISPATCHER_BACKLOG`` jobs waiting for a worker (this relies on Celery
+using the same Redis as Redash as its broker).
+
+Waiting jobs are kept in a list per user, and sent by weighted fair queuing on
+two levels: the org to send a job for is picked among the orgs with waiting
+jobs, then the user among the org's users with waiting jobs. At each level
+every org (or user) has a virtual time tag, which advances by the inverse of
+its weight (``dynamic_settings.org_query_weight`` and ``user_query_weight``)
+every time a job is sent for it, and the one with the lowest tag goes next.
+Interactive jobs (not scheduled, not run with an API key) are always sent
+before the others.
+
+Jobs are sent when submitted, when a query job finishes and periodically (by
+`refresh_queries`). Jobs for data sources with a concurrency limit wait for a
+slot once sent (see `redash.tasks.concurrency`).
+"""
+import logging
+import uuid
+
+from redash import redis_connection, settings, statsd_client
+from redash.tasks import concurrency
+from redash.utils import json_dumps, json_loads
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BACKGROUND = 'background'
+# Highest priority first.
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+QUEUES_KEY = 'query_dispatch:queues'
+
+# The keys of the sub-queues of a Celery queue and priority all start with its prefix, which holds a hash tag so they
+# share a Redis Cluster slot:
+#   <prefix>:orgs - the orgs with waiting jobs, scored by their start tags.
+#   <prefix>:users:<org> - the users of the org with waiting jobs, scored by their start tags.
+#   <prefix>:jobs:<org>:<user> - the waiting jobs of the user, in order.
+#   <prefix>:weights - the weights of the orgs and users with waiting jobs.
+#   <prefix>:org_clock, <prefix>:user_clocks - the virtual time: the start tag of the last org a job was sent for, and
+#     of the last user of each org.
+#   <prefix>:org_finish, <prefix>:user_finish:<org> - the finish tags of the orgs and users, which their start tags
+#     continue from when they submit new jobs (unless the virtual time is already past them).
+#
+# KEYS (of all the scripts): orgs, weights, users, jobs, org clock, user clocks, org finish tags, user finish tags, for
+# the org and user given as the first two ARGV.
+_common = """
+local orgs_key, weights_key, users_key, jobs_key = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local org_clock_key, user_clocks_key, org_finish_key, user_finish_key = KEYS[5], KEYS[6], KEYS[7], KEYS[8]
+local org, user = ARGV[1], ARGV[2]
+local org_weight_key, user_weight_key = 'org:' .. org, 'user:' .. org .. ':' .. user
+
+local function expire(ttl)
+    for _, key in ipairs({org_clock_key, user_clocks_key, org_finish_key, user_finish_key}) do
+        redis.call('EXPIRE', key, ttl)
+    end
+end
+
+-- Removes the user (and the org) from the sub-queues when they have no more waiting jobs, otherwise sets their
+-- start tags.
+local function update(org_start, user_start)
+    if redis.call('LLEN', jobs_key) > 0 then
+        redis.call('ZADD', users_key, user_start, user)
+    else
+        redis.call('ZREM', users_key, user)
+        redis.call('HDEL', weights_key, user_weight_key)
+    end
+    if redis.call('ZCARD', users_key) > 0 then
+        redis.call('ZADD', orgs_key, org_start, org)
+    else
+        redis.call('ZREM', orgs_key, org)
+        redis.call('HDEL', weights_key, org_weight_key)
+    end
+end
+"""
+
+# ARGV: org, user, job id, org weight, user weight, ttl of the virtual times and tags.
+_submit_script = redis_connection.register_script(_common + """
+redis.call('HSET', weights_key, org_weight_key, ARGV[4])
+redis.call('HSET', weights_key, user_weight_key, ARGV[5])
+redis.call('RPUSH', jobs_key, ARGV[3])
+if not redis.call('ZSCORE', users_key, user) then
+    local clock = tonumber(redis.call('HGET', user_clocks_key, org) or '0')
+    local finish = tonumber(redis.call('HGET', user_finish_key, user) or '0')
+    redis.call('ZADD', users_key, math.max(clock, finish), user)
+end
+if not redis.call('ZSCORE', orgs_key, org) then
+    local clock = tonumber(redis.call('GET', org_clock_key) or '0')
+    local finish = tonumber(redis.call('HGET', org_finish_key, org) or '0')
+    redis.call('ZADD', orgs_key, math.max(clock, finish), org)
+end
+expire(ARGV[6])
+""")
+
+# ARGV: org, user, ttl of the virtual times and tags. The org and user are the first org and the org's first user, as
+# last read: the keys of the user's sub-queue can't be known before.
+# Takes the next job to send out of its sub-queue and returns its id, or nothing when the org or user isn't first
+# anymore (another job was sent or submitted in the meantime) and the caller should read them again.
+_next_script = redis_connection.register_script(_common + """
+local org_head = redis.call('ZRANGE', orgs_key, 0, 0, 'WITHSCORES')
+local user_head = redis.call('ZRANGE', users_key, 0, 0, 'WITHSCORES')
+if org_head[1] ~= org or (user_head[1] or '') ~= user then
+    return false
+end
+if #user_head == 0 then
+    update(org_head[2], 0)
+    return false
+end
+local job_id = redis.call('LPOP', jobs_key)
+
+local org_finish = tonumber(org_head[2]) + 1 / tonumber(redis.call('HGET', weights_key, org_weight_key))
+local user_finish = tonumber(user_head[2]) + 1 / tonumber(redis.call('HGET', weights_key, user_weight_key))
+redis.call('SET', org_clock_key, org_head[2])
+redis.call('HSET', user_clocks_key, org, user_head[2])
+redis.call('HSET', org_finish_key, org, org_finish)
+redis.call('HSET', user_finish_key, user, user_finish)
+update(org_finish, user_finish)
+expire(ARGV[3])
+return job_id
+""")
+
+# ARGV: org, user, job id. Returns whether the job was still waiting.
+_cancel_script = redis_connection.register_script(_common + """
+if redis.call('LREM', jobs_key, 0, ARGV[3]) == 0 then
+    return 0
+end
+update(redis.call('ZSCORE', orgs_key, org), redis.call('ZSCORE', users_key, user))
+return 1
+""")
+
+
+def _prefix(queue, priority):
+    return 'query_dispatch:{{{}:{}}}'.format(queue, priority)
+
+
+def _users_key(prefix, org):
+    return '{}:users:{}'.format(prefix, org)
+
+
+def _jobs_key(prefix, org, user):
+    return '{}:jobs:{}:{}'.format(prefix, org, user)
+
+
+def _script_keys(prefix, org, user):
+    return [prefix + ':orgs', prefix + ':weights', _users_key(prefix, org), _jobs_key(prefix, org, user),
+            prefix + ':org_clock', prefix + ':user_clocks', prefix + ':org_finish',
+            '{}:user_finish:{}'.format(prefix, org)]
+
+
+def _job_key(job_id):
+    return 'query_dispatch_job:{}'.format(job_id)
+
+
+def _load_job(job_id):
+    job = redis_connection.get(_job_key(job_id))
+    return json_loads(job) if job else None
+
+
+def priority(scheduled, is_api_key):
+    if scheduled or is_api_key:
+        return PRIORITY_BACKGROUND
+    return PRIORITY_INTERACTIVE
+
+
+def submit(task, data_source, max_concurrency, lock_id, task_options, user_id, is_api_key, scheduled):
+    """Queue a job running `task` (with the given `apply_async` options) to be sent when it's its turn. Returns the
+    id of the job."""
+    job_id = uuid.uuid4().hex
+    queue = task_options['queue']
+    job = {
+        'data_source_id': data_source.id,
+        'max_concurrency': max_concurrency,
+        'lock_id': lock_id,
+        'priority': priority(scheduled, is_api_key),
+        'org': data_source.org_id,
+        'user': u'{}'.format(user_id),
+        'task_options': task_options,
+    }
+    org_weight = settings.dynamic_settings.org_query_weight(data_source.org_id)
+    user_weight = settings.dynamic_settings.user_query_weight(user_id, is_api_key, data_source.org_id)
+
+    redis_connection.set(_job_key(job_id), json_dumps(job), settings.JOB_EXPIRY_TIME)
+    redis_connection.sadd(QUEUES_KEY, queue)
+    _submit_script(keys=_script_keys(_prefix(queue, job['priority']), job['org'], job['user']),
+                   args=[job['org'], job['user'], job_id, org_weight, user_weight, settings.JOB_EXPIRY_TIME])
+    statsd_client.incr('execute_query.dispatcher.{}'.format(job['priority']))
+
+    dispatch(task, queue)
+    return job_id
+
+
+def _send(task, job_id, job):
+    task_options = job['task_options']
+    if job['max_concurrency']:
+        concurrency.submit(task, job['data_source_id'], job['max_concurrency'], job['lock_id'], task_options,
+                           job_id=job_id)
+    else:
+        task.apply_async(args=task_options['args'], argsrepr=task_options['argsrepr'], queue=task_options['queue'],
+                         soft_time_limit=task_options['soft_time_limit'], task_id=job_id)
+
+
+def _next_job_id(queue, job_priority):
+    """Take the next job to send for the Celery queue and priority out of its sub-queue. Returns its id, or None when
+    there are no jobs waiting."""
+    prefix = _prefix(queue, job_priority)
+    while True:
+        orgs = redis_connection.zrange(prefix + ':orgs', 0, 0)
+        if not orgs:
+            return None
+
+        users = redis_connection.zrange(_users_key(prefix, orgs[0]), 0, 0)
+        user = users[0] if users else ''
+        job_id = _next_script(keys=_script_keys(prefix, orgs[0], user), args=[orgs[0], user, settings.JOB_EXPIRY_TIME])
+        if job_id is not None:
+            return job_id
+
+
+def dispatch(task, queue):
+    """Send the jobs waiting for the Celery queue, for as long as it has room for them."""
+    while redis_connection.llen(queue) < settings.QUERY_DISPATCHER_BACKLOG:
+        for job_priority in PRIORITIES:
+            job_id = _next_job_id(queue, job_priority)
+            if job_id is not None:
+                break
+        else:
+            break
+
+        job = _load_job(job_id)
+        if job is None:
+            # Expired while waiting.
+            continue
+
+        # The job is kept until it finishes, for `finish` to know its Celery queue.
+        _send(task, job_id, job)
+
+
+def dispatch_all(task):
+    for queue in redis_connection.smembers(QUEUES_KEY):
+        dispatch(task, queue)
+
+
+def finish(task, job_id):
+    """Forget the job once it ran, and send the jobs waiting for its Celery queue, which has room for one more."""
+    job = _load_job(job_id)
+    if job is None:
+        return
+
+    redis_connection.delete(_job_key(job_id))
+    dispatch(task, job['task_options']['queue'])
+
+
+def cancel(job_id):
+    """Remove the job from the jobs waiting to be sent. Returns whether it was still waiting."""
+    job = _load_job(job_id)
+    if job is None:
+        return False
+
+    prefix = _prefix(job['task_options']['queue'], job['priority'])
+    if _cancel_script(keys=_script_keys(prefix, job['org'], job['user']), args=[job['org'], job['user'], job_id]):
+        # It never ran, so nothing else would unlock its query.
+        redis_connection.delete(_job_key(job_id), job['lock_id'])
+        return True
+
+    return False
+
+
+def _waiting_job_ids(queue, priority):
+    prefix = _prefix(queue, priority)
+    for org in redis_connection.zrange(prefix + ':orgs', 0, -1):
+        for user in redis_connection.zrange(_users_key(prefix, org), 0, -1):
+            for job_id in redis_connection.lrange(_jobs_key(prefix, org, user), 0, -1):
+                yield job_id
+
+
+def waiting_jobs(queue):
+    """Return the jobs waiting to be sent to the Celery queue."""
+    jobs = []
+    for job_priority in PRIORITIES:
+        for job_id in _waiting_job_ids(queue, job_priority):
+            job = _load_job(job_id)
+            if job is not None:
+                job['id'] = job_id
+                jobs.append(job)
+    return jobs
+
+
+def get_status():
+    queues = {}
+    for queue in redis_connection.smembers(QUEUES_KEY):
+        queues[queue] = {job_priority: len(list(_waiting_job_ids(queue, job_priority)))
+                         for job_priority in PRIORITIES}
+    return queues
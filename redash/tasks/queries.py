@@ -8,7 +8,9 @@ from celery.utils.log import get_task_logger
 from six import text_type
 
 from redash import models, redis_connection, settings, statsd_client
+from redash.models import partitions, result_codecs, result_stores
 from redash.query_runner import InterruptException
+from redash.tasks import concurrency, dispatcher
 from redash.tasks.alerts import check_alerts_for_query
 from redash.tasks.failure_report import notify_of_failure
 from redash.utils import gen_query_hash, json_dumps, utcnow, mustache_render
@@ -92,6 +94,9 @@ class QueryTask(object):
         return self._async_result.ready()
 
     def cancel(self):
+        if dispatcher.cancel(self.id) or concurrency.cancel(execute_query, self.id):
+            # The job was never sent, so no worker would record it was cancelled.
+            return self._async_result.backend.mark_as_revoked(self.id, 'cancelled')
         return self._async_result.revoke(terminate=True, signal='SIGINT')
 
 
@@ -140,12 +145,25 @@ def enqueue_query(query, data_source, user_id, is_api_key=False, scheduled_query
 
                 time_limit = settings.dynamic_settings.query_time_limit(scheduled_query, user_id, data_source.org_id)
 
-                result = execute_query.apply_async(args=args,
-                                                   argsrepr=argsrepr,
-                                                   queue=queue_name,
-                                                   soft_time_limit=time_limit)
+                max_concurrency = settings.dynamic_settings.data_source_max_concurrency(data_source)
+                task_options = dict(args=args, argsrepr=argsrepr, queue=queue_name, soft_time_limit=time_limit)
+
+                if settings.QUERY_DISPATCHER_ENABLED:
+                    job_id = dispatcher.submit(execute_query, data_source, max_concurrency,
+                                               _job_lock_id(query_hash, data_source.id), task_options,
+                                               user_id, is_api_key, scheduled_query_id is not None)
+                    job = QueryTask(job_id=job_id)
+                elif max_concurrency:
+                    job_id = concurrency.submit(execute_query, data_source.id, max_concurrency,
+                                                _job_lock_id(query_hash, data_source.id), task_options)
+                    job = QueryTask(job_id=job_id)
+                else:
+                    result = execute_query.apply_async(args=args,
+                                                       argsrepr=argsrepr,
+                                                       queue=queue_name,
+                                                       soft_time_limit=time_limit)
 
-                job = QueryTask(async_result=result)
+                    job = QueryTask(async_result=result)
                 logging.info("[%s] Created new job: %s", query_hash, job.id)
                 pipe.set(_job_lock_id(query_hash, data_source.id), job.id, settings.JOB_EXPIRY_TIME)
                 pipe.execute()
@@ -204,6 +222,13 @@ def refresh_queries():
                 query_ids.append(query.id)
                 outdated_queries_count += 1
 
+    # Persist the next run times updated by outdated_queries.
+    models.db.session.commit()
+
+    if settings.QUERY_DISPATCHER_ENABLED:
+        # Send the jobs that are still waiting, in case no running job finished to send them.
+        dispatcher.dispatch_all(execute_query)
+
     statsd_client.gauge('manager.outdated_queries', outdated_queries_count)
 
     logger.info("Done refreshing queries. Found %d outdated queries: %s" % (outdated_queries_count, query_ids))
@@ -220,25 +245,71 @@ def refresh_queries():
     statsd_client.gauge('manager.seconds_since_refresh', now - float(status.get('last_refresh_at', now)))
 
 
+def _next_cleanup_batch_size(batch_size, duration):
+    """Grow or shrink the batch size so that deleting a batch takes about QUERY_RESULTS_CLEANUP_BATCH_DURATION."""
+    target = settings.QUERY_RESULTS_CLEANUP_BATCH_DURATION
+    if duration < target / 2:
+        batch_size *= 2
+    elif duration > target:
+        batch_size //= 2
+
+    return max(1, min(batch_size, settings.QUERY_RESULTS_CLEANUP_MAX_COUNT))
+
+
 @celery.task(name="redash.tasks.cleanup_query_results")
 def cleanup_query_results():
     """
     Job to cleanup unused query results -- such that no query links to them anymore, and older than
     settings.QUERY_RESULTS_MAX_AGE (a week by default, so it's less likely to be open in someone's browser and be used).
 
-    Each time the job deletes only settings.QUERY_RESULTS_CLEANUP_COUNT (100 by default) query results so it won't choke
-    the database in case of many such results.
+    When the table is partitioned (see redash.models.partitions), upcoming partitions are created and expired ones
+    dropped first. Unused results are then only looked for in the default and archive partitions.
+
+    The results are deleted in batches (in id order, each in its own transaction) until there are no more unused
+    results or settings.QUERY_RESULTS_CLEANUP_TIME_BUDGET seconds passed. Batches start with
+    settings.QUERY_RESULTS_CLEANUP_COUNT results, and are resized to take about
+    settings.QUERY_RESULTS_CLEANUP_BATCH_DURATION seconds each, so the job doesn't choke the database.
     """
 
-    logging.info("Running query results clean up (removing maximum of %d unused results, that are %d days old or more)",
-                 settings.QUERY_RESULTS_CLEANUP_COUNT, settings.QUERY_RESULTS_CLEANUP_MAX_AGE)
+    logging.info("Running query results clean up (removing unused results, that are %d days old or more, for up to %d "
+                 "seconds)", settings.QUERY_RESULTS_CLEANUP_MAX_AGE, settings.QUERY_RESULTS_CLEANUP_TIME_BUDGET)
 
-    unused_query_results = models.QueryResult.unused(settings.QUERY_RESULTS_CLEANUP_MAX_AGE).limit(settings.QUERY_RESULTS_CLEANUP_COUNT)
-    deleted_count = models.QueryResult.query.filter(
-        models.QueryResult.id.in_(unused_query_results.subquery())
-    ).delete(synchronize_session=False)
-    models.db.session.commit()
-    logger.info("Deleted %d unused query results.", deleted_count)
+    start_time = time.time()
+    if partitions.is_partitioned():
+        partitions.create_partitions()
+        dropped = partitions.drop_expired_partitions(settings.QUERY_RESULTS_CLEANUP_MAX_AGE)
+        models.db.session.commit()
+        for partition in dropped:
+            result_stores.delete_payloads(partition.external_payloads)
+        statsd_client.incr('cleanup_query_results.dropped_partitions', len(dropped))
+
+    batch_size = settings.QUERY_RESULTS_CLEANUP_COUNT
+    last_id = 0
+    deleted_count = 0
+    done = False
+    while not done and time.time() - start_time < settings.QUERY_RESULTS_CLEANUP_TIME_BUDGET:
+        batch_start_time = time.time()
+        deleted = models.QueryResult.delete_unused(settings.QUERY_RESULTS_CLEANUP_MAX_AGE, last_id, batch_size)
+        models.db.session.commit()
+        result_stores.delete_payloads((row.payload_store, row.payload_key) for row in deleted)
+        duration = time.time() - batch_start_time
+
+        statsd_client.timing('cleanup_query_results.batch', duration * 1000)
+        statsd_client.incr('cleanup_query_results.deleted', len(deleted))
+        deleted_count += len(deleted)
+        done = len(deleted) < batch_size
+        if deleted:
+            last_id = max(row.id for row in deleted)
+
+        batch_size = _next_cleanup_batch_size(batch_size, duration)
+
+    run_time = time.time() - start_time
+    # Only count what's left when the time budget ran out, as counting isn't cheap either.
+    backlog = 0 if done else models.QueryResult.unused(settings.QUERY_RESULTS_CLEANUP_MAX_AGE).count()
+    statsd_client.gauge('cleanup_query_results.backlog', backlog)
+    statsd_client.gauge('cleanup_query_results.throughput', deleted_count / run_time if run_time else 0)
+
+    logger.info("Deleted %d unused query results in %.2f seconds (%d left).", deleted_count, run_time, backlog)
 
 
 @celery.task(name="redash.tasks.refresh_schema", time_limit=90, soft_time_limit=60)
@@ -317,6 +388,10 @@ class QueryExecutor(object):
         self.metadata = metadata
         self.data_source = self._load_data_source()
         self.user = _resolve_user(user_id, is_api_key, metadata.get('Query ID'))
+        self.stream_results = settings.FEATURE_STREAM_QUERY_RESULTS and \
+            self.data_source.query_runner.supports_streaming()
+        # Resolved now, as the data source's org can't be loaded once the session is closed.
+        self.storage_codec = models.QueryResult.storage_codec(self.data_source.org)
 
         # Close DB connection to prevent holding a connection for a long time while the query is executing.
         models.db.session.close()
@@ -337,7 +412,10 @@ class QueryExecutor(object):
         annotated_query = self._annotate_query(query_runner)
 
         try:
-            data, error = query_runner.run_query(annotated_query, self.user)
+            if self.stream_results:
+                data, error = self._run_query_stream(query_runner, annotated_query), None
+            else:
+                data, error = query_runner.run_query(annotated_query, self.user)
         except Exception as e:
             if isinstance(e, SoftTimeLimitExceeded):
                 error = TIMEOUT_MESSAGE
@@ -370,7 +448,7 @@ class QueryExecutor(object):
             query_result, updated_query_ids = models.QueryResult.store_result(
                 self.data_source.org_id, self.data_source,
                 self.query_hash, self.query, data,
-                run_time, utcnow())
+                run_time, utcnow(), codec=self.storage_codec)
             models.db.session.commit()  # make sure that alert sees the latest query result
             self._log_progress('checking_alerts')
             for query_id in updated_query_ids:
@@ -381,6 +459,19 @@ class QueryExecutor(object):
             models.db.session.commit()
             return result
 
+    def _run_query_stream(self, query_runner, annotated_query):
+        writer = result_codecs.get_writer(self.storage_codec, query_runner.json_encoder)
+        stream = query_runner.run_query_stream(annotated_query, self.user)
+
+        try:
+            writer.write_columns(next(stream))
+            for rows in stream:
+                writer.write_rows(rows)
+        finally:
+            stream.close()
+
+        return writer.finish()
+
     def _annotate_query(self, query_runner):
         if query_runner.annotate_query():
             self.metadata['Task ID'] = self.task.request.id
@@ -413,10 +504,18 @@ class QueryExecutor(object):
 @celery.task(name="redash.tasks.execute_query", bind=True, track_started=True)
 def execute_query(self, query, data_source_id, metadata, user_id=None,
                   scheduled_query_id=None, is_api_key=False):
-    if scheduled_query_id is not None:
-        scheduled_query = models.Query.query.get(scheduled_query_id)
-    else:
-        scheduled_query = None
-
-    return QueryExecutor(self, query, data_source_id, user_id, is_api_key, metadata,
-                         scheduled_query).run()
+    try:
+        if scheduled_query_id is not None:
+            scheduled_query = models.Query.query.get(scheduled_query_id)
+        else:
+            scheduled_query = None
+
+        with concurrency.keep_slot(self.request.id):
+            return QueryExecutor(self, query, data_source_id, user_id, is_api_key, metadata,
+                                 scheduled_query).run()
+    finally:
+        # Let the next job waiting for this data source's concurrency limit (if it has one) run, even when the job
+        # failed before running its query (its data source was deleted, for example).
+        concurrency.release(execute_query, self.request.id)
+        if settings.QUERY_DISPATCHER_ENABLED:
+            dispatcher.finish(execute_query, self.request.id)
@@ -6,11 +6,12 @@ from flask import current_app
 
 from celery import Celery
 from celery.schedules import crontab
-from celery.signals import worker_process_init
+from celery.signals import worker_process_init, worker_process_shutdown
 from celery.utils.log import get_logger
 
 from redash import create_app, extensions, settings
 from redash.metrics import celery as celery_metrics  # noqa
+from redash.query_runner import connection_pool
 
 logger = get_logger(__name__)
 
@@ -97,6 +98,12 @@ def init_celery_flask_app(**kwargs):
     app.app_context().push()
 
 
+@worker_process_shutdown.connect
+def close_query_runner_connections(**kwargs):
+    """Close the connections kept open by query runners before the worker exits."""
+    connection_pool.close_all()
+
+
 @celery.on_after_configure.connect
 def add_periodic_tasks(sender, **kwargs):
     """Load all periodic tasks from extensions and add them to Celery."""
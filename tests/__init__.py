@@ -64,7 +64,7 @@ class BaseTestCase(TestCase):
         redis_connection.flushdb()
 
     def make_request(self, method, path, org=None, user=None, data=None,
-                     is_json=True, follow_redirects=False):
+                     is_json=True, follow_redirects=False, headers=None):
         if user is None:
             user = self.factory.user
 
@@ -78,7 +78,7 @@ class BaseTestCase(TestCase):
             authenticate_request(self.client, user)
 
         method_fn = getattr(self.client, method.lower())
-        headers = {}
+        headers = dict(headers or {})
 
         if data and is_json:
             data = json_dumps(data)
@@ -73,11 +73,94 @@ class TestDashboardResourceGet(BaseTestCase):
         self.assertTrue(rv.json['widgets'][0]['restricted'])
         self.assertNotIn('restricted', rv.json['widgets'][1])
 
+    def test_returns_not_modified_for_matching_etag(self):
+        dashboard = self.factory.create_dashboard()
+        path = '/api/dashboards/{0}'.format(dashboard.slug)
+
+        etag = self.make_request('get', path).headers['ETag']
+
+        rv = self.make_request('get', path, headers={'If-None-Match': etag})
+        self.assertEquals(rv.status_code, 304)
+
+        query = self.factory.create_query()
+        self.factory.create_widget(dashboard=dashboard, visualization=self.factory.create_visualization(query_rel=query))
+        db.session.commit()
+
+        rv = self.make_request('get', path, headers={'If-None-Match': etag})
+        self.assertEquals(rv.status_code, 200)
+        etag = rv.headers['ETag']
+
+        query.latest_query_data = self.factory.create_query_result()
+        db.session.commit()
+
+        rv = self.make_request('get', path, headers={'If-None-Match': etag})
+        self.assertEquals(rv.status_code, 200)
+
+    def test_etag_changes_with_the_permissions_of_the_widgets_data_sources(self):
+        dashboard = self.factory.create_dashboard()
+        data_source = self.factory.create_data_source(group=self.factory.create_group())
+        query = self.factory.create_query(data_source=data_source)
+        self.factory.create_widget(dashboard=dashboard, visualization=self.factory.create_visualization(query_rel=query))
+        db.session.commit()
+        path = '/api/dashboards/{0}'.format(dashboard.slug)
+
+        rv = self.make_request('get', path)
+        self.assertTrue(rv.json['widgets'][0]['restricted'])
+
+        data_source.add_group(self.factory.default_group)
+        db.session.commit()
+
+        rv = self.make_request('get', path, headers={'If-None-Match': rv.headers['ETag']})
+        self.assertEquals(rv.status_code, 200)
+        self.assertNotIn('restricted', rv.json['widgets'][0])
+
     def test_get_non_existing_dashboard(self):
         rv = self.make_request('get', '/api/dashboards/not_existing')
         self.assertEquals(rv.status_code, 404)
 
 
+class TestDashboardResultsResource(BaseTestCase):
+    def create_widget(self, dashboard, data_source=None):
+        query = self.factory.create_query(data_source=data_source or self.factory.data_source)
+        query.latest_query_data = self.factory.create_query_result(data_source=query.data_source)
+        vis = self.factory.create_visualization(query_rel=query)
+        self.factory.create_widget(visualization=vis, dashboard=dashboard)
+        return query
+
+    def test_returns_latest_results_of_accessible_queries(self):
+        dashboard = self.factory.create_dashboard()
+        query = self.create_widget(dashboard)
+        self.factory.create_widget(visualization=self.factory.create_visualization(query_rel=query), dashboard=dashboard)
+        self.create_widget(dashboard, data_source=self.factory.create_data_source(group=self.factory.create_group()))
+        self.factory.create_widget(dashboard=dashboard, visualization=None)
+        db.session.commit()
+
+        rv = self.make_request('get', '/api/dashboards/{0}/results'.format(dashboard.slug))
+
+        self.assertEquals(rv.status_code, 200)
+        self.assertEqual([str(query.id)], rv.json['query_results'].keys())
+        self.assertEqual(query.latest_query_data_id, rv.json['query_results'][str(query.id)]['id'])
+
+    def test_returns_results_for_dashboard_api_key(self):
+        dashboard = self.factory.create_dashboard()
+        query = self.create_widget(dashboard, data_source=self.factory.create_data_source(group=self.factory.create_group()))
+        api_key = self.factory.create_api_key(object=dashboard)
+        db.session.commit()
+
+        rv = self.make_request('get', '/api/dashboards/{0}/results?api_key={1}'.format(dashboard.slug, api_key.api_key),
+                               user=False)
+
+        self.assertEquals(rv.status_code, 200)
+        self.assertEqual([str(query.id)], rv.json['query_results'].keys())
+
+    def test_returns_empty_results_for_dashboard_without_widgets(self):
+        dashboard = self.factory.create_dashboard()
+
+        rv = self.make_request('get', '/api/dashboards/{0}/results'.format(dashboard.slug))
+
+        self.assertEqual({'query_results': {}}, rv.json)
+
+
 class TestDashboardResourcePost(BaseTestCase):
     def test_update_dashboard(self):
         d = self.factory.create_dashboard()
@@ -1,6 +1,11 @@
+import shutil
+import tempfile
+
+import mock
 from tests import BaseTestCase
 
-from redash.models import db
+from redash import settings
+from redash.models import db, result_stores
 from redash.utils import json_dumps
 from redash.handlers.query_results import error_messages
 
@@ -219,6 +224,98 @@ class TestQueryResultAPI(BaseTestCase):
         self.assertEquals(rv.status_code, 403)
 
 
+class TestQueryResultSlices(BaseTestCase):
+    def create_query_result(self):
+        data = {'columns': [{'name': 'a'}, {'name': 'b'}], 'rows': [{'a': i, 'b': -i} for i in range(10)]}
+        return self.factory.create_query_result(data=json_dumps(data))
+
+    def test_returns_requested_slice(self):
+        query_result = self.create_query_result()
+
+        rv = self.make_request('get', '/api/query_results/{}?offset=3&limit=2&columns=a'.format(query_result.id))
+
+        self.assertEquals(rv.status_code, 200)
+        data = rv.json['query_result']['data']
+        self.assertEqual([{'a': 3}, {'a': 4}], data['rows'])
+        self.assertEqual(['a'], [c['name'] for c in data['columns']])
+        self.assertEqual(10, data['metadata']['total_row_count'])
+
+    def test_returns_whole_result_by_default(self):
+        query_result = self.create_query_result()
+
+        rv = self.make_request('get', '/api/query_results/{}'.format(query_result.id))
+
+        self.assertEqual(10, len(rv.json['query_result']['data']['rows']))
+        self.assertNotIn('metadata', rv.json['query_result']['data'])
+
+    def test_streams_externally_stored_results(self):
+        query_result = self.create_query_result()
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        with mock.patch.object(settings, 'QUERY_RESULTS_PAYLOAD_STORE_PATH', path):
+            result_stores.get_store(result_stores.STORE_FILESYSTEM).write(query_result, query_result.data)
+            db.session.commit()
+
+            rv = self.make_request('get', '/api/query_results/{}'.format(query_result.id))
+
+        self.assertEquals(rv.status_code, 200)
+        self.assertEqual(query_result.id, rv.json['query_result']['id'])
+        self.assertEqual(10, len(rv.json['query_result']['data']['rows']))
+
+    def test_rejects_invalid_slices(self):
+        query_result = self.create_query_result()
+
+        rv = self.make_request('get', '/api/query_results/{}?limit=-1'.format(query_result.id))
+
+        self.assertEquals(rv.status_code, 400)
+
+
+class TestQueryResultETags(BaseTestCase):
+    def test_returns_not_modified_for_matching_etag(self):
+        query_result = self.factory.create_query_result()
+
+        rv = self.make_request('get', '/api/query_results/{}'.format(query_result.id))
+        etag = rv.headers['ETag']
+
+        rv = self.make_request('get', '/api/query_results/{}'.format(query_result.id), headers={'If-None-Match': etag})
+        self.assertEquals(rv.status_code, 304)
+        self.assertEqual(etag, rv.headers['ETag'])
+
+        rv = self.make_request('get', '/api/query_results/{}?limit=1'.format(query_result.id),
+                               headers={'If-None-Match': etag})
+        self.assertEquals(rv.status_code, 200)
+
+    def test_etag_changes_with_the_latest_result_of_the_query(self):
+        query = self.factory.create_query()
+        query.latest_query_data = self.factory.create_query_result()
+        db.session.commit()
+
+        rv = self.make_request('get', '/api/queries/{}/results.json'.format(query.id))
+        etag = rv.headers['ETag']
+
+        query.latest_query_data = self.factory.create_query_result()
+        db.session.commit()
+
+        rv = self.make_request('get', '/api/queries/{}/results.json'.format(query.id), headers={'If-None-Match': etag})
+        self.assertEquals(rv.status_code, 200)
+        self.assertNotEqual(etag, rv.headers['ETag'])
+
+    def test_etag_changes_with_the_file_name(self):
+        query = self.factory.create_query()
+        query.latest_query_data = self.factory.create_query_result()
+        db.session.commit()
+        path = '/api/queries/{}/results.csv'.format(query.id)
+
+        etag = self.make_request('get', path).headers['ETag']
+
+        query.name = 'Renamed'
+        db.session.commit()
+
+        rv = self.make_request('get', path, headers={'If-None-Match': etag})
+        self.assertEquals(rv.status_code, 200)
+        self.assertIn('Renamed', rv.headers['Content-Disposition'])
+
+
 class TestQueryResultDropdownResource(BaseTestCase):
     def test_checks_for_access_to_the_query(self):
         ds2 = self.factory.create_data_source(group=self.factory.org.admin_group, view_only=False)
@@ -1,3 +1,5 @@
+from sqlalchemy import inspect
+
 from tests import BaseTestCase
 from redash.models import db, Dashboard
 
@@ -28,3 +30,16 @@ class DashboardTest(BaseTestCase):
             list(Dashboard.all_tags(self.factory.org, self.factory.user)),
             [(u'tag1', 3), (u'tag2', 2), (u'tag3', 1)]
         )
+
+    def test_latest_query_results_leaves_out_payloads(self):
+        dashboard = self.factory.create_dashboard()
+        query = self.factory.create_query()
+        query.latest_query_data = self.factory.create_query_result()
+        self.factory.create_widget(visualization=self.factory.create_visualization(query_rel=query), dashboard=dashboard)
+        db.session.commit()
+
+        [(result_query, query_result)] = dashboard.latest_query_results()
+
+        self.assertEqual(query.id, result_query.id)
+        self.assertNotIn('data', inspect(query_result).dict)
+        self.assertEqual({"columns": {}, "rows": []}, query_result.decoded_data)
@@ -0,0 +1,132 @@
+import datetime
+
+import pytz
+from mock import patch
+
+from tests import BaseTestCase
+
+from redash.models import QueryResult, db, partitions
+from redash.models.partitions import Partition
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=pytz.utc)
+
+
+class TestPartitions(BaseTestCase):
+    def test_query_results_is_not_partitioned_by_default(self):
+        self.assertFalse(partitions.is_partitioned())
+        self.assertIsNone(partitions.oldest_partition_start())
+
+    @patch('redash.models.partitions._execute')
+    @patch('redash.models.partitions.list_partitions', return_value=[])
+    def test_creates_partitions_ahead(self, list_partitions, execute):
+        created = partitions.create_partitions(days=7, now=utc(2026, 10, 20, 16))
+
+        self.assertEqual(['query_results_p20261018', 'query_results_p20261025', 'query_results_p20261101'],
+                         [p.name for p in created])
+        self.assertEqual(utc(2026, 11, 8), created[-1].end)
+        self.assertIn("FOR VALUES FROM ('2026-10-18T00:00:00+00:00') TO ('2026-10-25T00:00:00+00:00')",
+                      execute.call_args_list[0][0][1])
+
+    @patch('redash.models.partitions._execute')
+    @patch('redash.models.partitions.list_partitions')
+    def test_creates_only_missing_partitions(self, list_partitions, execute):
+        list_partitions.return_value = [Partition('query_results_p20261018', utc(2026, 10, 18), utc(2026, 10, 25)),
+                                        Partition('query_results_p20261025', utc(2026, 10, 25), utc(2026, 11, 1)),
+                                        Partition('query_results_p20261101', utc(2026, 11, 1), utc(2026, 11, 8))]
+
+        self.assertEqual([], partitions.create_partitions(days=7, now=utc(2026, 10, 24)))
+        created = partitions.create_partitions(days=7, now=utc(2026, 10, 26))
+        self.assertEqual(['query_results_p20261108'], [p.name for p in created])
+
+    @patch('redash.models.partitions._execute')
+    @patch('redash.models.partitions.list_partitions')
+    def test_drops_expired_partitions_keeping_used_results(self, list_partitions, execute):
+        list_partitions.return_value = [Partition('query_results_p20261018', utc(2026, 10, 18), utc(2026, 10, 25)),
+                                        Partition('query_results_p20261025', utc(2026, 10, 25), utc(2026, 11, 1))]
+
+        dropped = partitions.drop_expired_partitions(7, now=utc(2026, 11, 3))
+
+        self.assertEqual(['query_results_p20261018'], [p.name for p in dropped])
+        statements = [c[0][1] for c in execute.call_args_list]
+        self.assertEqual("CREATE TABLE query_results_archive (LIKE query_results INCLUDING DEFAULTS)", statements[0])
+        self.assertEqual("ALTER TABLE query_results DETACH PARTITION query_results_p20261018", statements[1])
+        self.assertTrue(statements[2].startswith("INSERT INTO query_results_archive SELECT * FROM query_results_p20261018"))
+        self.assertEqual("DROP TABLE query_results_p20261018", statements[4])
+        self.assertEqual("ALTER TABLE query_results ATTACH PARTITION query_results_archive "
+                         "FOR VALUES FROM ('2026-10-18T00:00:00+00:00') TO ('2026-10-25T00:00:00+00:00')", statements[5])
+
+    @patch('redash.models.partitions._execute')
+    @patch('redash.models.partitions.list_partitions')
+    def test_extends_the_archive_partition(self, list_partitions, execute):
+        list_partitions.return_value = [Partition('query_results_archive', utc(2026, 10, 11), utc(2026, 10, 18)),
+                                        Partition('query_results_p20261018', utc(2026, 10, 18), utc(2026, 10, 25)),
+                                        Partition('query_results_p20261025', utc(2026, 10, 25), utc(2026, 11, 1))]
+
+        dropped = partitions.drop_expired_partitions(7, now=utc(2026, 11, 3))
+
+        self.assertEqual(['query_results_p20261018'], [p.name for p in dropped])
+        statements = [c[0][1] for c in execute.call_args_list]
+        self.assertEqual("ALTER TABLE query_results DETACH PARTITION query_results_archive", statements[0])
+        self.assertEqual("ALTER TABLE query_results ATTACH PARTITION query_results_archive "
+                         "FOR VALUES FROM ('2026-10-11T00:00:00+00:00') TO ('2026-10-25T00:00:00+00:00')",
+                         statements[-1])
+
+
+class TestPartitionTable(BaseTestCase):
+    def setUp(self):
+        super(TestPartitionTable, self).setUp()
+        server_version = int(db.session.execute("SHOW server_version_num").scalar())
+        if server_version < partitions.MIN_SERVER_VERSION:
+            self.skipTest("Partitioning requires PostgreSQL 11 or newer.")
+
+    def test_converts_table_with_results(self):
+        now = datetime.datetime.now(pytz.utc)
+        query = self.factory.create_query()
+        used = self.factory.create_query_result(retrieved_at=now - datetime.timedelta(hours=1))
+        query.latest_query_data = used
+        unused = self.factory.create_query_result(retrieved_at=now - datetime.timedelta(days=30))
+        db.session.commit()
+
+        partitions.partition_table(days=7)
+        db.session.commit()
+
+        self.assertTrue(partitions.is_partitioned())
+        # The current period's results are in the default partition, so range partitions start after it.
+        self.assertGreater(partitions.list_partitions()[0].start, used.retrieved_at)
+        self.assertEqual([], partitions.create_partitions(days=7))
+        self.assertEqual({used.id, unused.id}, set(r.id for r in QueryResult.query))
+
+        result = self.factory.create_query_result(retrieved_at=partitions.list_partitions()[0].start)
+        db.session.commit()
+        self.assertEqual(result.id, QueryResult.query.filter(QueryResult.id == result.id).one().id)
+
+    def test_archives_used_results_of_expired_partitions(self):
+        partitions.partition_table(days=7)
+        start = partitions.list_partitions()[0].start
+        query = self.factory.create_query()
+        used = self.factory.create_query_result(retrieved_at=start + datetime.timedelta(days=1))
+        query.latest_query_data = used
+        unused = self.factory.create_query_result(retrieved_at=start + datetime.timedelta(days=2))
+        db.session.commit()
+
+        dropped = partitions.drop_expired_partitions(7, now=start + datetime.timedelta(days=14))
+        db.session.commit()
+
+        self.assertEqual(1, len(dropped))
+        self.assertEqual(partitions.ARCHIVE_PARTITION, partitions.list_partitions()[0].name)
+        self.assertEqual([used.id], [r.id for r in QueryResult.query.filter(QueryResult.id.in_([used.id, unused.id]))])
+
+
+    def test_unused_only_looks_before_the_oldest_partition(self):
+        two_weeks_ago = datetime.datetime.now() - datetime.timedelta(days=14)
+        old = self.factory.create_query_result(retrieved_at=two_weeks_ago)
+        older = self.factory.create_query_result(retrieved_at=two_weeks_ago - datetime.timedelta(days=14))
+
+        with patch.object(partitions, 'oldest_partition_start',
+                          return_value=two_weeks_ago - datetime.timedelta(days=7)):
+            unused = list(QueryResult.unused())
+
+        self.assertIn(older, unused)
+        self.assertNotIn(old, unused)
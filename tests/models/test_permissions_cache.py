@@ -0,0 +1,93 @@
+import mock
+from tests import BaseTestCase
+
+from redash import settings
+from redash.models import db, permissions_cache
+
+
+class TestPermissionsCache(BaseTestCase):
+    def insert_data_source_group(self, data_source, group):
+        # Bypasses the ORM, so the cache isn't invalidated.
+        db.session.execute("INSERT INTO data_source_groups (data_source_id, group_id, view_only) VALUES (:ds, :g, false)",
+                           {'ds': data_source.id, 'g': group.id})
+
+    def test_caches_data_source_groups_for_the_request(self):
+        data_source = self.factory.create_data_source()
+        group = self.factory.create_group()
+
+        with self.app.test_request_context('/'):
+            groups = data_source.groups
+            self.insert_data_source_group(data_source, group)
+            self.assertEqual(groups, data_source.groups)
+
+        with self.app.test_request_context('/'):
+            self.assertIn(group.id, data_source.groups)
+
+    def test_invalidated_by_group_changes(self):
+        data_source = self.factory.create_data_source()
+        group = self.factory.create_group()
+
+        with self.app.test_request_context('/'):
+            self.assertNotIn(group.id, data_source.groups)
+
+            data_source.add_group(group)
+            self.assertFalse(data_source.groups[group.id])
+
+            data_source.update_group_permission(group, True)
+            self.assertTrue(data_source.groups[group.id])
+
+            data_source.remove_group(group)
+            self.assertNotIn(group.id, data_source.groups)
+
+    def test_invalidated_by_api_key_changes(self):
+        query = self.factory.create_query()
+        dashboard = self.factory.create_dashboard()
+        self.factory.create_widget(dashboard=dashboard, visualization=self.factory.create_visualization(query_rel=query))
+        db.session.commit()
+
+        with self.app.test_request_context('/'):
+            self.assertEqual([], query.dashboard_api_keys)
+
+            api_key = self.factory.create_api_key(object=dashboard)
+            db.session.flush()
+            self.assertEqual([api_key.api_key], query.dashboard_api_keys)
+
+            api_key.active = False
+            db.session.flush()
+            self.assertEqual([], query.dashboard_api_keys)
+
+    def test_shares_values_across_requests_when_ttl_is_set(self):
+        data_source = self.factory.create_data_source()
+        group = self.factory.create_group()
+
+        with mock.patch.object(settings, 'PERMISSIONS_CACHE_TTL', 60):
+            with self.app.test_request_context('/'):
+                groups = data_source.groups
+
+            self.insert_data_source_group(data_source, group)
+
+            with self.app.test_request_context('/'):
+                self.assertEqual(groups, data_source.groups)
+
+            permissions_cache.invalidate()
+
+            with self.app.test_request_context('/'):
+                self.assertIn(group.id, data_source.groups)
+
+    def test_invalidated_again_when_changes_are_committed(self):
+        data_source = self.factory.create_data_source()
+        group = self.factory.create_group()
+        db.session.commit()
+
+        with mock.patch.object(settings, 'PERMISSIONS_CACHE_TTL', 60):
+            data_source.add_group(group)
+            db.session.flush()
+
+            # Another request reads (and caches) the rows committed before the change.
+            with self.app.test_request_context('/'):
+                permissions_cache.get('data_source_groups', data_source.id, lambda: [])
+
+            db.session.commit()
+
+            with self.app.test_request_context('/'):
+                self.assertIn(group.id, data_source.groups)
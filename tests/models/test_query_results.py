@@ -1,10 +1,19 @@
 #encoding: utf8
 import datetime
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import mock
+import sqlalchemy
+from flask import g
 
 from tests import BaseTestCase
 
-from redash import models
-from redash.utils import utcnow, json_dumps
+from redash import models, settings
+from redash.models import result_codecs, result_stores
+from redash.utils import gen_query_hash, utcnow, json_dumps, json_loads
 
 
 class QueryResultTest(BaseTestCase):
@@ -60,10 +69,280 @@ class QueryResultTest(BaseTestCase):
 
         self.assertEqual(found_query_result.id, qr.id)
 
+    def test_get_latest_loads_data_when_accessed(self):
+        qr = self.factory.create_query_result()
+        data = qr.decoded_data
+        models.db.session.commit()
+        models.db.session.expunge_all()
+
+        found_query_result = models.QueryResult.get_latest(qr.data_source, qr.query_text, 60)
+
+        self.assertIn('data', sqlalchemy.inspect(found_query_result).unloaded)
+        self.assertEqual(data, found_query_result.decoded_data)
+
+    def test_get_by_id_and_org_loads_data_unless_told_otherwise(self):
+        qr = self.factory.create_query_result()
+        models.db.session.commit()
+        models.db.session.expunge_all()
+        self.assertNotIn('data', sqlalchemy.inspect(models.QueryResult.get_by_id_and_org(qr.id, qr.org)).unloaded)
+
+        models.db.session.expunge_all()
+        query_result = models.QueryResult.get_by_id_and_org(qr.id, qr.org, load_data=False)
+        self.assertIn('data', sqlalchemy.inspect(query_result).unloaded)
+
+    def test_records_loaded_payload_bytes_for_the_request(self):
+        qr = self.factory.create_query_result()
+        size = len(qr.data)
+        models.db.session.commit()
+        models.db.session.expunge_all()
+
+        with self.app.test_request_context('/'):
+            query_result = models.QueryResult.query.get(qr.id)
+            self.assertEqual({}, g.get('loaded_bytes', {}))
+
+            query_result.decoded_data
+            self.assertEqual({'query_results': size}, g.loaded_bytes)
+
     def test_store_result_does_not_modify_query_update_at(self):
         original_updated_at = utcnow() - datetime.timedelta(hours=1)
         query = self.factory.create_query(updated_at=original_updated_at)
 
         models.QueryResult.store_result(query.org_id, query.data_source, query.query_hash, query.query_text, "", 0, utcnow())
 
-        self.assertEqual(original_updated_at, query.updated_at)
\ No newline at end of file
+        self.assertEqual(original_updated_at, query.updated_at)
+
+    def test_store_result_uses_the_org_storage_codec(self):
+        data = {'columns': [{'name': 'a', 'type': 'integer'}], 'rows': [{'a': 1}, {'a': 2}]}
+        self.factory.org.set_setting('query_results_storage_codec', result_codecs.CODEC_COLUMNAR_ZLIB)
+
+        query_result, _ = models.QueryResult.store_result(
+            self.factory.org.id, self.factory.data_source, gen_query_hash("SELECT 1"), "SELECT 1",
+            json_dumps(data), 0, utcnow())
+
+        self.assertEqual(result_codecs.CODEC_COLUMNAR_ZLIB, query_result.data_codec)
+        self.assertIsNone(query_result.data)
+        self.assertEqual(data, query_result.to_dict()['data'])
+
+    def test_store_result_with_a_detached_data_source(self):
+        data = {'columns': [{'name': 'a', 'type': 'integer'}], 'rows': [{'a': 1}]}
+        self.factory.org.set_setting('query_results_storage_codec', result_codecs.CODEC_COLUMNAR_ZLIB)
+        data_source = self.factory.data_source
+        org_id = self.factory.org.id
+        models.db.session.flush()
+        models.db.session.expunge(data_source)
+        models.db.session.expunge(self.factory.org)
+
+        query_result, _ = models.QueryResult.store_result(
+            org_id, data_source, gen_query_hash("SELECT 1"), "SELECT 1", json_dumps(data), 0, utcnow())
+
+        self.assertEqual(result_codecs.CODEC_COLUMNAR_ZLIB, query_result.data_codec)
+        self.assertEqual(data, query_result.to_dict()['data'])
+
+    def test_store_result_reuses_the_previous_result_with_the_same_data(self):
+        query = self.factory.create_query()
+        first, _ = models.QueryResult.store_result(
+            query.org_id, query.data_source, query.query_hash, query.query_text, '{"rows": []}', 1, utcnow())
+        later = utcnow() + datetime.timedelta(minutes=1)
+
+        second, query_ids = models.QueryResult.store_result(
+            query.org_id, query.data_source, query.query_hash, query.query_text, '{"rows": []}', 2, later)
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(later, second.retrieved_at)
+        self.assertEqual(2, second.runtime)
+        self.assertEqual(1, second.reuse_count)
+        self.assertEqual([query.id], query_ids)
+        self.assertEqual(1, models.QueryResult.query.filter(models.QueryResult.query_hash == query.query_hash).count())
+        self.assertGreater(models.QueryResult.storage_saved(), 0)
+
+    def test_store_result_stores_new_data(self):
+        query = self.factory.create_query()
+        first, _ = models.QueryResult.store_result(
+            query.org_id, query.data_source, query.query_hash, query.query_text, '{"rows": []}', 1, utcnow())
+
+        second, _ = models.QueryResult.store_result(
+            query.org_id, query.data_source, query.query_hash, query.query_text, '{"rows": [{"a": 1}]}', 1, utcnow())
+
+        self.assertNotEqual(first.id, second.id)
+        self.assertEqual(0, first.reuse_count)
+        self.assertEqual(second, query.latest_query_data)
+
+    def test_to_dict_decodes_legacy_json_results(self):
+        qr = self.factory.create_query_result(data=json_dumps({'columns': [], 'rows': [{'a': 1}]}))
+
+        self.assertIsNone(qr.data_codec)
+        self.assertEqual({'columns': [], 'rows': [{'a': 1}]}, qr.to_dict()['data'])
+
+
+class TestExternalPayloads(BaseTestCase):
+    def setUp(self):
+        super(TestExternalPayloads, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.patches = [
+            mock.patch.object(settings, 'QUERY_RESULTS_PAYLOAD_STORE', result_stores.STORE_FILESYSTEM),
+            mock.patch.object(settings, 'QUERY_RESULTS_PAYLOAD_STORE_THRESHOLD', 100),
+            mock.patch.object(settings, 'QUERY_RESULTS_PAYLOAD_STORE_PATH', self.path),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.path)
+        super(TestExternalPayloads, self).tearDown()
+
+    def store_result(self, data):
+        return models.QueryResult.store_result(
+            self.factory.org.id, self.factory.data_source, gen_query_hash("SELECT 1"), "SELECT 1",
+            json_dumps(data), 0, utcnow())[0]
+
+    def test_stores_large_payloads_externally(self):
+        data = {'columns': [{'name': 'a', 'type': 'integer'}], 'rows': [{'a': i} for i in range(100)]}
+
+        query_result = self.store_result(data)
+
+        self.assertEqual(result_stores.STORE_FILESYSTEM, query_result.payload_store)
+        self.assertIsNone(query_result.data)
+        self.assertTrue(os.path.exists(result_stores.get_store(query_result.payload_store).path(query_result.payload_key)))
+        models.db.session.commit()
+        models.db.session.expunge_all()
+        self.assertEqual(data, models.QueryResult.query.get(query_result.id).decoded_data)
+
+    def test_deletes_payloads_of_rolled_back_results(self):
+        query_result = self.store_result({'columns': [], 'rows': [{'a': i} for i in range(100)]})
+        path = result_stores.get_store(query_result.payload_store).path(query_result.payload_key)
+
+        models.db.session.rollback()
+
+        self.assertFalse(os.path.exists(path))
+
+    def test_counts_storage_saved_by_reusing_externally_stored_results(self):
+        data = {'columns': [], 'rows': [{'a': i} for i in range(100)]}
+        query_result = self.store_result(data)
+
+        self.assertEqual(query_result.id, self.store_result(data).id)
+
+        self.assertEqual(query_result.data_size, models.QueryResult.storage_saved())
+        self.assertEqual(len(json_dumps(data)), query_result.data_size)
+
+    def test_stores_small_payloads_inline(self):
+        query_result = self.store_result({'columns': [], 'rows': []})
+
+        self.assertIsNone(query_result.payload_store)
+        self.assertIsNone(query_result.payload_key)
+        self.assertIsNotNone(query_result.data)
+
+    def test_deleting_unused_results_returns_their_payloads(self):
+        query_result = self.store_result({'columns': [], 'rows': [{'a': i} for i in range(100)]})
+        query_result.retrieved_at = utcnow() - datetime.timedelta(days=30)
+        models.db.session.commit()
+        path = result_stores.get_store(query_result.payload_store).path(query_result.payload_key)
+
+        deleted = models.QueryResult.delete_unused(7)
+        models.db.session.commit()
+        result_stores.delete_payloads((row.payload_store, row.payload_key) for row in deleted)
+
+        self.assertEqual([query_result.id], [row.id for row in deleted])
+        self.assertFalse(os.path.exists(path))
+
+
+class TestColumnarCodec(TestCase):
+    def setUp(self):
+        self.codec = result_codecs.get_codec(result_codecs.CODEC_COLUMNAR_ZLIB)
+
+    def test_round_trip(self):
+        data = {
+            'columns': [{'name': 'a', 'type': 'integer'}, {'name': 'b', 'type': 'string'}],
+            'rows': [{'a': 1, 'b': u'\u05e2\u05d1\u05e8\u05d9\u05ea'}, {'a': 2, 'b': None}]
+        }
+
+        self.assertEqual(data, self.codec.decode(self.codec.encode(data)))
+
+    def test_keeps_keys_missing_from_columns_and_extra_fields(self):
+        data = {'columns': [{'name': 'a'}], 'rows': [{'a': 1}, {'a': 2, 'b': 3}], 'metadata': {'truncated': True}}
+
+        decoded = self.codec.decode(self.codec.encode(data))
+
+        self.assertEqual([{'a': 1, 'b': None}, {'a': 2, 'b': 3}], decoded['rows'])
+        self.assertEqual({'truncated': True}, decoded['metadata'])
+
+    def test_decodes_rows_lazily(self):
+        data = {'columns': [{'name': 'a'}], 'rows': [{'a': 1}, {'a': 2}]}
+
+        decoded = self.codec.decode(self.codec.encode(data), lazy_rows=True)
+
+        self.assertFalse(isinstance(decoded['rows'], list))
+        self.assertEqual(data['rows'], list(decoded['rows']))
+
+    def test_decodes_slices(self):
+        data = {
+            'columns': [{'name': 'a'}, {'name': 'b'}],
+            'rows': [{'a': i, 'b': i * 2} for i in range(10)],
+            'metadata': {'data_scanned': 1}
+        }
+
+        with mock.patch.object(result_codecs, 'BLOCK_ROWS', 3):
+            payload = self.codec.encode(data)
+
+        decoded, total_row_count = self.codec.decode_slice(payload, offset=2, limit=5, columns=['b'])
+
+        self.assertEqual(10, total_row_count)
+        self.assertEqual([{'name': 'b'}], decoded['columns'])
+        self.assertEqual([{'b': i * 2} for i in range(2, 7)], decoded['rows'])
+        self.assertEqual({'data_scanned': 1}, decoded['metadata'])
+        self.assertEqual(data, self.codec.decode(payload))
+        self.assertEqual([], self.codec.decode_slice(payload, offset=20)[0]['rows'])
+
+    def test_slices_json_results(self):
+        data = {'columns': [{'name': 'a'}, {'name': 'b'}], 'rows': [{'a': i, 'b': i} for i in range(10)]}
+
+        sliced, total_row_count = result_codecs.slice_result(data, offset=8, columns=['a'])
+
+        self.assertEqual(10, total_row_count)
+        self.assertEqual([{'name': 'a'}], sliced['columns'])
+        self.assertEqual([{'a': 8}, {'a': 9}], sliced['rows'])
+
+    def test_stores_column_names_once(self):
+        document = result_codecs.to_columnar({'columns': [{'name': 'a'}], 'rows': [{'a': 1}, {'a': 2}]})
+
+        self.assertEqual(['a'], document['keys'])
+        self.assertEqual([[1, 2]], document['values'])
+
+    def test_unknown_codec(self):
+        with self.assertRaises(result_codecs.UnknownCodecError):
+            result_codecs.get_codec('missing')
+
+        self.assertEqual(result_codecs.CODEC_JSON, result_codecs.resolve_codec_name('missing'))
+
+
+class TestResultWriters(TestCase):
+    columns = [{'name': 'a', 'type': 'integer'}, {'name': 'b', 'type': 'string'}]
+    rows = [{'a': i, 'b': u'row {}'.format(i)} for i in range(5)]
+
+    def write(self, codec_name):
+        writer = result_codecs.get_writer(codec_name)
+        writer.write_columns(self.columns)
+        writer.write_rows(self.rows[:3])
+        writer.write_rows(self.rows[3:])
+        return writer.finish()
+
+    def test_json_writer(self):
+        result = self.write(result_codecs.CODEC_JSON)
+
+        self.assertEqual(result_codecs.CODEC_JSON, result.codec)
+        self.assertEqual({'columns': self.columns, 'rows': self.rows}, json_loads(result.payload))
+
+    def test_columnar_writer(self):
+        result = self.write(result_codecs.CODEC_COLUMNAR_ZLIB)
+
+        self.assertEqual(result_codecs.CODEC_COLUMNAR_ZLIB, result.codec)
+        self.assertEqual({'columns': self.columns, 'rows': self.rows},
+                         result_codecs.get_codec(result.codec).decode(result.payload))
+
+    def test_set_data_uses_the_codec_of_encoded_results(self):
+        query_result = models.QueryResult()
+        query_result.set_data(self.write(result_codecs.CODEC_COLUMNAR_ZLIB), result_codecs.CODEC_JSON)
+
+        self.assertEqual(result_codecs.CODEC_COLUMNAR_ZLIB, query_result.data_codec)
+        self.assertEqual(self.rows, query_result.decoded_data['rows'])
@@ -0,0 +1,145 @@
+from unittest import TestCase
+
+import mock
+
+from redash.query_runner import BaseSQLQueryRunner, connection_pool
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+        self.resets = 0
+
+    def close(self):
+        self.closed = True
+
+
+class FakeRunner(BaseSQLQueryRunner):
+    pool_connections = True
+
+    def _get_connection(self):
+        return FakeConnection()
+
+    def _check_connection(self, connection):
+        return connection.healthy
+
+    def _reset_connection(self, connection):
+        connection.resets += 1
+
+
+@mock.patch('redash.settings.QUERY_RUNNER_POOL_SIZE', 2)
+@mock.patch('redash.settings.QUERY_RUNNER_POOL_IDLE_TIMEOUT', 60)
+class TestConnectionPool(TestCase):
+    def setUp(self):
+        connection_pool.close_all()
+        self.runner = FakeRunner({'host': 'example.com'})
+
+    def test_reuses_released_connections(self):
+        connection = self.runner._acquire_connection()
+        self.runner._release_connection(connection)
+
+        self.assertIs(connection, self.runner._acquire_connection())
+        self.assertEqual(1, connection.resets)
+        self.assertFalse(connection.closed)
+
+    def test_pools_are_per_configuration(self):
+        connection = self.runner._acquire_connection()
+        self.runner._release_connection(connection)
+
+        self.assertIsNot(connection, FakeRunner({'host': 'example.org'})._acquire_connection())
+        self.assertIs(connection, FakeRunner({'host': 'example.com'})._acquire_connection())
+
+    def test_closes_connections_that_cant_be_reused(self):
+        connection = self.runner._acquire_connection()
+        self.runner._release_connection(connection, reusable=False)
+
+        self.assertTrue(connection.closed)
+        self.assertIsNot(connection, self.runner._acquire_connection())
+
+    def test_closes_connections_failing_checks(self):
+        connection = self.runner._acquire_connection()
+        self.runner._release_connection(connection)
+        connection.healthy = False
+
+        self.assertIsNot(connection, self.runner._acquire_connection())
+        self.assertTrue(connection.closed)
+
+    def test_keeps_up_to_pool_size_connections(self):
+        connections = [self.runner._acquire_connection() for _ in range(3)]
+        for connection in connections:
+            self.runner._release_connection(connection)
+
+        self.assertEqual([False, False, True], [c.closed for c in connections])
+
+    def test_evicts_idle_connections(self):
+        connection = self.runner._acquire_connection()
+        with mock.patch('time.time', return_value=1000):
+            self.runner._release_connection(connection)
+
+        with mock.patch('time.time', return_value=1061):
+            self.assertIsNot(connection, self.runner._acquire_connection())
+        self.assertTrue(connection.closed)
+
+    def test_records_hits_and_misses(self):
+        with mock.patch('redash.statsd_client.incr') as incr:
+            self.runner._release_connection(self.runner._acquire_connection())
+            self.runner._acquire_connection()
+
+        self.assertEqual(['query_runner.pool.fakerunner.miss', 'query_runner.pool.fakerunner.hit'],
+                         [args[0] for args, _ in incr.call_args_list])
+
+    def test_closes_connections_when_disabled(self):
+        with mock.patch('redash.settings.QUERY_RUNNER_POOL_SIZE', 0):
+            connection = self.runner._acquire_connection()
+            self.runner._release_connection(connection)
+
+        self.assertTrue(connection.closed)
+
+
+@mock.patch('redash.settings.QUERY_RUNNER_POOL_IDLE_TIMEOUT', 60)
+class TestSharedClient(TestCase):
+    def setUp(self):
+        connection_pool.close_all()
+        self.runner = FakeRunner({'host': 'example.com'})
+
+    def test_shares_client_between_queries(self):
+        with connection_pool.shared_client(self.runner, FakeConnection) as client:
+            with connection_pool.shared_client(self.runner, FakeConnection) as other:
+                self.assertIs(client, other)
+
+        with connection_pool.shared_client(self.runner, FakeConnection) as other:
+            self.assertIs(client, other)
+
+    def test_clients_are_per_configuration(self):
+        with connection_pool.shared_client(self.runner, FakeConnection) as client:
+            pass
+
+        with connection_pool.shared_client(FakeRunner({'host': 'example.org'}), FakeConnection) as other:
+            self.assertIsNot(client, other)
+
+    def test_closes_idle_clients(self):
+        with mock.patch('time.time', return_value=1000):
+            with connection_pool.shared_client(self.runner, FakeConnection) as client:
+                pass
+
+        with mock.patch('time.time', return_value=1061):
+            with connection_pool.shared_client(FakeRunner({'host': 'example.org'}), FakeConnection):
+                pass
+        self.assertTrue(client.closed)
+
+    def test_keeps_clients_in_use(self):
+        with mock.patch('time.time', return_value=1000):
+            with connection_pool.shared_client(self.runner, FakeConnection) as client:
+                with mock.patch('time.time', return_value=1061):
+                    with connection_pool.shared_client(FakeRunner({'host': 'example.org'}), FakeConnection):
+                        pass
+                self.assertFalse(client.closed)
+
+    def test_close_all_closes_clients(self):
+        with connection_pool.shared_client(self.runner, FakeConnection) as client:
+            pass
+
+        connection_pool.close_all()
+
+        self.assertTrue(client.closed)
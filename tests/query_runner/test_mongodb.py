@@ -4,7 +4,7 @@ from unittest import TestCase
 from pytz import utc
 from freezegun import freeze_time
 
-from redash.query_runner.mongodb import parse_query_json, parse_results, _get_column_by_name
+from redash.query_runner.mongodb import parse_query_json, parse_results, read_results, _get_column_by_name
 from redash.utils import json_dumps, parse_human_time
 
 
@@ -146,3 +146,24 @@ class TestMongoResults(TestCase):
         self.assertIsNotNone(_get_column_by_name(columns, 'nested.a'))
         self.assertIsNotNone(_get_column_by_name(columns, 'nested.b'))
         self.assertIsNotNone(_get_column_by_name(columns, 'nested.c'))
+
+    def test_keeps_columns_in_first_seen_order(self):
+        rows, columns = parse_results([{'b': 1}, {'a': 2, 'b': 3, 'c': {'d': 4}}])
+
+        self.assertEqual(['b', 'a', 'c.d'], [c['name'] for c in columns])
+
+    def test_stops_reading_at_max_rows(self):
+        raw_results = iter([{'column': i} for i in range(5)])
+
+        rows, columns, truncated = read_results(raw_results, max_rows=3)
+
+        self.assertEqual([{'column': 0}, {'column': 1}, {'column': 2}], rows)
+        self.assertTrue(truncated)
+        # The cursor isn't read any further than the first document past the limit.
+        self.assertEqual({'column': 4}, next(raw_results))
+
+    def test_not_truncated_when_all_rows_fit(self):
+        rows, columns, truncated = read_results([{'column': 1}, {'column': 2}], max_rows=2)
+
+        self.assertEqual(2, len(rows))
+        self.assertFalse(truncated)
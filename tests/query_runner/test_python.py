@@ -0,0 +1,39 @@
+import shutil
+import tempfile
+
+import mock
+
+from tests import BaseTestCase
+from redash import settings
+from redash.models import db, result_stores
+from redash.query_runner.python import Python
+from redash.utils import json_dumps
+
+
+class TestGetQueryResult(BaseTestCase):
+    def test_returns_result_data(self):
+        data = {'columns': [{'name': 'a', 'type': 'integer'}], 'rows': [{'a': 1}]}
+        query_result = self.factory.create_query_result(data=json_dumps(data))
+        query = self.factory.create_query(latest_query_data=query_result)
+
+        self.assertEqual(data, Python.get_query_result(query.id))
+
+    def test_returns_externally_stored_result_data(self):
+        data = {'columns': [{'name': 'a', 'type': 'integer'}], 'rows': [{'a': 1}]}
+        query_result = self.factory.create_query_result(data=json_dumps(data))
+        query = self.factory.create_query(latest_query_data=query_result)
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+
+        with mock.patch.object(settings, 'QUERY_RESULTS_PAYLOAD_STORE_PATH', path):
+            result_stores.get_store(result_stores.STORE_FILESYSTEM).write(query_result, query_result.data)
+            db.session.commit()
+
+            self.assertIsNone(query_result.data)
+            self.assertEqual(data, Python.get_query_result(query.id))
+
+    def test_raises_when_query_has_no_results(self):
+        query = self.factory.create_query()
+
+        with self.assertRaises(Exception):
+            Python.get_query_result(query.id)
@@ -1,9 +1,16 @@
+import os
+import shutil
 import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
 from unittest import TestCase
 
 import pytest
 
-from redash.query_runner.query_results import (CreateTableError, PermissionError, _load_query, create_table, extract_cached_query_ids, extract_query_ids, fix_column_name)
+from redash.query_runner import InterruptException
+from redash.query_runner.query_results import (ConcurrentQueries, CreateTableError, MaterializationCache, PermissionError, _load_query, create_join_indexes, create_table, extract_cached_query_ids, extract_join_columns, extract_query_ids, fix_column_name)
 from tests import BaseTestCase
 
 
@@ -113,6 +120,43 @@ class TestCreateTable(TestCase):
             len(list(connection.execute('SELECT * FROM query_123'))), 2)
 
 
+    def test_keeps_values_as_returned_by_default(self):
+        connection = sqlite3.connect(':memory:')
+        results = {'columns': [{'name': 'test1', 'type': 'integer'}, {'name': 'test2', 'type': 'string'}],
+                   'rows': [{'test1': '1', 'test2': 2}]}
+        create_table(connection, 'query_123', results)
+        self.assertEquals(
+            [('text', 'integer')],
+            list(connection.execute('SELECT typeof(test1), typeof(test2) FROM query_123')))
+
+    def test_uses_column_types_as_affinities(self):
+        connection = sqlite3.connect(':memory:')
+        results = {'columns': [{'name': 'test1', 'type': 'integer'}, {'name': 'test2', 'type': 'string'},
+                               {'name': 'test3'}],
+                   'rows': [{'test1': '1', 'test2': 2, 'test3': '3'}]}
+        create_table(connection, 'query_123', results, typed_columns=True)
+        self.assertEquals(
+            [('integer', 'text', 'text')],
+            list(connection.execute('SELECT typeof(test1), typeof(test2), typeof(test3) FROM query_123')))
+
+
+class TestJoinIndexes(TestCase):
+    def test_extracts_join_columns(self):
+        query = 'SELECT * FROM query_1 a JOIN cached_query_2 AS b ON a.id = b."parent_id" JOIN users u ON u.id = a.user_id'
+        self.assertEquals([('query_1', 'id'), ('cached_query_2', '"parent_id"'), ('query_1', 'user_id')],
+                          extract_join_columns(query))
+
+    def test_creates_indexes(self):
+        connection = sqlite3.connect(':memory:')
+        create_table(connection, 'query_1', {'columns': [{'name': 'id'}], 'rows': []})
+        create_table(connection, 'query_2', {'columns': [{'name': 'parent_id'}], 'rows': []})
+
+        create_join_indexes(connection, 'SELECT * FROM query_1 JOIN query_2 ON query_1.id = query_2.parent_id AND query_1.missing = 1')
+
+        indexes = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        self.assertEquals(['query_1_id_idx', 'query_2_parent_id_idx'], indexes)
+
+
 class TestGetQuery(BaseTestCase):
     # test query from different account
     def test_raises_exception_for_query_from_different_account(self):
@@ -136,6 +180,108 @@ class TestGetQuery(BaseTestCase):
         self.assertEquals(query, loaded)
 
 
+class TestConcurrentQueries(BaseTestCase):
+    def test_returns_results_by_key(self):
+        queries = ConcurrentQueries(2)
+        for i in range(3):
+            queries.submit(i, lambda value: value * 2, i)
+        queries.start()
+
+        self.assertEquals({0: 0, 1: 2, 2: 4}, queries.wait())
+
+    def test_raises_errors(self):
+        def fail():
+            raise Exception("Failed.")
+
+        queries = ConcurrentQueries(2)
+        queries.submit(1, fail)
+        queries.start()
+
+        self.assertRaises(Exception, queries.wait)
+
+    def test_cancel_interrupts_running_queries(self):
+        started = threading.Event()
+        interrupted = threading.Event()
+
+        def run():
+            started.set()
+            try:
+                while True:
+                    time.sleep(0.01)
+            except InterruptException:
+                interrupted.set()
+
+        queries = ConcurrentQueries(1)
+        queries.submit(1, run)
+        queries.submit(2, lambda: 2)
+        queries.start()
+        started.wait(5)
+        queries.cancel()
+
+        self.assertTrue(interrupted.wait(5))
+        self.assertTrue(queries.pending.empty())
+
+    def test_reports_queries_interrupted_as_they_finish(self):
+        queries = ConcurrentQueries(1)
+        # Interrupted by `cancel` right before returning, so the exception is delivered as late as possible.
+        queries.submit(1, lambda: queries.cancel())
+        queries.start()
+
+        key, _, error = queries.results.get(True, 5)
+
+        self.assertEqual(1, key)
+        self.assertIn(type(error), (type(None), InterruptException))
+        self.assertEqual({}, queries.running)
+
+
+FakeQueryResult = namedtuple('FakeQueryResult', ['id', 'decoded_data'])
+
+
+class TestMaterializationCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.query_result = FakeQueryResult(1, {'columns': [{'name': 'a', 'type': 'integer'}],
+                                                'rows': [{'a': 1}, {'a': 2}]})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_attaches_materialized_results(self):
+        cache = MaterializationCache(self.directory, 1024 ** 2)
+        connection = sqlite3.connect(':memory:')
+
+        self.assertTrue(cache.attach(connection, 'cached_query_1', self.query_result))
+        self.assertTrue(cache.attach(connection, 'cached_query_2', self.query_result))
+        self.assertEquals([(3,)], list(connection.execute('SELECT sum(a) FROM cached_query_1')))
+        self.assertEquals([(3,)], list(connection.execute('SELECT sum(a) FROM cached_query_2')))
+        self.assertEquals(['query_result_1.sqlite'], os.listdir(self.directory))
+
+    def test_reuses_materialized_results(self):
+        MaterializationCache(self.directory, 1024 ** 2).attach(sqlite3.connect(':memory:'), 'cached_query_1',
+                                                               self.query_result)
+
+        connection = sqlite3.connect(':memory:')
+        MaterializationCache(self.directory, 1024 ** 2).attach(connection, 'cached_query_1',
+                                                               FakeQueryResult(1, None))
+        self.assertEquals([(3,)], list(connection.execute('SELECT sum(a) FROM cached_query_1')))
+
+    def test_evicts_least_recently_used_results(self):
+        MaterializationCache(self.directory, 1).attach(sqlite3.connect(':memory:'), 'cached_query_1',
+                                                       self.query_result)
+        MaterializationCache(self.directory, 1).attach(sqlite3.connect(':memory:'), 'cached_query_2',
+                                                       self.query_result._replace(id=2))
+
+        self.assertEquals(['query_result_2.sqlite'], os.listdir(self.directory))
+
+    def test_keeps_typed_results_apart(self):
+        MaterializationCache(self.directory, 1024 ** 2).attach(sqlite3.connect(':memory:'), 'cached_query_1',
+                                                               self.query_result)
+        MaterializationCache(self.directory, 1024 ** 2, typed_columns=True).attach(
+            sqlite3.connect(':memory:'), 'cached_query_1', self.query_result)
+
+        self.assertEquals(['query_result_1.sqlite', 'query_result_1_typed.sqlite'], sorted(os.listdir(self.directory)))
+
+
 class TestExtractCachedQueryIds(TestCase):
     def test_works_with_simple_query(self):
         query = "SELECT 1"
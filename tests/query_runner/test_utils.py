@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 from unittest import TestCase
 
-from redash.query_runner import TYPE_DATETIME, TYPE_FLOAT, TYPE_INTEGER, TYPE_BOOLEAN, TYPE_STRING, guess_type
+from redash.query_runner import BaseQueryRunner, TYPE_DATETIME, TYPE_FLOAT, TYPE_INTEGER, TYPE_BOOLEAN, TYPE_STRING, guess_type, infer_column_types
+from redash.utils import json_dumps
 
 
 class TestGuessType(TestCase):
@@ -32,3 +33,70 @@ class TestGuessType(TestCase):
 
     def test_detects_date(self):
         self.assertEqual(guess_type('2018-10-31'), TYPE_DATETIME)
+        self.assertEqual(guess_type('2018-10-31T10:12:41.318Z'), TYPE_DATETIME)
+        self.assertEqual(guess_type('Oct 31 2018'), TYPE_DATETIME)
+
+
+class TestInferColumnTypes(TestCase):
+    def test_infers_each_column(self):
+        rows = [{'a': 1, 'b': 'x', 'c': '2018-10-31'}, {'a': 2, 'b': 'y', 'c': '2018-11-01'}]
+
+        self.assertEqual({'a': TYPE_INTEGER, 'b': TYPE_STRING, 'c': TYPE_DATETIME},
+                         infer_column_types(rows, ['a', 'b', 'c']))
+
+    def test_ignores_empty_values(self):
+        rows = [{'a': None}, {'a': 1}, {'a': ''}, {}]
+
+        self.assertEqual({'a': TYPE_INTEGER, 'b': TYPE_STRING}, infer_column_types(rows, ['a', 'b']))
+
+    def test_mixed_types(self):
+        rows = [{'a': 1, 'b': 1}, {'a': 1.5, 'b': 'x'}]
+
+        self.assertEqual({'a': TYPE_FLOAT, 'b': TYPE_STRING}, infer_column_types(rows, ['a', 'b']))
+
+    def test_samples_rows(self):
+        rows = [{'a': i} for i in range(100)]
+        seen = []
+
+        def guess(value):
+            seen.append(value)
+            return guess_type(value)
+
+        self.assertEqual({'a': TYPE_INTEGER}, infer_column_types(rows, ['a'], guess=guess, sample_size=10))
+        self.assertEqual(range(0, 100, 10), seen)
+
+    def test_stops_once_a_column_is_a_string(self):
+        rows = [{'a': 'x'}, {'a': 1}, {'a': 2}]
+        seen = []
+
+        def guess(value):
+            seen.append(value)
+            return guess_type(value)
+
+        self.assertEqual({'a': TYPE_STRING}, infer_column_types(rows, ['a'], guess=guess))
+        self.assertEqual(['x'], seen)
+
+
+class TestRunQueryStreamFallback(TestCase):
+    class FakeQueryRunner(BaseQueryRunner):
+        rows_batch_size = 2
+
+        def __init__(self, result):
+            super(TestRunQueryStreamFallback.FakeQueryRunner, self).__init__({})
+            self.result = result
+
+        def run_query(self, query, user):
+            return self.result
+
+    def test_yields_columns_then_batches(self):
+        data = {'columns': [{'name': 'a'}], 'rows': [{'a': 1}, {'a': 2}, {'a': 3}]}
+        runner = self.FakeQueryRunner((json_dumps(data), None))
+
+        self.assertEqual([data['columns'], [{'a': 1}, {'a': 2}], [{'a': 3}]],
+                         list(runner.run_query_stream("SELECT 1", None)))
+
+    def test_raises_errors(self):
+        runner = self.FakeQueryRunner((None, "Query failed."))
+
+        with self.assertRaises(Exception):
+            list(runner.run_query_stream("SELECT 1", None))
@@ -0,0 +1,61 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from tests import BaseTestCase
+
+from redash.models import db
+from redash.serializers import serialize_dashboard
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+class DashboardSerializationTest(BaseTestCase):
+    def create_dashboard(self, widgets_count):
+        dashboard = self.factory.create_dashboard()
+        restricted_ds = self.factory.create_data_source(group=self.factory.create_group())
+
+        for i in range(widgets_count):
+            query = self.factory.create_query(data_source=restricted_ds if i % 2 else self.factory.data_source,
+                                              last_modified_by=self.factory.create_user())
+            vis = self.factory.create_visualization(query_rel=query)
+            self.factory.create_widget(visualization=vis, dashboard=dashboard)
+        self.factory.create_widget(dashboard=dashboard, visualization=None)
+
+        db.session.commit()
+
+        return dashboard
+
+    def serialize(self, dashboard):
+        # Start from an empty identity map, so both dashboards are loaded the same way.
+        db.session.expire_all()
+        with count_queries() as statements:
+            serialize_dashboard(dashboard, with_widgets=True, user=self.factory.user, with_favorite_state=False)
+
+        return statements
+
+    def test_query_count_does_not_depend_on_widget_count(self):
+        few_widgets = self.create_dashboard(2)
+        many_widgets = self.create_dashboard(10)
+
+        self.assertEqual(len(self.serialize(few_widgets)), len(self.serialize(many_widgets)))
+
+    def test_restricts_widgets_of_inaccessible_data_sources(self):
+        dashboard = self.create_dashboard(2)
+
+        serialized = serialize_dashboard(dashboard, with_widgets=True, user=self.factory.user, with_favorite_state=False)
+
+        self.assertEqual([False, True, False], [w.get('restricted', False) for w in serialized['widgets']])
+        self.assertIn('visualization', serialized['widgets'][0])
@@ -2,11 +2,14 @@ import datetime
 import csv
 import cStringIO
 
+import mock
+
 from tests import BaseTestCase
 
 from redash import models
 from redash.utils import utcnow, json_dumps
-from redash.serializers import serialize_query_result, serialize_query_result_to_csv
+from redash.serializers import serialize_query_result, serialize_query_result_to_csv, stream_query_result_to_csv
+from redash.serializers import query_result as query_result_serializer
 
 
 data = {
@@ -70,3 +73,13 @@ class CsvSerializationTest(BaseTestCase):
 
         self.assertEqual(rows[3]['datetime'], '459')
         self.assertEqual(rows[3]['date'], '123')
+
+    def test_streams_csv_in_chunks(self):
+        query_result = self.factory.create_query_result(data=json_dumps(data))
+
+        with self.app.test_request_context('/'), mock.patch.object(query_result_serializer, 'EXPORT_CHUNK_SIZE', 1):
+            chunks = list(stream_query_result_to_csv(query_result))
+            content = serialize_query_result_to_csv(query_result)
+
+        self.assertGreater(len(chunks), len(data['rows']))
+        self.assertEqual(content, ''.join(chunks))
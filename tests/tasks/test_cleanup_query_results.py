@@ -0,0 +1,52 @@
+import datetime
+
+from mock import patch
+
+from tests import BaseTestCase
+from redash import settings
+from redash.models import db, QueryResult
+from redash.tasks import cleanup_query_results
+from redash.tasks.queries import _next_cleanup_batch_size
+from redash.utils import utcnow
+
+
+class TestCleanupQueryResults(BaseTestCase):
+    def test_deletes_unused_results_in_batches(self):
+        two_weeks_ago = utcnow() - datetime.timedelta(days=14)
+        unused = [self.factory.create_query_result(retrieved_at=two_weeks_ago) for _ in range(5)]
+        used = self.factory.create_query_result(retrieved_at=two_weeks_ago)
+        self.factory.create_query(latest_query_data=used)
+        recent = self.factory.create_query_result()
+        unused_ids = [qr.id for qr in unused]
+        db.session.commit()
+
+        with patch.object(settings, 'QUERY_RESULTS_CLEANUP_COUNT', 2), \
+                patch('redash.tasks.queries.models.QueryResult.delete_unused',
+                      wraps=QueryResult.delete_unused) as delete_unused:
+            cleanup_query_results()
+
+        self.assertGreater(delete_unused.call_count, 1)
+        remaining = [id for (id,) in db.session.query(QueryResult.id)]
+        self.assertItemsEqual([used.id, recent.id], remaining)
+        self.assertFalse(set(unused_ids) & set(remaining))
+
+    def test_stops_when_the_time_budget_is_spent(self):
+        two_weeks_ago = utcnow() - datetime.timedelta(days=14)
+        for _ in range(3):
+            self.factory.create_query_result(retrieved_at=two_weeks_ago)
+        db.session.commit()
+
+        with patch.object(settings, 'QUERY_RESULTS_CLEANUP_COUNT', 1), \
+                patch.object(settings, 'QUERY_RESULTS_CLEANUP_TIME_BUDGET', 0):
+            cleanup_query_results()
+
+        self.assertEqual(3, QueryResult.query.count())
+
+    def test_adapts_batch_size_to_delete_duration(self):
+        with patch.object(settings, 'QUERY_RESULTS_CLEANUP_BATCH_DURATION', 1), \
+                patch.object(settings, 'QUERY_RESULTS_CLEANUP_MAX_COUNT', 1000):
+            self.assertEqual(200, _next_cleanup_batch_size(100, 0.1))
+            self.assertEqual(100, _next_cleanup_batch_size(100, 0.7))
+            self.assertEqual(50, _next_cleanup_batch_size(100, 3))
+            self.assertEqual(1000, _next_cleanup_batch_size(800, 0.1))
+            self.assertEqual(1, _next_cleanup_batch_size(1, 3))
@@ -0,0 +1,176 @@
+import time
+
+import mock
+
+from tests import BaseTestCase
+from redash import redis_connection, settings
+from redash.monitor import get_data_sources_concurrency
+from redash.tasks import concurrency
+from redash.tasks.queries import QueryTask, enqueue_query, execute_query
+
+
+def task_options(query_id):
+    return dict(args=['SELECT 1', 1, {}, None, None, False], argsrepr='{"query_id": %d}' % query_id,
+                queue='queries', soft_time_limit=None)
+
+
+def sent_job_ids(task):
+    return [kwargs['task_id'] for _, kwargs in task.apply_async.call_args_list]
+
+
+class TestConcurrencyLimit(BaseTestCase):
+    def setUp(self):
+        super(TestConcurrencyLimit, self).setUp()
+        self.task = mock.Mock()
+
+    def test_sends_jobs_up_to_the_limit(self):
+        job_ids = [concurrency.submit(self.task, 1, 2, 'lock', task_options(i)) for i in range(3)]
+
+        self.assertEqual(job_ids[:2], sent_job_ids(self.task))
+        self.assertEqual([job_ids[2]], [job['id'] for job in concurrency.waiting_jobs(1)])
+
+    def test_release_sends_waiting_jobs_in_order(self):
+        job_ids = [concurrency.submit(self.task, 1, 1, 'lock', task_options(i)) for i in range(3)]
+
+        concurrency.release(self.task, job_ids[0])
+        self.assertEqual(job_ids[:2], sent_job_ids(self.task))
+
+        concurrency.release(self.task, job_ids[1])
+        self.assertEqual(job_ids, sent_job_ids(self.task))
+        self.assertEqual([], concurrency.waiting_jobs(1))
+
+    def test_limits_are_per_data_source(self):
+        concurrency.submit(self.task, 1, 1, 'lock', task_options(1))
+        concurrency.submit(self.task, 2, 1, 'lock', task_options(2))
+
+        self.assertEqual(2, self.task.apply_async.call_count)
+
+    def test_new_jobs_dont_skip_waiting_jobs(self):
+        first = concurrency.submit(self.task, 1, 1, 'lock', task_options(1))
+        second = concurrency.submit(self.task, 1, 1, 'lock', task_options(2))
+        # The slot was released without sending the waiting job (the job's worker died).
+        redis_connection.delete(concurrency._slots_key(1))
+
+        third = concurrency.submit(self.task, 1, 1, 'lock', task_options(3))
+
+        self.assertEqual([first, second], sent_job_ids(self.task))
+        self.assertEqual([third], [job['id'] for job in concurrency.waiting_jobs(1)])
+
+    def test_cancel_removes_waiting_job_and_its_lock(self):
+        concurrency.submit(self.task, 1, 1, 'lock1', task_options(1))
+        job_id = concurrency.submit(self.task, 1, 1, 'lock2', task_options(2))
+        redis_connection.set('lock2', job_id)
+
+        concurrency.cancel(self.task, job_id)
+
+        self.assertEqual([], concurrency.waiting_jobs(1))
+        self.assertIsNone(redis_connection.get('lock2'))
+        self.assertEqual(1, self.task.apply_async.call_count)
+
+    def test_cancel_releases_slot_of_sent_job(self):
+        first = concurrency.submit(self.task, 1, 1, 'lock', task_options(1))
+        second = concurrency.submit(self.task, 1, 1, 'lock', task_options(2))
+
+        concurrency.cancel(self.task, first)
+
+        self.assertEqual([first, second], sent_job_ids(self.task))
+
+    def test_cancel_leaves_slot_of_started_job(self):
+        first = concurrency.submit(self.task, 1, 1, 'lock', task_options(1))
+        second = concurrency.submit(self.task, 1, 1, 'lock', task_options(2))
+
+        with concurrency.keep_slot(first):
+            concurrency.cancel(self.task, first)
+            self.assertEqual([first], sent_job_ids(self.task))
+        concurrency.release(self.task, first)
+
+        self.assertEqual([first, second], sent_job_ids(self.task))
+
+    def test_slots_of_jobs_waiting_in_celery_dont_expire(self):
+        with mock.patch('time.time', return_value=1000):
+            first = concurrency.submit(self.task, 1, 1, 'lock', task_options(1))
+        with mock.patch('time.time', return_value=1000 + 2 * settings.DATA_SOURCE_SLOT_TIMEOUT):
+            concurrency.submit(self.task, 1, 1, 'lock', task_options(2))
+
+        self.assertEqual([first], sent_job_ids(self.task))
+
+    def test_refreshed_slots_dont_expire(self):
+        with mock.patch('time.time', return_value=1000):
+            first = concurrency.submit(self.task, 1, 1, 'lock', task_options(1))
+        with mock.patch('time.time', return_value=4000):
+            concurrency.refresh(first, 1)
+        with mock.patch('time.time', return_value=4700):
+            concurrency.submit(self.task, 1, 1, 'lock', task_options(2))
+
+        self.assertEqual([first], sent_job_ids(self.task))
+
+    @mock.patch('redash.settings.DATA_SOURCE_SLOT_TIMEOUT', 0.03)
+    def test_keep_slot_refreshes_slot_while_running(self):
+        job_id = concurrency.submit(self.task, 1, 1, 'lock', task_options(1))
+
+        with mock.patch.object(concurrency, 'refresh') as refresh:
+            with concurrency.keep_slot(job_id):
+                time.sleep(0.1)
+
+        refresh.assert_called_with(job_id, 1)
+
+    def test_status(self):
+        for i in range(3):
+            concurrency.submit(self.task, 1, 1, 'lock', task_options(i))
+
+        status = concurrency.get_status(1, 1)
+
+        self.assertEqual(1, status['limit'])
+        self.assertEqual(1, status['running'])
+        self.assertEqual(2, status['waiting'])
+        self.assertGreaterEqual(status['wait_time'], 0)
+
+
+class TestEnqueueWithConcurrencyLimit(BaseTestCase):
+    @mock.patch('redash.settings.dynamic_settings.data_source_max_concurrency', return_value=1)
+    def test_over_limit_jobs_wait_for_a_slot(self, _):
+        query = self.factory.create_query()
+        execute_query.apply_async = mock.MagicMock()
+
+        first = enqueue_query(query.query_text, query.data_source, query.user_id, False, None, {'Query ID': query.id})
+        second = enqueue_query(query.query_text + '2', query.data_source, query.user_id, False, None,
+                               {'Query ID': query.id})
+
+        self.assertEqual(1, execute_query.apply_async.call_count)
+        self.assertEqual(first.id, execute_query.apply_async.call_args[1]['task_id'])
+        self.assertEqual(1, QueryTask(job_id=second.id).to_dict()['status'])
+
+        concurrency.release(execute_query, first.id)
+
+        self.assertEqual(2, execute_query.apply_async.call_count)
+        self.assertEqual(second.id, execute_query.apply_async.call_args[1]['task_id'])
+
+    @mock.patch('redash.settings.dynamic_settings.data_source_max_concurrency', return_value=1)
+    def test_jobs_failing_to_start_release_their_slot(self, _):
+        query = self.factory.create_query()
+        execute_query.apply_async = mock.MagicMock()
+
+        first = enqueue_query(query.query_text, query.data_source, query.user_id, False, None, {'Query ID': query.id})
+        second = enqueue_query(query.query_text + '2', query.data_source, query.user_id, False, None,
+                               {'Query ID': query.id})
+
+        with mock.patch('redash.tasks.queries.QueryExecutor.__init__', side_effect=ValueError("deleted")):
+            result = execute_query.apply(args=[query.query_text, query.data_source.id, {}], task_id=first.id)
+
+        self.assertIsInstance(result.result, ValueError)
+        self.assertEqual(2, execute_query.apply_async.call_count)
+        self.assertEqual(second.id, execute_query.apply_async.call_args[1]['task_id'])
+
+    @mock.patch('redash.settings.dynamic_settings.data_source_max_concurrency', return_value=2)
+    def test_shows_in_monitor(self, _):
+        query = self.factory.create_query()
+        execute_query.apply_async = mock.MagicMock()
+
+        for i in range(3):
+            enqueue_query(query.query_text + str(i), query.data_source, query.user_id, False, None,
+                          {'Query ID': query.id})
+
+        status = get_data_sources_concurrency()[query.data_source.id]
+        self.assertEqual(2, status['limit'])
+        self.assertEqual(2, status['running'])
+        self.assertEqual(1, status['waiting'])
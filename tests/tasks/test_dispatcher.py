@@ -0,0 +1,120 @@
+import mock
+
+from tests import BaseTestCase
+from redash import redis_connection
+from redash.tasks import dispatcher
+from redash.tasks.queries import QueryTask, enqueue_query, execute_query
+
+
+class FakeDataSource(object):
+    def __init__(self, id, org_id):
+        self.id = id
+        self.org_id = org_id
+
+
+def task_options():
+    return dict(args=['SELECT 1', 1, {}, None, None, False], argsrepr='{}', queue='queries', soft_time_limit=None)
+
+
+class TestDispatcher(BaseTestCase):
+    def setUp(self):
+        super(TestDispatcher, self).setUp()
+        self.sent = []
+        self.users = {}
+        self.task = mock.Mock()
+        self.task.apply_async.side_effect = self.send
+
+    def send(self, **kwargs):
+        self.sent.append(kwargs['task_id'])
+        # Stands for the job waiting in the Celery queue for a worker.
+        redis_connection.rpush('queries', kwargs['task_id'])
+
+    def submit(self, user_id, org_id=1, is_api_key=True, scheduled=False):
+        job_id = dispatcher.submit(self.task, FakeDataSource(1, org_id), None, 'lock', task_options(), user_id,
+                                   is_api_key, scheduled)
+        self.users[job_id] = user_id
+        return job_id
+
+    def run_jobs(self):
+        while redis_connection.lpop('queries'):
+            dispatcher.dispatch(self.task, 'queries')
+
+        return [self.users[job_id] for job_id in self.sent]
+
+    @mock.patch('redash.settings.QUERY_DISPATCHER_BACKLOG', 1)
+    def test_shares_workers_between_users(self):
+        for _ in range(3):
+            self.submit('heavy')
+        self.submit('light')
+
+        self.assertEqual(['heavy', 'light', 'heavy', 'heavy'], self.run_jobs())
+
+    @mock.patch('redash.settings.QUERY_DISPATCHER_BACKLOG', 1)
+    def test_shares_workers_between_orgs(self):
+        for user_id in range(4):
+            self.submit(user_id, org_id=1)
+        self.submit(10, org_id=2)
+        self.submit(11, org_id=2)
+
+        self.assertEqual([0, 10, 1, 11, 2, 3], self.run_jobs())
+
+    @mock.patch('redash.settings.QUERY_DISPATCHER_BACKLOG', 1)
+    @mock.patch('redash.settings.dynamic_settings.user_query_weight', side_effect=lambda user_id, *args: user_id)
+    def test_weighs_users(self, _):
+        for _ in range(6):
+            self.submit(2)
+        for _ in range(3):
+            self.submit(1)
+
+        self.assertEqual([2, 1, 2, 1, 2, 2, 1, 2, 2], self.run_jobs())
+
+    @mock.patch('redash.settings.QUERY_DISPATCHER_BACKLOG', 1)
+    def test_sends_interactive_jobs_first(self):
+        self.submit('api')
+        self.submit('api')
+        self.submit('scheduler', is_api_key=False, scheduled=True)
+        self.submit('user', is_api_key=False)
+
+        self.assertEqual(['api', 'user', 'scheduler', 'api'], self.run_jobs())
+
+    @mock.patch('redash.settings.QUERY_DISPATCHER_BACKLOG', 1)
+    def test_cancel_removes_waiting_job_and_its_lock(self):
+        self.submit('user')
+        job_id = self.submit('user')
+        redis_connection.set('lock', job_id)
+
+        self.assertTrue(dispatcher.cancel(job_id))
+
+        self.assertIsNone(redis_connection.get('lock'))
+        self.assertEqual([], dispatcher.waiting_jobs('queries'))
+        self.assertEqual(['user'], self.run_jobs())
+
+    @mock.patch('redash.settings.QUERY_DISPATCHER_BACKLOG', 1)
+    def test_finished_jobs_send_the_next_job_of_their_queue(self):
+        first = self.submit('user')
+        self.submit('user')
+        redis_connection.lpop('queries')
+
+        dispatcher.finish(self.task, first)
+
+        self.assertEqual(['user', 'user'], [self.users[job_id] for job_id in self.sent])
+        self.assertEqual([], dispatcher.waiting_jobs('queries'))
+
+
+class TestEnqueueWithDispatcher(BaseTestCase):
+    @mock.patch('redash.settings.QUERY_DISPATCHER_ENABLED', True)
+    @mock.patch('redash.settings.QUERY_DISPATCHER_BACKLOG', 0)
+    def test_jobs_wait_to_be_dispatched(self):
+        query = self.factory.create_query()
+        execute_query.apply_async = mock.MagicMock()
+
+        job = enqueue_query(query.query_text, query.data_source, query.user_id, False, None, {'Query ID': query.id})
+
+        self.assertEqual(0, execute_query.apply_async.call_count)
+        self.assertEqual([job.id], [j['id'] for j in dispatcher.waiting_jobs(query.data_source.queue_name)])
+        self.assertEqual(1, job.to_dict()['status'])
+
+        job.cancel()
+
+        self.assertEqual([], dispatcher.waiting_jobs(query.data_source.queue_name))
+        self.assertEqual(4, QueryTask(job_id=job.id).to_dict()['status'])
@@ -63,6 +63,20 @@ class QueryExecutorTests(BaseTestCase):
             result = models.QueryResult.query.get(result_id)
             self.assertEqual(result.data, '{1,2}')
 
+    def test_success_streaming(self):
+        """
+        With streaming enabled, the rows yielded by the query runner are encoded as they arrive.
+        """
+        cm = mock.patch("celery.app.task.Context.delivery_info", {'routing_key': 'test'})
+        columns = [{'name': 'a', 'friendly_name': 'a', 'type': 'integer'}]
+        with cm, mock.patch('redash.settings.FEATURE_STREAM_QUERY_RESULTS', True), \
+                mock.patch.object(PostgreSQL, "run_query_stream") as qr:
+            qr.return_value = (batch for batch in [columns, [{'a': 1}, {'a': 2}], [{'a': 3}]])
+            result_id = execute_query("SELECT 1", self.factory.data_source.id, {})
+            self.assertEqual(1, qr.call_count)
+            result = models.QueryResult.query.get(result_id)
+            self.assertEqual(result.decoded_data, {'columns': columns, 'rows': [{'a': 1}, {'a': 2}, {'a': 3}]})
+
     def test_success_scheduled(self):
         """
         Scheduled queries remember their latest results.
@@ -287,6 +287,31 @@ class QueryOutdatedQueriesTest(BaseTestCase):
         queries = models.Query.outdated_queries()
         self.assertIn(query, queries)
 
+    def test_stores_next_run_at_of_queries_that_are_not_due(self):
+        half_an_hour_ago = utcnow() - datetime.timedelta(minutes=30)
+        query = self.factory.create_query(schedule={'interval':'3600', 'time': None, 'until':None, 'day_of_week':None})
+        query_result = self.factory.create_query_result(query=query.query_text, retrieved_at=half_an_hour_ago)
+        query.latest_query_data = query_result
+
+        self.assertNotIn(query, models.Query.outdated_queries())
+        self.assertEqual(half_an_hour_ago + datetime.timedelta(hours=1), query.next_run_at)
+
+        query_result.retrieved_at = utcnow() - datetime.timedelta(hours=2)
+        self.assertIn(query, models.Query.outdated_queries())
+
+    def test_schedule_changes_reset_next_run_at(self):
+        query = self.factory.create_query(schedule={'interval':'3600', 'time': None, 'until':None, 'day_of_week':None})
+        self.assertNotIn(query, models.Query.outdated_queries())
+        self.assertIsNone(query.next_run_at)
+
+        query.latest_query_data = self.factory.create_query_result(
+            query=query.query_text, retrieved_at=utcnow() - datetime.timedelta(hours=2))
+        self.assertIsNotNone(query.next_run_at)
+        self.assertIn(query, models.Query.outdated_queries())
+
+        query.schedule = None
+        self.assertIsNone(query.next_run_at)
+
 
 class QueryArchiveTest(BaseTestCase):
     def test_archive_query_sets_flag(self):
@@ -488,6 +513,23 @@ class TestQueryResultStoreResult(BaseTestCase):
         self.assertEqual(query2.latest_query_data, query_result)
         self.assertNotEqual(query3.latest_query_data, query_result)
 
+    def test_returns_updated_query_ids_without_changing_their_version(self):
+        query1 = self.factory.create_query(query_text=self.query)
+        query2 = self.factory.create_query(query_text=self.query,
+                                           schedule={'interval': '60', 'until': None, 'time': None, 'day_of_week': None})
+        version = query1.version
+        models.Query.query.filter(models.Query.id == query2.id).update({'next_run_at': None})
+
+        query_result, query_ids = models.QueryResult.store_result(
+            self.data_source.org_id, self.data_source, self.query_hash,
+            self.query, self.data, self.runtime, self.utcnow)
+
+        self.assertItemsEqual([query1.id, query2.id], query_ids)
+        self.assertEqual(version, query1.version)
+        self.assertEqual(query_result.id, query1.latest_query_data_id)
+        self.assertIsNone(query1.next_run_at)
+        self.assertIsNotNone(query2.next_run_at)
+
 
 class TestEvents(BaseTestCase):
     def raw_event(self):